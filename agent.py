@@ -1,13 +1,11 @@
 from __future__ import division  # force python 3 division in python 2
-import logging
 
-from guessing_game_exceptions import NO_DIFFERENCE_FOR_CATEGORY, ERROR
+from guessing_game_exceptions import NO_DIFFERENCE_FOR_CATEGORY, ERROR, Outcome, GAME_OUTCOMES
 from language import Language
 from random import sample
-from collections import deque
-from guessing_game_exceptions import NO_WORD_FOR_CATEGORY
+from success_window import SuccessWindow, WindowTotals, as_success_window
+from slotted import Slotted, slot_state
 import stimulus
-from itertools import izip
 from numpy import ndarray, asarray
 
 
@@ -15,15 +13,54 @@ class Population:
 
     def __init__(self, params):
         self.population_size = params['population_size']
-        self.agents = [Agent(agent_id, Language(params), deque([0]), deque([0]), deque([0])) for agent_id in range(self.population_size)]
-        self.ds = []
-        self.cs1 = []
-        self.cs2 = []
-        self.cs12 = []
+        window = params['success_window']
+        self.agents = [Agent(agent_id, Language(params), SuccessWindow(window), SuccessWindow(window), SuccessWindow(window))
+                       for agent_id in range(self.population_size)]
+        # metrics of the current step, their history is streamed to the run metrics file (see metrics.py)
+        self.outcome_counts = [0] * len(GAME_OUTCOMES)
+        self.ds = 0.0
+        self.cs1 = 0.0
+        self.cs2 = 0.0
+        self.cs12 = 0.0
+        self.lexicon_size = 0.0
+        self.track_success()
+
+    def track_success(self):
+        """Attaches the success windows of the agents to population wide totals (see success_window.WindowTotals),
+        needed again whenever agents or their windows are replaced."""
+        self.ds_totals = WindowTotals([agent.language.ds_scores for agent in self.agents])
+        self.cs1_totals = WindowTotals([agent.cs1_scores for agent in self.agents])
+        self.cs2_totals = WindowTotals([agent.cs2_scores for agent in self.agents])
+        self.cs12_totals = WindowTotals([agent.cs12_scores for agent in self.agents])
+
+    def __getstate__(self):
+        # the totals are rebuilt from the windows on load, histories of old snapshots are not carried on
+        state = self.__dict__.copy()
+        for totals in ['ds_totals', 'cs1_totals', 'cs2_totals', 'cs12_totals', 'history']:
+            state.pop(totals, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # populations pickled before the metrics file kept the history of every success metric in a list and no
+        # lexicon size or outcome counts, they are reduced to the metrics of their last step; the histories are kept
+        # for runs without a metrics file (see metrics.metrics_of_history)
+        histories = dict((metric, getattr(self, metric)) for metric in ['ds', 'cs1', 'cs2', 'cs12']
+                         if isinstance(getattr(self, metric), list))
+        if histories:
+            self.history = histories
+        for metric, history in histories.items():
+            setattr(self, metric, history[-1] if history else 0.0)
+        if 'outcome_counts' not in state:
+            self.outcome_counts = [0] * len(GAME_OUTCOMES)
+        if 'lexicon_size' not in state:
+            self.lexicon_size = self.mean_lexicon_size()
+        self.track_success()
 
     def select_pairs_per_round(self, games_per_round):
+        # (speaker, hearer) pairs of agents, roles are the speaker_*/hearer_* methods of Agent
         agents_per_game = sample(self.agents, games_per_round * 2)
-        return [(Speaker(a1), Hearer(a2)) for a1, a2 in zip(agents_per_game[::2], agents_per_game[1::2])]
+        return list(zip(agents_per_game[::2], agents_per_game[1::2]))
 
     def __iter__(self):
         return iter(self.agents)
@@ -32,10 +69,14 @@ class Population:
         return len(self.agents)
 
     def update_metrics(self):
-        self.ds.append(sum(map(lambda agent: agent.get_discriminative_success() * 100.0, self.agents)) / len(self.agents))
-        self.cs1.append(sum(map(lambda agent: agent.get_communicative_success() * 100.0, self.agents)) / len(self.agents))
-        self.cs2.append(sum(map(lambda agent: agent.get_communicative_success2() * 100.0, self.agents)) / len(self.agents))
-        self.cs12.append(sum(map(lambda agent: agent.get_communicative_success12() * 100.0, self.agents)) / len(self.agents))
+        self.ds = self.ds_totals.mean_success()
+        self.cs1 = self.cs1_totals.mean_success()
+        self.cs2 = self.cs2_totals.mean_success()
+        self.cs12 = self.cs12_totals.mean_success()
+        self.lexicon_size = self.mean_lexicon_size()
+
+    def mean_lexicon_size(self):
+        return sum(map(lambda agent: len(agent.get_lexicon()), self.agents)) / len(self.agents)
 
     #def update_ds(self):
     #    self.ds.append(sum((map(lambda agent: agent.get_discriminative_success() * 100, self.agents))) / len(self.agents))
@@ -58,7 +99,8 @@ class Population:
         return arr
 
 
-class Agent:
+class Agent(Slotted):
+    __slots__ = ('id', 'language', 'cs1_scores', 'cs2_scores', 'cs12_scores')
 
     def __init__(self, id, language, cs1_scores, cs2_scores, cs12_scores):
         self.id = id
@@ -67,22 +109,22 @@ class Agent:
         self.cs2_scores = cs2_scores
         self.cs12_scores = cs12_scores
 
+    def __setstate__(self, state):
+        state = slot_state(state)
+        # agents pickled before success windows kept deques of results
+        for scores in ['cs1_scores', 'cs2_scores', 'cs12_scores']:
+            state[scores] = as_success_window(state[scores])
+        Slotted.__setstate__(self, state)
+
     def store_cs1_result(self, result):
-        self.__store_result__(result, self.cs1_scores)
+        self.cs1_scores.store(result)
 
     def store_cs12_result(self, result):
-        self.__store_result__(result, self.cs12_scores)
+        self.cs12_scores.store(result)
 
     def store_cs2_result(self, result):
         if result is not None:
-            self.__store_result__(result, self.cs2_scores)
-
-    def __store_result__(self, result, history):
-        if len(history) == 50:
-            history.rotate(-1)
-            history[-1] = result
-        else:
-            history.append(result)
+            self.cs2_scores.store(result)
 
     def learn_word_category(self, word, category_index):
         self.language.initialize_word2category_connection(word, category_index)
@@ -90,17 +132,20 @@ class Agent:
     def discrimination_game(self, context, topic):
         return self.language.discrimination_game(context, topic)
 
+    def discrimination_game_outcome(self, context, topic):
+        return self.language.discrimination_game_outcome(context, topic)
+
     def get_discriminative_success(self):
         return self.language.discriminative_success
 
     def get_communicative_success(self):
-        return sum(self.cs1_scores) / len(self.cs1_scores)
+        return self.cs1_scores.mean()
 
     def get_communicative_success2(self):
-        return sum(self.cs2_scores) / len(self.cs2_scores)
+        return self.cs2_scores.mean()
 
     def get_communicative_success12(self):
-        return sum(self.cs12_scores) / len(self.cs12_scores)
+        return self.cs12_scores.mean()
 
     def get_best_matching_words(self, stimuluses):
         words = [self.get_best_matching_word(s) for s in stimuluses]
@@ -111,11 +156,8 @@ class Agent:
         if category is None:
             return "?"
         else:
-            try:
-                word = self.get_most_connected_word(category)
-            except NO_WORD_FOR_CATEGORY:
-                return "?"
-            return word
+            outcome, word = self.most_connected_word_outcome(category)
+            return word if outcome == Outcome.OK else "?"
 
     def pragmatic_meaning(self, word, stimuli):
         best_matching_words = self.get_best_matching_words(stimuli)
@@ -125,8 +167,8 @@ class Agent:
             window = occurrences[max(0, i - 5):min(len(occurrences), i + 5)]
             mean_occurrences.append(int(sum(window) / len(window) > 0.5))
         return occurrences if self.language.stm == 'numeric' else mean_occurrences
-        #alt = len([v for v, v_next in izip(occurrences, occurrences[1:]) if v != v_next])
-        #alt_mean = len([v for v, v_next in izip(mean_occurrences, mean_occurrences[1:]) if v != v_next])
+        #alt = len([v for v, v_next in zip(occurrences, occurrences[1:]) if v != v_next])
+        #alt_mean = len([v for v, v_next in zip(mean_occurrences, mean_occurrences[1:]) if v != v_next])
 
     def semantic_meaning(self, stimuli):
         return self.language.semantic_meaning(stimuli)
@@ -149,7 +191,7 @@ class Agent:
 
         def check_convexity(word):
             meaning = self.pragmatic_meaning(word, stimuluses)
-            alt = len([v for v, v_next in izip(meaning, meaning[1:]) if v != v_next])
+            alt = len([v for v, v_next in zip(meaning, meaning[1:]) if v != v_next])
             #logging.critical('Agent %d %s meaning (%d) = %s' % (self.id, word, alt <= 2, meaning))
             return alt <= 2
 
@@ -168,6 +210,12 @@ class Agent:
     def get_most_connected_category(self, word):
         return self.language.get_most_connected_category(word)
 
+    def most_connected_word_outcome(self, category):
+        return self.language.most_connected_word_outcome(category)
+
+    def most_connected_category_outcome(self, word):
+        return self.language.most_connected_category_outcome(word)
+
     def get_categories(self):
         return self.language.categories
 
@@ -184,52 +232,36 @@ class Agent:
         return self.language.get_words_by_category(category)
 
     def learn_stimulus(self, context, n):
-        logging.debug("with discriminative success %f learns stimulus %d by " % (self.language.discriminative_success, n + 1))
         #logging.debug("category is not None: %d" % int(category is not None))
         #logging.debug("above threshold: %d" % int(self.language.discriminative_success >= self.language.discriminative_threshold))
         if self.language.discriminative_success >= self.language.discriminative_threshold:
             category = self.get_best_matching_category(context[n])
-            logging.debug("updating category")
             self.language.update_category(category, context[n])
             #return category
         else:
-            logging.debug("adding new category centered on %s" % context[n])
             self.language.add_category(context[n])
 
     def update_on_failure(self, word, category):
         self.language.decrement_word2category_connection(word, category)
 
 
-class Speaker(Agent):
-
-    def __init__(self, agent):
-        Agent.__init__(self, agent.id, agent.language,
-                       agent.cs1_scores, agent.cs2_scores, agent.cs12_scores)
-
-    def update_on_success(self, word, category):
+    # SPEAKER
+    def speaker_update_on_success(self, word, category):
         self.language.increment_word2category_connection(word=word, category_index=category)
         self.language.inhibit_word2categories_connections(word=word, category_index=category)
 
-    def update_on_success2c(self, word, category):
-        logging.debug("Incrementing connections for %s, agent %d" % (word, self.id))
+    def speaker_update_on_success2c(self, word, category):
         csimilarities = [self.language.csimilarity(word, c) for c in self.language.categories]
-        logging.debug("Speaker successful category %d, its similarity %f to %s meaning" % (category, csimilarities[category], word))
-        logging.debug("Similarities: %s" % str(csimilarities))
         self.language.increment_word2category_connections_by_csimilarity(word, csimilarities)
         self.language.inhibit_word2categories_connections(word=word, category_index=category)
 
-    def update_on_success_stage7(self, word, category):
+    def speaker_update_on_success_stage7(self, word, category):
         self.language.increment_word2category_connection(word=word, category_index=category)
 
     def add_new_word(self):
         return self.language.add_new_word()
 
-
-class Hearer(Agent):
-    def __init__(self, agent):
-        Agent.__init__(self, agent.id, agent.language,
-                       agent.cs1_scores, agent.cs2_scores, agent.cs12_scores)
-
+    # HEARER
     def get_topic(self, context, category):
         if category is None:
             raise ERROR
@@ -259,22 +291,18 @@ class Hearer(Agent):
         categories1 = list(
             filter(lambda cat2propensity: cat2propensity[1] > threshold, self.language.get_categories_sorted_by_val(word1)))
 
-        logging.debug("Two words sorted by cardinality: %s, %s" % (word0, word1) if len(categories0) > len(categories1) else (word1, word0))
         return (word0, categories0) if len(categories0) > len(categories1) else (word1, categories1)
 
-    def update_on_success(self, speaker_word, hearer_category):
+    def hearer_update_on_success(self, speaker_word, hearer_category):
         self.language.increment_word2category_connection(word=speaker_word, category_index=hearer_category)
         self.language.inhibit_category2words_connections(word=speaker_word, category_index=hearer_category)
 
-    def update_on_success2c(self, word, category):
-        logging.debug("Incrementing connections for %s, agent %d" % (word, self.id))
+    def hearer_update_on_success2c(self, word, category):
         csimilarities = [self.language.csimilarity(word, c) for c in self.language.categories]
-        logging.debug("Hearer successful category %d, its similarity %f to %s meaning" % (self.get_categories()[category].id, csimilarities[category], word))
-        logging.debug("c Similarities: %s" % str(csimilarities))
         self.language.increment_word2category_connections_by_csimilarity(word, csimilarities)
         self.language.inhibit_category2words_connections(word=word, category_index=category)
 
-    def update_on_success_stage7(self, word, word_categories):
+    def hearer_update_on_success_stage7(self, word, word_categories):
         for c_index, _ in word_categories:
             self.language.increment_word2category_connection(word, c_index)
 
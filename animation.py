@@ -0,0 +1,94 @@
+import logging
+import threading
+from collections import deque
+
+from PIL import GifImagePlugin, Image
+
+# default display time of a frame in milliseconds
+FRAME_DURATION = 100
+# default bound of the encoded frames an animation holds while waiting for an earlier frame
+FRAME_BUFFER = 32 * 2 ** 20
+
+
+def encode_frame(figure, duration=FRAME_DURATION):
+    """Draws the (agg) figure and encodes its raster as a gif frame with its own color table, returns the bytes of
+    (the header of an animation starting with the frame, the frame)."""
+    canvas = figure.canvas
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    image = Image.frombuffer('RGBA', (width, height), bytes(canvas.buffer_rgba()), 'raw', 'RGBA', 0, 1)
+    image = image.convert('RGB').quantize(256)
+    # getheader normalizes the palette of the image, getdata has to encode the normalized one
+    header, _ = GifImagePlugin.getheader(image, None, {'loop': 0, 'duration': duration})
+    data = GifImagePlugin.getdata(image, duration=duration, include_color_table=True)
+    return b''.join(header), b''.join(data)
+
+
+class GifStream:
+    """Animated gif written frame by frame, so that no frame is kept once it is written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.frames = 0
+
+    def write(self, frame):
+        header, data = frame
+        if self.handle is None:
+            self.handle = open(str(self.path), 'wb')
+            self.handle.write(header)
+        self.handle.write(data)
+        self.frames += 1
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.write(b';')
+            self.handle.close()
+            self.handle = None
+
+
+class FrameSequence:
+    """Writes frames into a stream in the order their steps were expected, whatever the order they are put in (i.e.
+    by workers). Frames put ahead of an earlier one are held; once they take more than memory_budget bytes the
+    missing frames (of failed tasks) are given up."""
+
+    def __init__(self, stream, memory_budget=FRAME_BUFFER):
+        self.stream = stream
+        self.memory_budget = memory_budget
+        self.expected = deque()
+        self.held = {}
+        self.held_bytes = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def expect(self, step):
+        with self.lock:
+            self.expected.append(step)
+
+    def put(self, step, frame):
+        with self.lock:
+            self.held[step] = frame
+            self.held_bytes += sum(len(part) for part in frame)
+            self.write_ready()
+            while self.held_bytes > self.memory_budget and self.expected:
+                self.skip()
+                self.write_ready()
+
+    def write_ready(self):
+        while self.expected and self.expected[0] in self.held:
+            frame = self.held.pop(self.expected.popleft())
+            self.held_bytes -= sum(len(part) for part in frame)
+            self.stream.write(frame)
+
+    def skip(self):
+        logging.warning("frame of step {} missing in {}, skipped".format(self.expected.popleft(), self.stream.path))
+        self.skipped += 1
+
+    def close(self):
+        with self.lock:
+            while self.expected:
+                if self.expected[0] in self.held:
+                    self.write_ready()
+                else:
+                    self.skip()
+            self.stream.close()
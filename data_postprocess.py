@@ -4,7 +4,16 @@ from pathlib import Path
 
 from inmemory_calculus import load_inmemory_calculus, inmem
 import stimulus
+from metrics import read_metrics, metrics_of_history, carry_forward
 from path_provider import PathProvider
+from run_archive import open_run_snapshots
+from animation import encode_frame, GifStream, FrameSequence, FRAME_DURATION, FRAME_BUFFER
+from frame_renderer import FigurePool, CurvePool, LabelPool, TextPool, write_frame, ANNOTATION_CELLS
+from derived_metrics import open_metrics_cache, CachedStepSamples, CachedMetricFeed, percent_mean, mean_value
+from meanings_export import MeaningsExport
+from snapshot_prefetcher import READ_AHEAD, MEMORY_BUDGET
+from snapshot_scanner import ScanPlan, run_number
+from task_pool import TaskPool
 from stats import confidence_intervals, means
 
 matplotlib.use('Agg')
@@ -13,45 +22,42 @@ import argparse
 import logging
 import pickle
 import sys
+import threading
 import time
 
-from multiprocessing import Process
 import matplotlib.pyplot as plt
-from matplotlib.ticker import ScalarFormatter
+from matplotlib.ticker import ScalarFormatter, FixedFormatter
 import seaborn as sns
 from numpy import linspace, column_stack, arange, log, amax, zeros, ndarray, asarray
-import h5py
+from scipy.sparse import coo_matrix
 
 class PlotCategoryCommand:
     def __init__(self, categories_path, inmem):
         self.categories_path = categories_path
         self.inmem = inmem
 
-    def __call__(self, agent_index, agent_tuple, step):
+    def curves(self, agent_index, agent_tuple, step):
+        """(title, curves as (y, color, linestyle), legend as (label, color, linestyle)) of the frame."""
         agent = agent_tuple[0]
-        plt.title("categories")
-        ax = plt.gca()
-        #plt.xscale("symlog")
-        ax.xaxis.set_major_formatter(ScalarFormatter())
-        plt.yscale("symlog")
-        ax.yaxis.set_major_formatter(ScalarFormatter())
-
         cats = agent.get_categories()
         linestyles = new_linestyles(cats)
-
+        curves = []
+        labels = []
         for cat in cats:
             color, linestyle = linestyles[cat]
+            curves.append((cat.discretized_distribution(self.inmem["REACTIVE_UNIT_DIST"]), color, linestyle))
+            labels.append(("%d" % (cat.id), color, linestyle))
+        return "categories", curves, labels
 
-            plt.plot(self.inmem["DOMAIN"], cat.discretized_distribution(self.inmem["REACTIVE_UNIT_DIST"]),
-                     color=color,
-                     linestyle=linestyle,
-                     label="%d" % (cat.id))
+    def frame_path(self, agent_index, step):
+        return self.categories_path.joinpath('categories{}_{}.png'.format(agent_index, step))
 
-        plt.legend(loc='upper left', prop={'size': 6}, bbox_to_anchor=(1, 1))
-        plt.tight_layout(pad=0)
-        new_path = self.categories_path.joinpath('categories{}_{}.png'.format(agent_index, step))
-        plt.savefig(str(new_path))
-        plt.close()
+    def animation_path(self, agent_index):
+        return self.categories_path.joinpath('categories{}.gif'.format(agent_index))
+
+    def __call__(self, agent_index, agent_tuple, step):
+        plot_curves(self.inmem["DOMAIN"], self.curves(agent_index, agent_tuple, step),
+                    self.frame_path(agent_index, step))
 
 
 def new_linestyles(seq):
@@ -59,12 +65,30 @@ def new_linestyles(seq):
     return dict(zip(seq, linestyles))
 
 
+def plot_curves(domain, frame, path):
+    title, curves, labels = frame
+    plt.title(title)
+    # plt.xscale("symlog")
+    plt.yscale("symlog")
+    ax = plt.gca()
+    ax.xaxis.set_major_formatter(ScalarFormatter())
+    ax.yaxis.set_major_formatter(ScalarFormatter())
+    for y, color, linestyle in curves:
+        plt.plot(domain, y, color=color, linestyle=linestyle)
+    for label, color, linestyle in labels:
+        plt.plot([], [], color=color, linestyle=linestyle, label=label)
+    plt.legend(loc='upper left', prop={'size': 6}, bbox_to_anchor=(1, 1))
+    plt.tight_layout(pad=0)
+    plt.savefig(str(path))
+    plt.close()
+
+
 class PlotLanguageCommand:
     def __init__(self, lang_path, inmem):
         self.lang_path = lang_path
         self.inmem = inmem
 
-    def __call__(self, agent_index, agent_tuple, step):
+    def curves(self, agent_index, agent_tuple, step):
         agent = agent_tuple[0]
         categories = agent.get_categories()
         forms_to_categories = dict()
@@ -80,25 +104,25 @@ class PlotLanguageCommand:
                 category_connected = categories[category_index]
                 forms_to_categories[word].append(category_connected)
 
-        plt.title("language in step {} of agent {}".format(step, agent_index))
-        # plt.xscale("symlog")
-        plt.yscale("symlog")
-        ax = plt.gca()
-        ax.xaxis.set_major_formatter(ScalarFormatter())
-        ax.yaxis.set_major_formatter(ScalarFormatter())
-
         word2linestyles = new_linestyles(agent.get_lexicon())
+        curves = []
+        labels = []
         for form, categories in forms_to_categories.items():
             color, line = word2linestyles[form]
             for category in categories:
-                plt.plot(self.inmem["DOMAIN"], category.discretized_distribution(self.inmem["REACTIVE_UNIT_DIST"]), color=color, linestyle=line)
-            plt.plot([], [], color=color, linestyle=line, label=form)
+                curves.append((category.discretized_distribution(self.inmem["REACTIVE_UNIT_DIST"]), color, line))
+            labels.append((form, color, line))
+        return "language in step {} of agent {}".format(step, agent_index), curves, labels
 
-        plt.legend(loc='upper left', prop={'size': 6}, bbox_to_anchor=(1, 1))
-        plt.tight_layout(pad=0)
-        new_path = self.lang_path.joinpath('language{}_{}.png'.format(agent_index, step))
-        plt.savefig(str(new_path))
-        plt.close()
+    def frame_path(self, agent_index, step):
+        return self.lang_path.joinpath('language{}_{}.png'.format(agent_index, step))
+
+    def animation_path(self, agent_index):
+        return self.lang_path.joinpath('language{}.gif'.format(agent_index))
+
+    def __call__(self, agent_index, agent_tuple, step):
+        plot_curves(self.inmem["DOMAIN"], self.curves(agent_index, agent_tuple, step),
+                    self.frame_path(agent_index, step))
 
 
 class PlotLanguage2Command:
@@ -106,34 +130,29 @@ class PlotLanguage2Command:
         self.lang2_path = lang2_path
         self.inmem = inmem
 
-    def __call__(self, agent_index, agent_tuple, step):
+    def curves(self, agent_index, agent_tuple, step):
         agent = agent_tuple[0]
         lexicon = agent.get_lexicon()
-
-        lang = []
-
+        word2linestyles = new_linestyles(lexicon)
+        curves = []
+        labels = []
         for word in lexicon:
             category2sth = zip(agent.get_categories(), agent.get_categories_by_word(word))
             fy = sum([cat.union(self.inmem['REACTIVE_UNIT_DIST']) * wei for cat, wei in category2sth])
-            lang.append([word, fy])
+            color, linestyle = word2linestyles[word]
+            curves.append((fy, color, linestyle))
+            labels.append((word, color, linestyle))
+        return "language2 in step {} of agent {}".format(step, agent_index), curves, labels
 
-        plt.title("language2 in step {} of agent {}".format(step, agent_index))
-        # plt.xscale("symlog")
-        plt.yscale("symlog")
-        ax = plt.gca()
-        ax.xaxis.set_major_formatter(ScalarFormatter())
-        ax.yaxis.set_major_formatter(ScalarFormatter())
-        word2linestyles = new_linestyles(lexicon)
-        for form, y in lang:
-            color, linestyle = word2linestyles[form]
-            plt.plot(self.inmem['DOMAIN'], y, color=color, linestyle=linestyle)
-            plt.plot([], [], color=color, linestyle=linestyle, label=form)
-        plt.legend(loc='upper left', prop={'size': 6}, bbox_to_anchor=(1, 1))
-        plt.tight_layout(pad=0)
-        new_path = self.lang2_path.joinpath('language{}_{}.png'.format(agent_index, step))
-        plt.savefig(str(new_path))
-        # if not self.pickle_mode else self.step - self.pickle_step + step + 1))
-        plt.close()
+    def frame_path(self, agent_index, step):
+        return self.lang2_path.joinpath('language{}_{}.png'.format(agent_index, step))
+
+    def animation_path(self, agent_index):
+        return self.lang2_path.joinpath('language{}.gif'.format(agent_index))
+
+    def __call__(self, agent_index, agent_tuple, step):
+        plot_curves(self.inmem['DOMAIN'], self.curves(agent_index, agent_tuple, step),
+                    self.frame_path(agent_index, step))
 
 
 class PlotMatrixCommand:
@@ -141,7 +160,9 @@ class PlotMatrixCommand:
     def __init__(self, matrices_path):
         self.matrices_path = matrices_path
 
-    def __call__(self, agent_index, agent_tuple, step):
+    def matrix(self, agent_tuple):
+        """(matrix of the agent padded to the shape of its last matrix with the scale column, x tick labels,
+        y tick labels, number of forms, number of categories)"""
         agent = agent_tuple[0]
         agent_last = agent_tuple[1]
         matrix = agent.language.lxc.to_array()
@@ -149,40 +170,45 @@ class PlotMatrixCommand:
         lang = list(agent.get_lexicon())
         cats = [c.id for c in agent.language.categories]
 
-        # self._shape_[i] = (max(self._shape_[i][0], lxc.shape[0]), max(self._shape_[i][1], lxc.shape[1]))
-        # self.matrices[i].append((list(lex), array(lxc), cats))
-        # matrix = (list(lex), array(lxc), cats)
-        # if not matrix.size:
-        #     return
-
         n_rows = max_shape[0]
         n_cols = max_shape[1]
         n_categories = matrix.shape[1]
         n_forms = len(lang)
-        # lxc = self.languages[l][m][1].resize((n_rows, n_cols), refcheck=False)
         lxc = zeros(max_shape)
         lxc[0:n_forms, 0:n_categories] = matrix
-        fig, ax = plt.subplots()
         lxc_ex = column_stack((lxc, linspace(amax(lxc), 0, n_rows)))
+        x_tick_labels = [str(cid + 1) for cid in cats]
+        for _ in range(n_categories, n_cols):
+            x_tick_labels.append('-')
+        x_tick_labels.append("s")
+        y_tick_labels = list(lang)
+        for _ in range(len(lang), n_rows):
+            y_tick_labels.append('-')
+        return lxc_ex, x_tick_labels, y_tick_labels, n_forms, n_categories
+
+    def frame_path(self, agent_index, step):
+        return self.matrices_path.joinpath('matrix{}_{}.png'.format(agent_index, step))
+
+    def animation_path(self, agent_index):
+        return self.matrices_path.joinpath('matrix{}.gif'.format(agent_index))
+
+    def __call__(self, agent_index, agent_tuple, step):
+        lxc_ex, x_tick_labels, y_tick_labels, n_forms, n_categories = self.matrix(agent_tuple)
+        n_rows = lxc_ex.shape[0]
+        n_cols = lxc_ex.shape[1] - 1
+        fig, ax = plt.subplots()
         lxc_ex_log = log(lxc_ex + 1.)
         im = ax.imshow(lxc_ex_log, aspect='auto')
-        lexicon = lang
         # We want to show all ticks...
         ax.set_xticks(arange(n_cols + 1))
         ax.set_yticks(arange(n_rows))
         # ... and label them with the respective list entries
-        x_tick_labels = [str(cid + 1) for cid in cats]
-        for _ in range(n_categories, n_cols):
-            x_tick_labels.append('-')
-        x_tick_labels.append("s")
         ax.set_xticklabels(x_tick_labels, fontdict={'fontsize': 8})
-        for _ in range(len(lexicon), n_rows):
-            x_tick_labels.append('-')
-        ax.set_yticklabels(lexicon, fontdict={'fontsize': 8})
+        ax.set_yticklabels(y_tick_labels, fontdict={'fontsize': 8})
         # Rotate the tick labels and set their alignment.
         plt.setp(ax.get_xticklabels(), rotation=45, ha="right",
                  rotation_mode="anchor")
-        for i in range(len(lexicon)):
+        for i in range(n_forms):
             for j in range(n_categories):
                 if lxc_ex[i, j] > 0.0:
                     text = ax.text(j, i, round(lxc_ex[i, j], 2), ha="center", va="center", color="r")
@@ -191,63 +217,200 @@ class PlotMatrixCommand:
 
         ax.set_title("Association matrix")
         fig.tight_layout()
-        new_path = self.matrices_path.joinpath('matrix{}_{}.png'.format(agent_index, step))
-        plt.savefig(str(new_path))
+        plt.savefig(str(self.frame_path(agent_index, step)))
         plt.close()
 
 
-class CommandExecutor:
-    def __init__(self):
-        self.commands = []
+class FastCurvesCommand:
+    """Renders the frames of a curves command (PlotCategoryCommand, PlotLanguageCommand, PlotLanguage2Command) into
+    a figure kept per agent, updating its lines, title and legend labels instead of plotting a new figure per
+    frame."""
+
+    def __init__(self, command, inmem):
+        self.command = command
+        self.inmem = inmem
+        self.figures = FigurePool()
 
-    def add_command(self, command):
-        self.commands.append(command)
+    @staticmethod
+    def new_frame(figure):
+        ax = figure.add_axes([0.1, 0.08, 0.7, 0.84])
+        ax.set_yscale("symlog")
+        ax.xaxis.set_major_formatter(ScalarFormatter())
+        ax.yaxis.set_major_formatter(ScalarFormatter())
+        return ax.set_title(''), CurvePool(ax), LabelPool(figure, 0.82, 0.92)
 
-    def execute_commands_in_parallel(self, data_paths, last_population, parallelism=0):
-        def chunks(list, chunk_size):
-            for i in range(0, len(list), chunk_size):
-                yield list[i:i + chunk_size]
+    def render(self, agent_index, agent_tuple, step):
+        title, curves, labels = self.command.curves(agent_index, agent_tuple, step)
+        figure, (title_text, curve_pool, label_pool) = self.figures.get(agent_index, self.new_frame)
+        title_text.set_text(title)
+        curve_pool.update(self.inmem["DOMAIN"], curves)
+        label_pool.update(labels)
+        return figure
 
-        def new_chunked_task(execute_commands, chunk, last_population):
-            return Task(execute_commands, chunk=chunk, last_population=last_population)
+    def __call__(self, agent_index, agent_tuple, step):
+        write_frame(self.render(agent_index, agent_tuple, step), self.command.frame_path(agent_index, step))
 
-        # for 0 parallelism is unbounded, we require that len(population) * chunk_size == 200
-        if parallelism == 0:
-            chunk_size = max(200 / len(last_population), 1)
-        else:
-            chunk_size = max(len(data_paths) / parallelism, 1)
 
-        tasks = []
-        for data_path_chunk in chunks(data_paths, chunk_size):
-            tasks.append(new_chunked_task(self.execute_commands, data_path_chunk, last_population))
-            tasks[-1].start()
+class FastMatrixCommand:
+    """Renders the frames of a PlotMatrixCommand into a figure kept per agent, updating the image data and the tick
+    labels. Matrices of more than annotation_cells cells (forms x categories) are not annotated with their values."""
+
+    def __init__(self, command, annotation_cells=ANNOTATION_CELLS):
+        self.command = command
+        self.annotation_cells = annotation_cells
+        self.figures = FigurePool()
+
+    @staticmethod
+    def new_frame(figure, shape):
+        n_rows, n_cols = shape
+        ax = figure.add_axes([0.15, 0.12, 0.82, 0.8])
+        im = ax.imshow(zeros(shape), aspect='auto')
+        ax.set_xticks(arange(n_cols))
+        ax.set_yticks(arange(n_rows))
+        x_tick_labels = FixedFormatter([''] * n_cols)
+        y_tick_labels = FixedFormatter([''] * n_rows)
+        ax.xaxis.set_major_formatter(x_tick_labels)
+        ax.yaxis.set_major_formatter(y_tick_labels)
+        ax.tick_params(labelsize=8)
+        for label in ax.get_xticklabels():
+            label.set(rotation=45, ha="right", rotation_mode="anchor")
+        ax.set_title("Association matrix")
+        return im, x_tick_labels, y_tick_labels, TextPool(ax, ha="center", va="center", color="r")
+
+    def render(self, agent_index, agent_tuple, step):
+        lxc_ex, x_tick_labels, y_tick_labels, n_forms, n_categories = self.command.matrix(agent_tuple)
+        figure, (im, x_formatter, y_formatter, annotations) = self.figures.get(agent_index, self.new_frame,
+                                                                               lxc_ex.shape)
+        lxc_ex_log = log(lxc_ex + 1.)
+        im.set_data(lxc_ex_log)
+        im.set_clim(lxc_ex_log.min(), lxc_ex_log.max())
+        x_formatter.seq = x_tick_labels
+        y_formatter.seq = y_tick_labels
+        cells = []
+        if n_forms * n_categories <= self.annotation_cells:
+            cells = [(j, i, round(lxc_ex[i, j], 2)) for i in range(n_forms) for j in range(n_categories)
+                     if lxc_ex[i, j] > 0.0]
+        annotations.update(cells)
+        return figure
+
+    def __call__(self, agent_index, agent_tuple, step):
+        write_frame(self.render(agent_index, agent_tuple, step), self.command.frame_path(agent_index, step))
+
 
-        for task in tasks:
-            task.join()
+class AnimationCommand:
+    """Renders the frames of a fast command (FastCurvesCommand, FastMatrixCommand) as gif frames returned to the
+    CommandExecutor, which streams them into an animated gif per agent (see animation.py) instead of png files."""
 
-    def execute_commands(self, data_paths, last_population):
-        def execute_commands_per_agent(self, agent_index, agent_tuple, step):
-            for command_exec in self.commands:
-                if agent_tuple[0].language.lxc.size():
-                    command_exec(agent_index, agent_tuple, step)
+    def __init__(self, renderer, duration=FRAME_DURATION):
+        self.renderer = renderer
+        self.duration = duration
 
-        for path in data_paths:
-            step, population = pickle.load(path.open('rb'))
-            for agent_index, agent_tuple in enumerate(zip(population, last_population)):
-                # assert that zip between agent at current and last step is valid
-                assert agent_tuple[0].id == agent_tuple[1].id
-                execute_commands_per_agent(self, agent_index, agent_tuple, step)
+    def animation_path(self, agent_index):
+        return self.renderer.command.animation_path(agent_index)
+
+    def __call__(self, agent_index, agent_tuple, step):
+        return encode_frame(self.renderer.render(agent_index, agent_tuple, step), self.duration)
 
 
-class Task(Process):
-    def __init__(self, execute_commands, chunk, last_population):
-        super(Task, self).__init__()
-        self.chunk = chunk
-        self.last_population = last_population
-        self.execute_commands = execute_commands
+# commands and last populations of the runs, installed once in every worker of a CommandExecutor pool
+worker_state = {}
 
-    def run(self):
-        self.execute_commands(self.chunk, self.last_population)
+
+def init_command_worker(calculus, commands, last_populations):
+    inmem.update(calculus)
+    worker_state['commands'] = commands
+    worker_state['last_populations'] = last_populations
+
+
+def execute_agent_commands(commands, agent_index, agent_tuple, step):
+    # frames of animation commands, None for commands writing their files
+    return [command_exec(agent_index, agent_tuple, step) for command_exec in commands]
+
+
+def execute_agent_task(run, step, agent_index, agent):
+    agent_tuple = (agent, worker_state['last_populations'][run].agents[agent_index])
+    return execute_agent_commands(worker_state['commands'][run], agent_index, agent_tuple, step)
+
+
+class CommandExecutor:
+    """Executes per agent commands of runs on every snapshot step as a consumer of a snapshot scan. With parallelism
+    other than 1 every (run, step, agent) is a task of a bounded TaskPool (0 for a worker per cpu), failed tasks are
+    collected in failures. Only every stride-th snapshot step is plotted.
+
+    Frames returned by animation commands (see AnimationCommand) are streamed, in the order of the steps, into an
+    animated gif per (run, command, agent) holding at most frame_buffer bytes of frames which came early."""
+
+    def __init__(self, parallelism=1, stride=1, frame_buffer=FRAME_BUFFER):
+        self.commands = {}
+        self.last_populations = {}
+        # consumes every stride-th snapshot step
+        self.steps = None
+        self.stride = stride
+        self.frame_buffer = frame_buffer
+        self.parallelism = parallelism
+        self.pool = None
+        self.failures = []
+        self.animations = {}
+
+    def add_run(self, run, last_population):
+        """Commands of the run get agents at a step along with the agents at the last step of the run."""
+        self.commands.setdefault(run, [])
+        self.last_populations[run] = last_population
+
+    def add_command(self, run, command):
+        self.commands[run].append(command)
+
+    def task_pool(self):
+        if self.pool is None:
+            # runs are added before the scan starts, workers get all their commands and last populations at once
+            self.pool = TaskPool(self.parallelism, init_command_worker,
+                                 (dict(inmem), self.commands, self.last_populations), name='agent plots')
+        return self.pool
+
+    def consume(self, run, step, population):
+        if run not in self.commands:
+            return
+        for agent_index, agent_tuple in enumerate(zip(population, self.last_populations[run])):
+            # assert that zip between agent at current and last step is valid
+            assert agent_tuple[0].id == agent_tuple[1].id
+            if not agent_tuple[0].language.lxc.size():
+                continue
+            sequences = self.frame_sequences(run, agent_index)
+            for sequence in sequences:
+                if sequence is not None:
+                    sequence.expect(step)
+            if self.parallelism == 1:
+                self.put_frames(sequences, step, execute_agent_commands(self.commands[run], agent_index, agent_tuple,
+                                                                        step))
+            else:
+                self.task_pool().submit(execute_agent_task, (run, step, agent_index, agent_tuple[0]),
+                                        key=(run, step, agent_index),
+                                        callback=lambda frames, sequences=sequences, step=step:
+                                        self.put_frames(sequences, step, frames))
+
+    def frame_sequences(self, run, agent_index):
+        """Frame sequences of the animations of the agent, None for commands which are not animated."""
+        key = (run, agent_index)
+        if key not in self.animations:
+            self.animations[key] = [FrameSequence(GifStream(command.animation_path(agent_index)), self.frame_buffer)
+                                    if isinstance(command, AnimationCommand) else None
+                                    for command in self.commands[run]]
+        return self.animations[key]
+
+    @staticmethod
+    def put_frames(sequences, step, frames):
+        for sequence, frame in zip(sequences, frames):
+            if sequence is not None:
+                sequence.put(step, frame)
+
+    def finalize(self):
+        if self.pool is not None:
+            self.failures = self.pool.close()
+            self.pool = None
+        for sequences in self.animations.values():
+            for sequence in sequences:
+                if sequence is not None:
+                    sequence.close()
 
 
 class MakeHdf5:
@@ -258,23 +421,24 @@ class MakeHdf5:
 
         #logging.critical(self.steps)
         #self.steps = range(3, self.params['steps'])
-        self.steps = [max(step * 10 - 1, 0) for step in range(1 + self.params['steps'] / 10)]
-        #self.hdf_path = self.root_path1.joinpath('stats/meanings.h5')
+        self.steps = [max(step * 10 - 1, 0) for step in range(1 + self.params['steps'] // 10)]
+        self.hdf_path = self.root_path1.joinpath('stats/meanings.h5')
+        self.meanings = MeaningsExport(self.hdf_path, self.steps,
+                                       open_metrics_cache(self.root_path1, self.stimuluses))
 
-    def __call__(self):
-        f = h5py.File("m.h5", "w")
-        for run_num, run_path in enumerate(self.root_path1.glob('run[0-9]*')):
-            hdf_list = []
-            for step in self.steps:
-                logging.debug("Run %d, step %d" % (run_num, step))
-                step, population = pickle.load(run_path.joinpath("data/step" + str(step) + ".p").open('rb'))
-                meanings = population.get_meanings(unpickled_stimuluses)
-                hdf_list.append(meanings)
-            hdf_arr = asarray(hdf_list)
-            f.create_dataset(name='run%d' % run_num, data=hdf_arr)
-        f.close()
+    def register(self, plan):
+        self.hdf_path.parent.mkdir(parents=True, exist_ok=True)
+        plan.add(self.root_path1, self.meanings)
+        plan.add_command(self)
+
+    def finalize(self):
         logging.debug("FINISHED")
 
+    def __call__(self):
+        plan = ScanPlan()
+        self.register(plan)
+        plan.run()
+
 
 class PlotConvexityCommand:
 
@@ -287,8 +451,13 @@ class PlotConvexityCommand:
         self.stimuluses = stimuluses
         self.params = params
 
-        self.steps = [max(step*10-1, 0) for step in range(1 + self.params['steps']/10)]
+        self.steps = [max(step*10-1, 0) for step in range(1 + self.params['steps']//10)]
         logging.critical(self.steps)
+        self.samples1 = CachedStepSamples(self.steps, open_metrics_cache(self.root_path1, stimuluses), 'convexity',
+                                          percent_mean)
+        if self.root_path2 is not None:
+            self.samples2 = CachedStepSamples(self.steps, open_metrics_cache(self.root_path2, stimuluses), 'convexity',
+                                              percent_mean)
         #self.steps = range(0, self.params['steps'])
         self.conv_plot_path = self.root_path1.joinpath('stats/convexity.pdf')
         #self.array1 = zeros((self.params['runs'], self.steps))
@@ -302,37 +471,11 @@ class PlotConvexityCommand:
         self.conv_cis2_l = []
         self.conv_cis2_u = []
 
-    def get_data(self):
-        #logging.debug("Root path %s" % self.root_path1)
-        for step in self.steps:
-            logging.debug("Processing step %d" % step)
-            sample = []
-            for run_num, run_path in enumerate(self.root_path1.glob('run[0-9]*')):
-                #logging.debug("Processing %s, %s" % (run_num, run_path))
-                #logging.debug("Processing %s" % "step" + str(step) + ".p")
-                step, population = pickle.load(run_path.joinpath("data/step" + str(step) + ".p").open('rb'))
-                sample.append(population.get_convexity(self.stimuluses))
-                #logging.debug("mon val %f" % sample[-1])
-            self.conv_samples1.append(sample)
-        #for step in range(self.params['steps']):
-        #    self.mon_samples1.append(list(self.array1[:, max(step*100-1, 0)]))
-
+    def register(self, plan):
+        plan.add(self.root_path1, self.samples1)
         if self.root_path2 is not None:
-            logging.debug("Root path %s" % self.root_path2)
-            for step in self.steps:
-                logging.debug("Processing step %d" % step)
-                sample = []
-                for run_num, run_path in enumerate(self.root_path2.glob('run[0-9]')):
-                    logging.debug("Processing %s, %s" % (run_num, run_path))
-                    #for step_path in PathProvider(run_path).get_data_paths():
-                    #logging.debug("Processing %s" % step_path)
-                    step, population = pickle.load(run_path.joinpath("data/step" + str(step) + ".p").open('rb'))
-                    #self.array2[run_num, step] = population.get_mon()
-                    #logging.debug("mon val %f" % self.array2[run_num, step])
-                    sample.append(population.get_convexity(self.stimuluses))
-                self.conv_samples2.append(sample)
-                #for step in range(self.params['steps']):
-                #self.mon_samples2.append(list(self.array2[:, step]))
+            plan.add(self.root_path2, self.samples2)
+        plan.add_command(self)
 
     def compute_stats(self):
         logging.debug('in compute_stats')
@@ -342,8 +485,8 @@ class PlotConvexityCommand:
         self.conv_cis1_l, self.conv_cis1_u = confidence_intervals(self.conv_samples1)
 
         if self.root_path2 is not None:
-            self.mon_means2 = means(self.conv_samples2)
-            self.mon_cis2_l, self.mon_cis2_u = confidence_intervals(self.conv_samples2)
+            self.conv_means2 = means(self.conv_samples2)
+            self.conv_cis2_l, self.conv_cis2_u = confidence_intervals(self.conv_samples2)
 
     def plot(self):
         #x = range(1, self.params['steps'] + 1)
@@ -373,11 +516,18 @@ class PlotConvexityCommand:
         plt.savefig(str(self.conv_plot_path))
         plt.close()
 
-    def __call__(self):
-        self.get_data()
+    def finalize(self):
+        self.conv_samples1 = self.samples1.series()
+        if self.root_path2 is not None:
+            self.conv_samples2 = self.samples2.series()
         self.compute_stats()
         self.plot()
 
+    def __call__(self):
+        plan = ScanPlan()
+        self.register(plan)
+        plan.run()
+
 
 class PlotMonotonicityCommand:
 
@@ -389,7 +539,12 @@ class PlotMonotonicityCommand:
 
         self.stimuluses = stimuluses
         self.params = params
-        self.steps = [max(step*100-1, 0) for step in range(1 + self.params['steps']/100)]
+        self.steps = [max(step*100-1, 0) for step in range(1 + self.params['steps']//100)]
+        self.samples1 = CachedStepSamples(self.steps, open_metrics_cache(self.root_path1, stimuluses), 'monotonicity',
+                                          percent_mean)
+        if self.root_path2 is not None:
+            self.samples2 = CachedStepSamples(self.steps, open_metrics_cache(self.root_path2, stimuluses), 'monotonicity',
+                                              percent_mean)
         self.mon_plot_path = Path('.').joinpath('monotonicity.pdf')
         #self.array1 = zeros((self.params['runs'], self.steps))
         self.mon_samples1 = []
@@ -402,37 +557,11 @@ class PlotMonotonicityCommand:
         self.mon_cis2_l = []
         self.mon_cis2_u = []
 
-    def get_data(self):
-        #logging.debug("Root path %s" % self.root_path1)
-        for step in self.steps:
-            #logging.debug("Processing step %d" % step)
-            sample = []
-            for run_num, run_path in enumerate(self.root_path1.glob('run[0-9]*')):
-                #logging.debug("Processing %s, %s" % (run_num, run_path))
-                #logging.debug("Processing %s" % "step" + str(step) + ".p")
-                step, population = pickle.load(run_path.joinpath("data/step" + str(step) + ".p").open('rb'))
-                sample.append(population.get_mon(self.stimuluses))
-                #logging.debug("mon val %f" % sample[-1])
-            self.mon_samples1.append(sample)
-        #for step in range(self.params['steps']):
-        #    self.mon_samples1.append(list(self.array1[:, max(step*100-1, 0)]))
-
+    def register(self, plan):
+        plan.add(self.root_path1, self.samples1)
         if self.root_path2 is not None:
-            logging.debug("Root path %s" % self.root_path2)
-            for step in self.steps:
-                logging.debug("Processing step %d" % step)
-                sample = []
-                for run_num, run_path in enumerate(self.root_path2.glob('run[0-9]')):
-                    logging.debug("Processing %s, %s" % (run_num, run_path))
-                    #for step_path in PathProvider(run_path).get_data_paths():
-                    #logging.debug("Processing %s" % step_path)
-                    step, population = pickle.load(run_path.joinpath("data/step" + str(step) + ".p").open('rb'))
-                    #self.array2[run_num, step] = population.get_mon()
-                    #logging.debug("mon val %f" % self.array2[run_num, step])
-                    sample.append(population.get_mon(self.stimuluses))
-                self.mon_samples2.append(sample)
-                #for step in range(self.params['steps']):
-                #self.mon_samples2.append(list(self.array2[:, step]))
+            plan.add(self.root_path2, self.samples2)
+        plan.add_command(self)
 
     def compute_stats(self):
         logging.debug('in compute_stats')
@@ -471,11 +600,18 @@ class PlotMonotonicityCommand:
         plt.savefig(str(self.mon_plot_path))
         plt.close()
 
-    def __call__(self):
-        self.get_data()
+    def finalize(self):
+        self.mon_samples1 = self.samples1.series()
+        if self.root_path2 is not None:
+            self.mon_samples2 = self.samples2.series()
         self.compute_stats()
         self.plot()
 
+    def __call__(self):
+        plan = ScanPlan()
+        self.register(plan)
+        plan.run()
+
     # @staticmethod
     # def plot_means(str_data_roots):
     #     stats_dict = PlotMonotonicityCommand.prepare_stats(str_data_roots)
@@ -505,6 +641,19 @@ class PlotMonotonicityCommand:
     #     plt.close()
 
 
+def read_run_metrics(run_path):
+    """Metrics of the run, taken from the histories of its last snapshot for runs written before the metrics file."""
+    metrics_path = PathProvider.new_path_provider(run_path).get_metrics_path()
+    if metrics_path.exists():
+        return read_metrics(metrics_path)
+    snapshot = open_run_snapshots(run_path).load_latest_snapshot()
+    if snapshot is None or not hasattr(snapshot[1], 'history'):
+        raise FileNotFoundError('run {} has no metrics file {} and no snapshot with the metric histories'.format(
+            run_path, metrics_path))
+    logging.info("run {} has no metrics file, using the histories of its step {}".format(run_path, snapshot[0]))
+    return metrics_of_history(snapshot[1].history)
+
+
 class PlotSuccessCommand:
 
     def __init__(self, root_path, stimuluses, params):
@@ -512,7 +661,9 @@ class PlotSuccessCommand:
         self.params = params
         self.stimuluses = stimuluses
         self.succ_plot_path = self.root_path.joinpath('stats/succ.pdf')
-        self.steps = [max(step*10-1, 0) for step in range(1 + self.params['steps']/10)]
+        self.steps = [max(step*10-1, 0) for step in range(1 + self.params['steps']//10)]
+        self.nw = CachedStepSamples(self.steps, open_metrics_cache(self.root_path, stimuluses), 'active_lexicon',
+                                    mean_value)
         self.samples_cs1 = []
         self.samples_ds = []
         self.samples_cs2 = []
@@ -536,29 +687,24 @@ class PlotSuccessCommand:
 
     def prepare_data(self):
         logging.debug("Root path %s" % self.root_path)
-        psize = self.params['population_size']
-        populations = {}
+        metrics = {}
         for run_num in range(self.params['runs']):
             run_path = self.root_path.joinpath('run' + str(run_num))
             logging.debug("Processing %s, %s" % (run_num, run_path))
-            last_step_path = run_path.joinpath('data/step' + str(self.params['steps'] - 1) + '.p')
-            step, population = pickle.load(last_step_path.open('rb'))
-            populations[run_num] = population
+            metrics[run_num] = read_run_metrics(run_path)
+        # runs stopped early by a stopping criterion keep their last value till the last step
+        series = {metric: [carry_forward(metrics[run][metric], self.params['steps']) for run in range(self.params['runs'])]
+                  for metric in ['ds', 'cs1', 'cs2', 'cs12']}
         for step in range(self.params['steps']):
-            logging.debug(step)
-            self.samples_ds.append([populations[run].ds[step] for run in range(self.params['runs'])])
-            self.samples_cs1.append([populations[run].cs1[step] for run in range(self.params['runs'])])
-            self.samples_cs2.append([populations[run].cs2[step] for run in range(self.params['runs'])])
-            self.samples_cs12.append([populations[run].cs12[step] for run in range(self.params['runs'])])
-        for step in self.steps:
-            logging.debug(step)
-            nw_sample = []
-            for r in range(self.params['runs']):
-                run_path = self.root_path.joinpath('run' + str(r))
-                rsp = run_path.joinpath('data/step' + str(step) + '.p')
-                step, population = pickle.load(rsp.open('rb'))
-                nw_sample.append(sum([len(a.get_active_lexicon(self.stimuluses)) for a in population.agents]) / psize)
-            self.samples_nw.append(nw_sample)
+            self.samples_ds.append([series['ds'][run][step] for run in range(self.params['runs'])])
+            self.samples_cs1.append([series['cs1'][run][step] for run in range(self.params['runs'])])
+            self.samples_cs2.append([series['cs2'][run][step] for run in range(self.params['runs'])])
+            self.samples_cs12.append([series['cs12'][run][step] for run in range(self.params['runs'])])
+        self.samples_nw = self.nw.series()
+
+    def register(self, plan):
+        plan.add(self.root_path, self.nw)
+        plan.add_command(self)
 
     def compute_stats(self):
         self.cs1_means = means(self.samples_cs1)
@@ -631,51 +777,94 @@ class PlotSuccessCommand:
         plt.savefig(str(self.succ_plot_path))
         plt.close()
 
-    def __call__(self):
+    def finalize(self):
         self.prepare_data()
         self.compute_stats()
         self.plot()
 
+    def __call__(self):
+        plan = ScanPlan()
+        self.register(plan)
+        plan.run()
+
+
+class WordStepCounts:
+    """Growable sparse (word x step) matrix of counts, words get their rows in the order they come."""
+
+    def __init__(self):
+        self.rows = {}
+        self.words = []
+        self.row_indices = []
+        self.steps = []
+        self.counts = []
+
+    def add(self, step, counts):
+        """counts of words (word -> count) at the step."""
+        for word, count in counts.items():
+            if word not in self.rows:
+                self.rows[word] = len(self.words)
+                self.words.append(word)
+            if count:
+                self.row_indices.append(self.rows[word])
+                self.steps.append(step)
+                self.counts.append(count)
+
+    def matrix(self, n_steps):
+        return coo_matrix((self.counts, (self.row_indices, self.steps)), shape=(len(self.words), n_steps)).tocsr()
+
 
 class PlotNumberOfDSCommand:
+    """Plots the number of discriminative categories pinned to every word of every agent of every run over the
+    snapshot steps, only words (ever) in the active lexicon of the agent if active_only. The counts are fed by a
+    single scan into a WordStepCounts per (run, agent); snapshots not in the metrics cache are measured by the
+    gathering pool of the scan, in parallel across runs."""
 
-    def __init__(self, root_path, stimuluses, params, threshold=0, active_only=False):
+    def __init__(self, root_path, stimuluses, params, threshold=0, active_only=False, min_ds_num=2):
         self.root_path = root_path
         self.stimuluses = stimuluses
         self.params = params
         self.threshold = threshold
         self.active_only = active_only
-
-    def get_whole_lexicon(self, run_path, num_agent):
-        self.whole_lexicon = set()
-        for step_path in PathProvider(run_path).get_data_paths():
-            _, population = pickle.load(step_path.open('rb'))
-            if self.active_only:
-                self.whole_lexicon = self.whole_lexicon.union(population.agents[num_agent].get_active_lexicon(self.stimuluses))
-            else:
-                self.whole_lexicon=self.whole_lexicon.union(population.agents[num_agent].get_lexicon())
-        self.whole_lexicon = list(self.whole_lexicon) # cast to list to preserve the order
-
-
-    def fill_steps(self, run_path, num_agent):
-        for step_path in PathProvider(run_path).get_data_paths():
-            current_step, population = pickle.load(step_path.open('rb'))
-            for word in self.whole_lexicon:
-                i = self.whole_lexicon.index(word)
-                try:
-                    self.dcnum[i, current_step] = sum(population.agents[num_agent].get_categories_by_word(word) > 0)
-                except ValueError:
-                    pass
-
-    def plot(self, run_path, num_agent, min_DS_Num):
+        self.min_ds_num = min_ds_num
+        self.counts = {}
+        self.active_words = {}
+        # counts are fed by the scanning thread and by the result thread of the gathering pool
+        self.lock = threading.Lock()
+        cache = open_metrics_cache(root_path, stimuluses)
+        self.feeds = [CachedMetricFeed(cache, 'ds_categories', self.add_counts)]
+        if active_only:
+            self.feeds.append(CachedMetricFeed(cache, 'active_words', self.add_active_words))
+
+    def register(self, plan):
+        for feed in self.feeds:
+            plan.add(self.root_path, feed)
+        plan.add_command(self)
+
+    def add_counts(self, run, step, values):
+        with self.lock:
+            for agent_index, counts in enumerate(values):
+                self.counts.setdefault((run, agent_index), WordStepCounts()).add(step, counts)
+
+    def add_active_words(self, run, step, values):
+        with self.lock:
+            for agent_index, words in enumerate(values):
+                self.active_words.setdefault((run, agent_index), set()).update(words)
+
+    def plot(self, run_path, num_agent, counts, min_DS_Num):
+        dcnum = counts.matrix(self.params['steps'])
+        if self.active_only:
+            active_words = self.active_words.get((run_number(run_path), num_agent), set())
+            words = [word for word in counts.words if word in active_words]
+        else:
+            words = counts.words
         f = plt.figure()
         ax = f.add_subplot(111)
-        t = arange(self.dcnum.shape[1])
+        t = arange(dcnum.shape[1])
         short_legend = []
-        for word in self.whole_lexicon:
-            i = self.whole_lexicon.index(word)
-            if self.dcnum[i].max() >= min_DS_Num:
-                ax.step(t, self.dcnum[i])
+        for word in words:
+            row = dcnum.getrow(counts.rows[word]).toarray()[0]
+            if row.max() >= min_DS_Num:
+                ax.step(t, row)
                 short_legend.append(word)
         ax.legend(short_legend, bbox_to_anchor=(1.04, 1), loc='upper left')
         ax.set_title('Number of Discriminative Categories pinned to the word forms. \n '
@@ -687,20 +876,18 @@ class PlotNumberOfDSCommand:
         else:
             out_filename = str(run_path.joinpath('num_of_DC_agent_'+str(num_agent)+'.png'))
         f.savefig(out_filename, bbox_inches="tight")
+        plt.close(f)
 
-    def __call__(self, run_num=0, num_agent=0):
-        self.get_whole_lexicon(self.root_path.joinpath('run' + str(run_num)), num_agent)
-        self.dcnum = zeros([len(self.whole_lexicon), self.params['steps']])
+    def finalize(self):
+        for run, num_agent in sorted(self.counts):
+            self.plot(self.root_path.joinpath('run' + str(run)), num_agent, self.counts[(run, num_agent)],
+                      self.min_ds_num)
+        logging.debug("plotted number of DS of {} agents".format(len(self.counts)))
 
-        self.fill_steps(self.root_path.joinpath('run' + str(run_num)), num_agent)
-        self.plot(self.root_path.joinpath('run' + str(run_num)), num_agent, 2)
-
-        print self.dcnum
-
-        print self.whole_lexicon
-        # for run_num, run_path in enumerate(self.root_path.glob('*')):
-        #     for step in  PathProvider(run_path).get_data_paths():
-        #         print '{}  {}'.format(run_path, step)
+    def __call__(self):
+        plan = ScanPlan()
+        self.register(plan)
+        plan.run()
 
 
 if __name__ == '__main__':
@@ -720,7 +907,25 @@ if __name__ == '__main__':
     parser.add_argument('--plot_conv', '-conv', help='plot convexity', type=str, nargs='+', default='')
     parser.add_argument('--plot_num_DS', '-nds', help='plot success', type=bool, default=False)
     parser.add_argument('--hdf_franek', '-hdf', help='hdf franek', type=bool, default=False)
-    parser.add_argument('--parallelism', '-p', help='number of processes (unbounded if 0)', type=int, default=8)
+    parser.add_argument('--parallelism', '-p', help='number of processes plotting agents (one per cpu if 0)', type=int,
+                        default=8)
+    parser.add_argument('--gather_parallelism', '-gp', help='number of processes gathering convexity, monotonicity, '
+                        'success and hdf data of the snapshots (one per cpu if 0)', type=int, default=0)
+    parser.add_argument('--renderer', '-rd', help='classic plots a new figure for every frame, fast updates a figure '
+                        'kept per agent and writes its raster directly', type=str, default='classic')
+    parser.add_argument('--annotation_cells', '-ac', help='matrices of more cells are not annotated by the fast '
+                        'renderer', type=int, default=ANNOTATION_CELLS)
+    parser.add_argument('--animate', '-an', help='stream the frames of agent plots into an animated gif per agent '
+                        'instead of png files (drawn by the fast renderer)', type=bool, default=False)
+    parser.add_argument('--stride', '-st', help='plot agents at every k-th snapshot step', type=int, default=1)
+    parser.add_argument('--frame_duration', '-fd', help='display time of an animation frame in ms', type=int,
+                        default=FRAME_DURATION)
+    parser.add_argument('--frame_buffer', '-fb', help='bound of the frames an animation holds while waiting for an '
+                        'earlier frame (in MB)', type=int, default=FRAME_BUFFER // 2 ** 20)
+    parser.add_argument('--read_ahead', '-ra', help='number of snapshots read at once, the next one included', type=int,
+                        default=READ_AHEAD)
+    parser.add_argument('--read_ahead_memory', '-ram', help='bound of the snapshot bytes read ahead (in MB)', type=int,
+                        default=MEMORY_BUDGET // 2 ** 20)
 
     parsed_params = vars(parser.parse_args())
 
@@ -733,9 +938,13 @@ if __name__ == '__main__':
     for k, v in unpickled_inmem.items():
         inmem[k] = v
 
+    # every requested command reads the snapshots it needs from a single scan of each simulation
+    plan = ScanPlan(parsed_params['gather_parallelism'], parsed_params['read_ahead'],
+                    parsed_params['read_ahead_memory'] * 2 ** 20)
+
     if parsed_params['hdf_franek']:
         hdf_command = MakeHdf5(parsed_params['data_root'], unpickled_stimuluses, sim_params)
-        hdf_command()
+        hdf_command.register(plan)
 
     if len(parsed_params['plot_mons']) == 2:
         logging.critical("PLOTTING MONOTONICITY")
@@ -743,7 +952,7 @@ if __name__ == '__main__':
         unpickled_stimuluses1 = pickle.load(PathProvider.new_path_provider(data_root_path1).get_stimuluses_path().open('rb'))
         simulation1_params = pickle.load(PathProvider.new_path_provider(data_root_path1).get_simulation_params_path().open('rb'))
         pmc = PlotMonotonicityCommand(parsed_params['plot_mons'], unpickled_stimuluses1, simulation1_params)
-        pmc()
+        pmc.register(plan)
 
     if not data_root_path.exists():
         logging.debug("Path %s does not exist" % data_root_path.absolute())
@@ -751,47 +960,66 @@ if __name__ == '__main__':
 
     if parsed_params['plot_mon']:
         plot_mon_command = PlotMonotonicityCommand([parsed_params['data_root']], unpickled_stimuluses, sim_params)
-        plot_mon_command()
+        plot_mon_command.register(plan)
 
     if parsed_params['plot_conv']:
         plot_conv_command = PlotConvexityCommand([parsed_params['data_root']], unpickled_stimuluses, sim_params)
-        plot_conv_command()
+        plot_conv_command.register(plan)
 
     if parsed_params['plot_num_DS']:
         plot_num_DS_command = PlotNumberOfDSCommand(Path(parsed_params['data_root']), unpickled_stimuluses, sim_params, active_only=True)
-        plot_num_DS_command()
+        plot_num_DS_command.register(plan)
 
     if parsed_params['plot_success']:
         logging.debug('start plot success')
         plot_success_command = PlotSuccessCommand(Path(parsed_params['data_root']), unpickled_stimuluses, sim_params)
-        plot_success_command()
+        plot_success_command.register(plan)
 
     # set commands to be executed
+    command_executor = CommandExecutor(parsed_params['parallelism'], parsed_params['stride'],
+                                       parsed_params['frame_buffer'] * 2 ** 20)
     for data_path in Path(parsed_params['data_root']).glob('run[0-9]*'):
+        run = run_number(data_path)
         path_provider = PathProvider.new_path_provider(data_path)
-        command_executor = CommandExecutor()
+        commands = []
 
         if parsed_params['plot_cats']:
-            command_executor.add_command(PlotCategoryCommand(path_provider.cats_path, inmem))
+            commands.append(PlotCategoryCommand(path_provider.cats_path, inmem))
         if parsed_params['plot_langs']:
-            command_executor.add_command(PlotLanguageCommand(path_provider.lang_path, inmem))
+            commands.append(PlotLanguageCommand(path_provider.lang_path, inmem))
         if parsed_params['plot_langs2']:
-            command_executor.add_command(PlotLanguage2Command(path_provider.lang2_path, inmem))
+            commands.append(PlotLanguage2Command(path_provider.lang2_path, inmem))
         if parsed_params['plot_matrices']:
-            command_executor.add_command(PlotMatrixCommand(path_provider.matrices_path))
+            commands.append(PlotMatrixCommand(path_provider.matrices_path))
+        if not commands:
+            continue
+        if parsed_params['renderer'] == 'fast' or parsed_params['animate']:
+            commands = [FastMatrixCommand(command, parsed_params['annotation_cells'])
+                        if isinstance(command, PlotMatrixCommand) else FastCurvesCommand(command, inmem)
+                        for command in commands]
+        if parsed_params['animate']:
+            commands = [AnimationCommand(command, parsed_params['frame_duration']) for command in commands]
 
         path_provider.create_directories()
 
-        last_step = sim_params['steps'] - 1
-        _, last_population = pickle.load(path_provider.get_simulation_step_path(last_step).open('rb'))
-        path_provider.get_simulation_step_path(last_step)
-
-        start_time = time.time()
-        # PlotMonotonicity(parsed_params['data_root'])()
-        data_paths = path_provider.get_data_paths()
-        if parsed_params['parallelism'] == 1:
-            command_executor.execute_commands(data_paths, last_population)
-        else:
-            command_executor.execute_commands_in_parallel(data_paths, last_population, parsed_params['parallelism'])
-
-        logging.debug('execution time {}sec, with params {}'.format(time.time() - start_time, parsed_params))
+        snapshots = open_run_snapshots(data_path)
+        _, last_population = snapshots.load(snapshots.steps()[-1])
+        command_executor.add_run(run, last_population)
+        for command in commands:
+            command_executor.add_command(run, command)
+
+    if command_executor.commands:
+        plan.add(parsed_params['data_root'], command_executor)
+
+    start_time = time.time()
+    plan.run()
+
+    logging.debug('execution time {}sec, with params {}'.format(time.time() - start_time, parsed_params))
+    if plan.failures:
+        logging.error('{} snapshots failed to be gathered: {}'.format(len(plan.failures),
+                                                                      [key for key, _ in plan.failures]))
+    if command_executor.failures:
+        logging.error('{} agent plots failed: {}'.format(len(command_executor.failures),
+                                                         [key for key, _ in command_executor.failures]))
+    if plan.failures or command_executor.failures:
+        sys.exit(1)
@@ -0,0 +1,212 @@
+import logging
+import os
+import pickle
+import threading
+import zlib
+from pathlib import Path
+
+from inmemory_calculus import inmem
+from run_archive import open_run_snapshots, step_at_or_before
+
+
+def ds_categories(agent, stimuli):
+    # number of discriminative categories every word is pinned to, rows of the association matrix follow the lexicon
+    counts = (agent.language.lxc.to_array() > 0).sum(axis=1)
+    return dict(zip(agent.get_lexicon(), counts.tolist()))
+
+
+# metrics of an agent derived from a snapshot, computed over the stimuli of the simulation
+AGENT_METRICS = {'convexity': lambda agent, stimuli: agent.get_convexity(stimuli),
+                 'monotonicity': lambda agent, stimuli: agent.get_monotonicity(stimuli),
+                 'active_lexicon': lambda agent, stimuli: len(agent.get_active_lexicon(stimuli)),
+                 'meanings': lambda agent, stimuli: agent.get_best_matching_words(stimuli),
+                 'ds_categories': ds_categories,
+                 'active_words': lambda agent, stimuli: sorted(agent.get_active_lexicon(stimuli))}
+
+# bump the version of a metric whenever the way it is computed changes, its cached values are computed again
+METRIC_VERSIONS = {'convexity': 1, 'monotonicity': 1, 'active_lexicon': 1, 'meanings': 1, 'ds_categories': 1,
+                   'active_words': 1}
+
+
+def percent_mean(values):
+    # as Population.get_convexity and get_mon
+    return sum(map(lambda value: value * 100.0, values)) / len(values)
+
+
+def mean_value(values):
+    return sum(values) / len(values)
+
+
+class DerivedMetricsCache:
+    """Metrics of every (run, step, agent) derived from the snapshots of a simulation, pickled per run into
+    stats/derived_metrics/runN.p.
+
+    Values are filled lazily by the commands asking for them and written by flush. A step entry carries the key of
+    the snapshot it was computed from (see RunSnapshots.snapshot_key) and is dropped once the snapshot changes,
+    values of a metric cached under another version than in METRIC_VERSIONS are computed again. Results gathered
+    from workers are put by the thread of the task pool while the scanning thread reads, so the entries are locked."""
+
+    def __init__(self, root_path, stimuli):
+        self.root_path = Path(root_path)
+        self.cache_path = self.root_path.joinpath('stats', 'derived_metrics')
+        self.stimuli = stimuli
+        # the metrics depend on the stimuli they are computed over
+        self.fingerprint = zlib.crc32(repr([stimulus.index for stimulus in stimuli]).encode('utf-8'))
+        self.runs = {}
+        self.snapshot_steps = {}
+        self.dirty = set()
+        # reentrant, get and put hold it over entries and snapshot_key
+        self.lock = threading.RLock()
+
+    def run_cache_path(self, run):
+        return self.cache_path.joinpath('run{}.p'.format(run))
+
+    def entries(self, run):
+        with self.lock:
+            if run not in self.runs:
+                self.runs[run] = self.read_entries(run)
+            return self.runs[run]
+
+    def read_entries(self, run):
+        path = self.run_cache_path(run)
+        if path.exists():
+            try:
+                with path.open('rb') as read_handle:
+                    fingerprint, entries = pickle.load(read_handle)
+                if fingerprint == self.fingerprint:
+                    return entries
+            except Exception as e:
+                logging.warning("dropping unreadable metrics cache %s: %s" % (path, e))
+        return {}
+
+    def snapshot_key(self, run, step):
+        snapshots = open_run_snapshots(self.root_path.joinpath('run' + str(run)))
+        with self.lock:
+            if run not in self.snapshot_steps:
+                self.snapshot_steps[run] = snapshots.steps()
+            return snapshots.snapshot_key(step_at_or_before(self.snapshot_steps[run], step))
+
+    def get(self, run, step, name):
+        """Values of the metric for the agents of the run at step, None unless cached for the current snapshot."""
+        with self.lock:
+            entry = self.entries(run).get(step)
+            if entry is None or entry['key'] != self.snapshot_key(run, step):
+                return None
+            version, values = entry['metrics'].get(name, (None, None))
+            return values if version == METRIC_VERSIONS[name] else None
+
+    def put(self, run, step, name, values):
+        with self.lock:
+            entries = self.entries(run)
+            key = self.snapshot_key(run, step)
+            if step not in entries or entries[step]['key'] != key:
+                entries[step] = {'key': key, 'metrics': {}}
+            entries[step]['metrics'][name] = (METRIC_VERSIONS[name], values)
+            self.dirty.add(run)
+
+    def agent_metrics(self, run, step, name, population):
+        """Values of the metric for the agents of the population, computed and cached unless cached already."""
+        values = self.get(run, step, name)
+        if values is None:
+            values = [AGENT_METRICS[name](agent, self.stimuli) for agent in population.agents]
+            self.put(run, step, name, values)
+        return values
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            if not self.cache_path.exists():
+                os.makedirs(str(self.cache_path))
+            for run in sorted(self.dirty):
+                path = self.run_cache_path(run)
+                temp_path = path.with_name(path.name + '.tmp')
+                with temp_path.open('wb') as write_handle:
+                    pickle.dump((self.fingerprint, self.runs[run]), write_handle, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(str(temp_path), str(path))
+            self.dirty.clear()
+
+
+__caches = {}
+
+
+def open_metrics_cache(root_path, stimuli):
+    """Returns the (shared) cache of the simulation rooted at root_path for metrics over the stimuli."""
+    cache = DerivedMetricsCache(root_path, stimuli)
+    key = (str(cache.root_path.absolute()), cache.fingerprint)
+    if key not in __caches:
+        __caches[key] = cache
+    return __caches[key]
+
+
+class StepSamples:
+    """Consumer keeping metric(population) of every run at the given steps."""
+
+    def __init__(self, steps, metric):
+        self.steps = steps
+        self.metric = metric
+        self.values = {}
+
+    def consume(self, run, step, population):
+        self.values.setdefault(step, {})[run] = self.metric(population)
+
+    def finalize(self):
+        pass
+
+    def series(self):
+        """Samples per step (as stats.means and confidence_intervals take them), values ordered by run."""
+        return [[value for _, value in sorted(self.values.get(step, {}).items())] for step in self.steps]
+
+
+class CachedStepSamples(StepSamples):
+    """StepSamples of reduce(values of a cached metric of every agent), steps found in the cache are not loaded."""
+
+    def __init__(self, steps, cache, name, reduce):
+        StepSamples.__init__(self, steps, None)
+        self.cache = cache
+        self.name = name
+        self.reduce = reduce
+
+    def lookup(self, run, step):
+        values = self.cache.get(run, step, self.name)
+        if values is None:
+            return False
+        self.take(run, step, values)
+        return True
+
+    def consume(self, run, step, population):
+        self.take(run, step, self.cache.agent_metrics(run, step, self.name, population))
+
+    def gathered(self, run, step, values):
+        """Takes the values of the metric measured by a worker (see measure_snapshot)."""
+        self.cache.put(run, step, self.name, values)
+        self.take(run, step, values)
+
+    def take(self, run, step, values):
+        # values of the agents of the run at step, wherever they come from
+        self.values.setdefault(step, {})[run] = self.reduce(values)
+
+    def finalize(self):
+        self.cache.flush()
+
+
+class CachedMetricFeed(CachedStepSamples):
+    """Hands the values of a cached metric of every agent at every snapshot step (or at the steps) to
+    feed(run, step, values) instead of keeping samples of them."""
+
+    def __init__(self, cache, name, feed, steps=None):
+        CachedStepSamples.__init__(self, steps, cache, name, None)
+        self.feed = feed
+
+    def take(self, run, step, values):
+        self.feed(run, step, values)
+
+
+def init_metrics_worker(calculus):
+    inmem.update(calculus)
+
+
+def measure_snapshot(run_path, step, stimuli, names):
+    """Values of the metrics for every agent of a snapshot, measured in a worker."""
+    _, population = open_run_snapshots(run_path).load(step)
+    return dict((name, [AGENT_METRICS[name](agent, stimuli) for agent in population.agents]) for name in names)
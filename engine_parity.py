@@ -0,0 +1,122 @@
+import argparse
+import logging
+import sys
+
+import numpy
+
+import perception
+from agent import Population
+from guessing_game import GuessingGame
+from inmemory_calculus import generate_inmemory_calculus, inmem
+from language import Language
+from stimulus import QuotientBasedStimulusFactory, NumericBasedStimulusFactory
+from vectorized_engine import StackedPopulation, ContextSampler
+
+# simulation defaults the engines are compared with
+SIMULATION_PARAMS = {'discriminative_threshold': .95, 'delta_inc': .2, 'delta_dec': .2, 'delta_inh': .2, 'alpha': .01,
+                     'super_alpha': .001, 'beta': .2, 'success_window': 50}
+
+
+class SharedDraws:
+    """Tie breaks and new words of the classic engine taken from the draws of the vectorized round, so that both
+    engines play the very same games. Patches perception.choice and Language.add_new_word while used as a context
+    manager, and restores them on exit."""
+
+    def __init__(self):
+        self.tie = None
+        self.letters = None
+        self.patched = None
+
+    def __enter__(self):
+        self.patched = perception.choice, Language.add_new_word
+        perception.choice = lambda options: self.tie
+        draws = self
+
+        def add_new_word(language):
+            word = ''.join(Language.word_components[c][i] for c, i in enumerate(draws.letters))
+            language.add_word(word)
+            return word
+        Language.add_new_word = add_new_word
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        perception.choice, Language.add_new_word = self.patched
+        self.patched = None
+
+
+def compare_populations(step, classic, vectorized):
+    """Raises AssertionError at the first difference of the agents."""
+    for a, b in zip(classic.agents, vectorized.agents):
+        la, lb = a.language, b.language
+        assert list(la.lexicon) == list(lb.lexicon), (step, a.id, 'lexicon')
+        assert [c.id for c in la.categories] == [c.id for c in lb.categories], (step, a.id, 'categories')
+        for ca, cb in zip(la.categories, lb.categories):
+            ua, ub = ca.reactive_units(), cb.reactive_units()
+            assert [u[0] for u in ua] == [u[0] for u in ub], (step, a.id, 'reactive units')
+            assert numpy.allclose([u[1] for u in ua], [u[1] for u in ub]), (step, a.id, 'weights')
+        assert numpy.allclose(la.lxc.to_array().reshape(lb.lxc.to_array().shape), lb.lxc.to_array()), \
+            (step, a.id, 'associations')
+        assert la.lxc.max_shape() == lb.lxc.max_shape(), (step, a.id, 'matrix shape')
+        assert list(la.ds_scores) == list(lb.ds_scores), (step, a.id, 'ds')
+        assert list(a.cs1_scores) == list(b.cs1_scores), (step, a.id, 'cs1')
+        assert list(a.cs2_scores) == list(b.cs2_scores), (step, a.id, 'cs2')
+        assert list(a.cs12_scores) == list(b.cs12_scores), (step, a.id, 'cs12')
+        assert la._id_ == lb._id_, (step, a.id, 'category ids')
+
+
+def check_parity(params):
+    """Plays params['steps'] rounds with both engines from the same draws, compares every game and the agents after
+    every round. Returns the counts of the game outcomes."""
+    inmem.update(generate_inmemory_calculus(params['stimulus'], params['max_num']))
+    if params['stimulus'] == 'quotient':
+        stimulus_factory = QuotientBasedStimulusFactory(inmem['STIMULUS_LIST'], params['max_num'])
+    else:
+        stimulus_factory = NumericBasedStimulusFactory(inmem['STIMULUS_LIST'], params['max_num'])
+    sampler = ContextSampler(stimulus_factory)
+    population = Population(dict(SIMULATION_PARAMS, **params))
+    stacked = StackedPopulation.from_populations([population], dict(SIMULATION_PARAMS, **params), sampler)
+    stacked.record_events = True
+    rng = numpy.random.default_rng(params['seed'])
+    counts = numpy.zeros(8, int)
+    with SharedDraws() as draws:
+        for step in range(params['steps']):
+            speakers, hearers, first, second, ties, letters = stacked.draw_round(rng)
+            classic = []
+            for g in range(len(speakers)):
+                draws.tie, draws.letters = ties[g], letters[g]
+                game = GuessingGame(params['guessing_game_2'],
+                                    [sampler.stimulus(first[g]), sampler.stimulus(second[g])])
+                game.play(speaker=population.agents[speakers[g]], hearer=population.agents[hearers[g]])
+                classic.append((game.outcome, -1 if game.success2 is None else int(game.success2), game.speaker_word,
+                                game.speaker_category_id, game.hearer_category_id))
+            outcomes, events = stacked.play_games(speakers, hearers, first, second, ties, letters)
+            vectorized = [(int(e['outcome']), int(e['success2']), stacked.words[e['word']] if e['word'] >= 0 else None,
+                           int(e['speaker_category']), int(e['hearer_category'])) for e in events]
+            assert vectorized == classic, (step, 'games')
+            assert list(outcomes) == [game[0] for game in classic], (step, 'outcomes')
+            counts += numpy.bincount(outcomes - 1, minlength=8)
+            compare_populations(step, population, stacked.to_population(0))
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='classic and vectorized engine parity check')
+    parser.add_argument('--stimulus', '-stm', help='quotient or numeric', type=str, default='quotient')
+    parser.add_argument('--max_num', '-mn', help='max number for numerics or max denominator for quotients', type=int,
+                        default=20)
+    parser.add_argument('--population_size', '-p', help='population size', type=int, default=10)
+    parser.add_argument('--steps', '-s', help='number of rounds compared', type=int, default=150)
+    parser.add_argument('--guessing_game_2', '-gg2', help='is the second stage of the guessing game on', type=bool,
+                        default=False)
+    parser.add_argument('--seed', '-sd', help='seed of the draws of the rounds', type=int, default=1)
+    parser.add_argument('--log_level', '-ll', help='DEBUG, INFO, WARNING, ERROR or CRITICAL', type=str, default='INFO')
+
+    parsed_params = vars(parser.parse_args())
+    logging.basicConfig(stream=sys.stderr, level=parsed_params['log_level'])
+    try:
+        outcome_counts = check_parity(parsed_params)
+    except AssertionError as e:
+        logging.error("engines differ: {}".format(e))
+        sys.exit(1)
+    logging.info("engines agree on {} rounds of {} agents, outcome counts {}".format(
+        parsed_params['steps'], parsed_params['population_size'], outcome_counts.tolist()))
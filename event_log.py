@@ -0,0 +1,133 @@
+import os
+import struct
+
+from numpy import dtype, zeros, fromfile
+
+from record_file import RECORD_FILE_HEADER, write_record_header, read_record_header
+
+# one record per played game: agent ids, stimulus indices of the context (the topic is stimulus1), outcome code
+# (see guessing_game_exceptions.Outcome), result of stage 7 (-1 if not played), id of the speaker's word (or the word
+# it introduced, -1 if none) into the word table of the run and ids of the categories used (-1 if none)
+GAME_EVENT_DTYPE = dtype([('step', '<i4'), ('game', '<i4'), ('speaker', '<i4'), ('hearer', '<i4'),
+                          ('stimulus1', '<i4'), ('stimulus2', '<i4'), ('outcome', '<i1'), ('success2', '<i1'),
+                          ('word', '<i4'), ('speaker_category', '<i4'), ('hearer_category', '<i4')])
+# the event file and its word table start with a header (see record_file.py); the word table holds a record per word,
+# its utf-8 length followed by the word, in the order of their ids
+EVENTS_MAGIC = b'CQEVENTS'
+EVENTS_VERSION = 1
+WORDS_MAGIC = b'CQEVWORD'
+WORDS_VERSION = 1
+WORD_LENGTH = struct.Struct('<I')
+
+
+class GameEventLog:
+    """Appends fixed width records of played games to the event file of a run, new words are appended to a word table
+    next to it. Simulations hold None instead of a disabled log, so the game loop only tests for it."""
+
+    def __init__(self, events_path, words_path, buffer_size=4096):
+        self.events_path = str(events_path)
+        self.words_path = str(words_path)
+        self.words = []
+        if os.path.exists(self.words_path):
+            self.words, end = scan_event_words(self.words_path)
+            # drop a word torn by an interrupted run
+            if end < os.path.getsize(self.words_path):
+                os.truncate(self.words_path, end)
+        self.word_ids = dict((word, word_id) for word_id, word in enumerate(self.words))
+        self.saved_words = len(self.words)
+        self.records = zeros(buffer_size, dtype=GAME_EVENT_DTYPE)
+        self.count = 0
+
+    def word_id(self, word):
+        if word is None:
+            return -1
+        if word not in self.word_ids:
+            self.word_ids[word] = len(self.words)
+            self.words.append(word)
+        return self.word_ids[word]
+
+    def record_game(self, step, index, game, speaker, hearer):
+        """Records a played GuessingGame."""
+        if self.count == len(self.records):
+            self.flush()
+        self.records[self.count] = (step, index, speaker.id, hearer.id, game.context[0].index, game.context[1].index,
+                                    game.outcome, -1 if game.success2 is None else game.success2,
+                                    self.word_id(game.speaker_word), game.speaker_category_id, game.hearer_category_id)
+        self.count += 1
+
+    def record_games(self, step, events, words):
+        """Records games of a step given as GAME_EVENT_DTYPE records (step and word fields are filled here),
+        words are the words (or None) of the games."""
+        self.flush()
+        events['step'] = step
+        events['word'] = [self.word_id(word) for word in words]
+        self.append(events)
+
+    def flush(self):
+        self.append(self.records[:self.count])
+        self.count = 0
+
+    def append(self, records):
+        # words before the events referring to them
+        if self.saved_words < len(self.words):
+            with open(self.words_path, 'ab') as write_handle:
+                if write_handle.tell() == 0:
+                    write_record_header(write_handle, WORDS_MAGIC, WORDS_VERSION, 1)
+                for word in self.words[self.saved_words:]:
+                    word_bytes = word.encode('utf-8')
+                    write_handle.write(WORD_LENGTH.pack(len(word_bytes)))
+                    write_handle.write(word_bytes)
+            self.saved_words = len(self.words)
+        if len(records):
+            with open(self.events_path, 'ab') as write_handle:
+                if write_handle.tell() == 0:
+                    write_events_header(write_handle)
+                records.tofile(write_handle)
+
+    def close(self):
+        self.flush()
+
+
+def write_events_header(write_handle):
+    write_record_header(write_handle, EVENTS_MAGIC, EVENTS_VERSION, len(GAME_EVENT_DTYPE.names))
+
+
+def read_events(events_path):
+    with open(str(events_path), 'rb') as read_handle:
+        if not read_record_header(read_handle, events_path, EVENTS_MAGIC, EVENTS_VERSION, len(GAME_EVENT_DTYPE.names),
+                                  'game events'):
+            return zeros(0, dtype=GAME_EVENT_DTYPE)
+        return fromfile(read_handle, dtype=GAME_EVENT_DTYPE)
+
+
+def scan_event_words(words_path):
+    """Returns (words of the word table, end of its last complete word)."""
+    with open(str(words_path), 'rb') as read_handle:
+        if not read_record_header(read_handle, words_path, WORDS_MAGIC, WORDS_VERSION, 1, 'event words'):
+            return [], 0
+        data = read_handle.read()
+    words = []
+    position = 0
+    while position + WORD_LENGTH.size <= len(data):
+        length, = WORD_LENGTH.unpack_from(data, position)
+        if position + WORD_LENGTH.size + length > len(data):
+            break
+        words.append(data[position + WORD_LENGTH.size:position + WORD_LENGTH.size + length].decode('utf-8'))
+        position += WORD_LENGTH.size + length
+    return words, RECORD_FILE_HEADER.size + position
+
+
+def read_event_words(words_path):
+    """Words of the word table, a word's id is its index."""
+    return scan_event_words(words_path)[0]
+
+
+def truncate_events(events_path, last_step):
+    """Drops events of steps after last_step (played before a run was interrupted), words stay in the table."""
+    events_path = str(events_path)
+    if not os.path.exists(events_path):
+        return
+    events = read_events(events_path)
+    with open(events_path, 'wb') as write_handle:
+        write_events_header(write_handle)
+        events[events['step'] <= last_step].tofile(write_handle)
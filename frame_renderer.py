@@ -0,0 +1,128 @@
+from collections import OrderedDict
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+# at most this many figures are kept by a FigurePool, the least recently used one is dropped beyond
+MAX_FIGURES = 64
+# association matrices of more cells than this are not annotated with their values
+ANNOTATION_CELLS = 400
+
+
+class FigurePool:
+    """Figures of a plot kept per key (i.e. agent), so that frames of the following steps only update the data of
+    their artists. Figures are not pyplot figures (no global state), they are never pickled."""
+
+    def __init__(self, max_figures=MAX_FIGURES):
+        self.max_figures = max_figures
+        self.figures = OrderedDict()
+
+    def get(self, key, new_frame, *args):
+        """Returns (figure, artists) of the key, artists as returned by new_frame(figure, *args) once per key."""
+        if key in self.figures:
+            self.figures.move_to_end(key)
+            return self.figures[key]
+        if len(self.figures) >= self.max_figures:
+            self.figures.popitem(last=False)
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        self.figures[key] = figure, new_frame(figure, *args)
+        return self.figures[key]
+
+    def __getstate__(self):
+        return {'max_figures': self.max_figures, 'figures': OrderedDict()}
+
+
+def write_frame(figure, path):
+    # draws straight to the agg canvas and writes its raster, no bbox fitting of savefig
+    figure.canvas.print_png(str(path))
+
+
+class CurvePool:
+    """Lines of an axes reused by the frames, lines not needed by a frame are hidden."""
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.lines = []
+
+    def update(self, x, curves):
+        """curves as (y, color, linestyle), the axes are rescaled to the visible lines."""
+        for i, (y, color, linestyle) in enumerate(curves):
+            if i == len(self.lines):
+                self.lines.append(self.ax.plot(x, y)[0])
+            line = self.lines[i]
+            line.set_data(x, y)
+            line.set_color(color)
+            line.set_linestyle(linestyle)
+            line.set_visible(True)
+        for line in self.lines[len(curves):]:
+            line.set_visible(False)
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+
+
+class LabelPool:
+    """Legend of a figure as a column of (line sample, text) pairs placed in figure coordinates from (x, top) down,
+    updated in place instead of building a legend per frame. Labels not fitting above bottom are summarized by the
+    last visible one."""
+
+    def __init__(self, figure, x, top, bottom=0.02, spacing=0.022, fontsize=6):
+        self.figure = figure
+        self.x = x
+        self.top = top
+        self.spacing = spacing
+        self.fontsize = fontsize
+        self.capacity = max(1, int((top - bottom) / spacing) + 1)
+        self.entries = []
+
+    def entry(self, i):
+        if i == len(self.entries):
+            y = self.top - i * self.spacing
+            sample = Line2D([self.x, self.x + 0.03], [y, y], transform=self.figure.transFigure)
+            self.figure.add_artist(sample)
+            text = self.figure.text(self.x + 0.04, y, '', fontsize=self.fontsize, va='center')
+            self.entries.append((sample, text))
+        return self.entries[i]
+
+    def update(self, labels):
+        """labels as (label, color, linestyle)."""
+        shown = labels if len(labels) <= self.capacity else labels[:self.capacity - 1]
+        for i, (label, color, linestyle) in enumerate(shown):
+            sample, text = self.entry(i)
+            sample.set_color(color)
+            sample.set_linestyle(linestyle)
+            sample.set_visible(True)
+            text.set_text(label)
+            text.set_visible(True)
+        count = len(shown)
+        if len(shown) < len(labels):
+            sample, text = self.entry(count)
+            sample.set_visible(False)
+            text.set_text('+{} more'.format(len(labels) - len(shown)))
+            text.set_visible(True)
+            count += 1
+        for sample, text in self.entries[count:]:
+            sample.set_visible(False)
+            text.set_visible(False)
+
+
+class TextPool:
+    """Text artists of an axes (i.e. cell annotations) reused by the frames, texts not needed are hidden."""
+
+    def __init__(self, ax, **text_kwargs):
+        self.ax = ax
+        self.text_kwargs = text_kwargs
+        self.texts = []
+
+    def update(self, texts):
+        """texts as (x, y, text) in data coordinates."""
+        for i, (x, y, text) in enumerate(texts):
+            if i == len(self.texts):
+                self.texts.append(self.ax.text(x, y, text, **self.text_kwargs))
+            artist = self.texts[i]
+            artist.set_position((x, y))
+            artist.set_text(text)
+            artist.set_visible(True)
+        for artist in self.texts[len(texts):]:
+            artist.set_visible(False)
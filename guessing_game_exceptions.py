@@ -1,3 +1,22 @@
+class Outcome:
+    """Codes of the ordinary outcomes of the phases of a guessing game, returned instead of raising the exceptions
+    below (which are left for the raising API and real errors). A played game ends with one of them but OK."""
+    OK = 0
+    NO_CATEGORY = 1
+    NO_NOTICEABLE_DIFFERENCE = 2
+    NO_DISCRIMINATION = 3
+    NO_WORD_FOR_CATEGORY = 4
+    NO_SUCH_WORD = 5
+    NO_ASSOCIATED_CATEGORIES = 6
+    FAILURE = 7  # hearer points at the wrong stimulus
+    SUCCESS = 8
+
+
+# names of game outcomes with codes 1, 2, ..., i.e. fields of the per step outcome counts
+GAME_OUTCOMES = ['no_category', 'no_noticeable_difference', 'no_discrimination', 'no_word_for_category',
+                 'no_such_word', 'no_associated_categories', 'failure', 'success']
+
+
 class LanguageError(Exception):
     pass
 
@@ -64,3 +83,12 @@ class NO_POSITIVE_RESPONSE_2(PerceptionError):
 # stimuli are indistinguishable for agent perception (jnd)
 class NO_NOTICEABLE_DIFFERENCE(PerceptionError):
     pass
+
+
+# exceptions raised by the raising API for outcome codes
+OUTCOME_ERRORS = {Outcome.NO_CATEGORY: NO_CATEGORY,
+                  Outcome.NO_NOTICEABLE_DIFFERENCE: NO_NOTICEABLE_DIFFERENCE,
+                  Outcome.NO_DISCRIMINATION: NO_DISCRIMINATION,
+                  Outcome.NO_WORD_FOR_CATEGORY: NO_WORD_FOR_CATEGORY,
+                  Outcome.NO_SUCH_WORD: NO_SUCH_WORD,
+                  Outcome.NO_ASSOCIATED_CATEGORIES: NO_ASSOCIATED_CATEGORIES}
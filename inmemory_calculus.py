@@ -1,6 +1,7 @@
 from __future__ import division
 
 import os
+from fractions import Fraction
 
 import numpy as np
 import h5py
@@ -51,3 +52,40 @@ def load_inmemory_calculus(path, type):
         raise ValueError()
     if not REACTIVE_UNIT_DIST.shape[1] == DOMAIN.shape[0]:
         raise ValueError()
+
+
+def generate_inmemory_calculus(type, max_num, domain_points=1000):
+    """Synthetic calculus of gaussian reactive units (width proportional to n for numeric, constant for quotient),
+    shaped as the precomputed one, for benchmarks and machines without the calculus files."""
+    if type == 'numeric':
+        stimulus_list = np.arange(1, max_num + 1)
+        values = stimulus_list.astype(float)
+        widths = 0.15 * values
+        domain = np.linspace(0.0, 1.5 * max_num, domain_points)
+    else:
+        # reduced quotients n/k for 1 <= n <= k <= max_num, as drawn by QuotientBasedStimulusFactory
+        quotients = sorted({Fraction(n, k) for k in range(1, max_num + 1) for n in range(1, k + 1)},
+                           key=lambda f: (f.denominator, f.numerator))
+        stimulus_list = np.array([[f.numerator, f.denominator] for f in quotients])
+        values = stimulus_list[:, 0] / stimulus_list[:, 1]
+        widths = np.full(len(values), 0.05)
+        domain = np.linspace(0.0, 1.3, domain_points)
+    reactive_unit_dist = np.exp(-(domain[None, :] - values[:, None]) ** 2 / (2 * widths[:, None] ** 2)) / \
+        (widths[:, None] * np.sqrt(2 * np.pi))
+    return {'STIMULUS_LIST': stimulus_list,
+            'REACTIVE_UNIT_DIST': reactive_unit_dist,
+            'REACTIVE_X_REACTIVE': reactive_unit_dist.dot(reactive_unit_dist.T) * (domain[1] - domain[0]),
+            'DOMAIN': domain}
+
+
+def save_inmemory_calculus(path, type, calculus):
+    """Writes the calculus in the layout read by load_inmemory_calculus."""
+    type_path = Path(os.path.abspath(path)).joinpath(type)
+    if not type_path.exists():
+        os.makedirs(str(type_path))
+    files = [('R.h5', 'REACTIVE_UNIT_DIST'), ('RxR.h5', 'REACTIVE_X_REACTIVE'), ('domain.h5', 'DOMAIN')]
+    if type == 'quotient':
+        files.append(('nklist.h5', 'STIMULUS_LIST'))
+    for file_name, key in files:
+        with h5py.File(str(type_path.joinpath(file_name)), 'w') as py_file:
+            py_file.create_dataset(u'Dataset1', data=calculus[key])
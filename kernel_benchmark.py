@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+from time import perf_counter_ns
+
+import numpy
+
+from agent import Agent
+from inmemory_calculus import generate_inmemory_calculus, inmem
+from language import Language
+from success_window import SuccessWindow
+from stimulus import QuotientBasedStimulusFactory, NumericBasedStimulusFactory
+
+# language parameters of synthetic agents (as the simulation defaults)
+LANGUAGE_PARAMS = {'delta_inc': .2, 'delta_dec': .2, 'delta_inh': .2, 'discriminative_threshold': .95, 'alpha': .01,
+                   'beta': .2, 'super_alpha': .001, 'success_window': 50}
+
+
+def synthetic_agent(params, stimuli, rng):
+    """Agent with params['categories'] categories of params['units'] reactive units each, centered on random stimuli
+    with random weights, and params['lexicon'] words associated with random categories."""
+    language = Language(dict(LANGUAGE_PARAMS, stimulus=params['stimulus']))
+    for _ in range(params['categories']):
+        category = language.add_category(rng.choice(stimuli), rng.uniform(0.1, 1.0))
+        for _ in range(params['units'] - 1):
+            language.categories[category].add_reactive_unit(rng.choice(stimuli), rng.uniform(0.1, 1.0))
+    for word in range(params['lexicon']):
+        language.add_word('word{}'.format(word))
+        language.lxc.set_values(axis=0, index=word, values=[rng.uniform(0.0, 1.0) if rng.random() < 0.3 else 0.0
+                                                            for _ in range(params['categories'])])
+    return Agent(0, language, SuccessWindow(), SuccessWindow(), SuccessWindow())
+
+
+def measure(kernel, repeat, number, setup=None):
+    """Nanoseconds per call of kernel over repeat rounds of number calls, setup (untimed) runs before every round."""
+    per_call = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter_ns()
+        for _ in range(number):
+            kernel()
+        per_call.append((perf_counter_ns() - start) / number)
+    return {'median_ns': float(numpy.median(per_call)), 'min_ns': float(min(per_call)), 'repeat': repeat,
+            'number': number}
+
+
+def run_benchmarks(params):
+    rng = random.Random(params['seed'])
+    inmem.update(generate_inmemory_calculus(params['stimulus'], params['max_num']))
+    if params['stimulus'] == 'quotient':
+        stimulus_factory = QuotientBasedStimulusFactory(inmem['STIMULUS_LIST'], params['max_num'])
+    else:
+        stimulus_factory = NumericBasedStimulusFactory(inmem['STIMULUS_LIST'], params['max_num'])
+    stimuli = stimulus_factory.get_all_stimuli()
+    agent = synthetic_agent(params, stimuli, rng)
+    language = agent.language
+    category = language.categories[0]
+    stimulus = stimuli[len(stimuli) // 2]
+    word = language.lexicon[0]
+    lxc = language.lxc
+    matrix = lxc.to_array()
+    # a tenth of the words is too weak to survive forgetting (first call of a round), then nothing is forgotten
+    weak = matrix.copy()
+    weak[::10] = 0.0
+    repeat, number = params['repeat'], params['number']
+    # kernels over all stimuli take up to seconds
+    slow_repeat = max(repeat // 4, 3)
+
+    def reset_matrix(values):
+        def reset():
+            lxc.__matrix__ = values.copy()
+        return reset
+
+    kernels = [
+        ('Category.response', lambda: category.response(stimulus), None, repeat, number),
+        ('Perception.get_best_matching_category', lambda: language.get_best_matching_category(stimulus), None, repeat,
+         number),
+        ('AssociativeMatrix.add_row', lxc.add_row, reset_matrix(matrix), repeat, 20),
+        ('AssociativeMatrix.add_col', lxc.add_col, reset_matrix(matrix), repeat, 20),
+        ('AssociativeMatrix.forget', lambda: lxc.forget(0.01), reset_matrix(weak), repeat, number),
+        ('Language.csimilarity', lambda: language.csimilarity(word, category), reset_matrix(matrix), repeat,
+         max(number // 10, 1)),
+        ('Language.semantic_meaning', lambda: language.semantic_meaning(word, stimuli), None, slow_repeat, 1),
+        ('Agent.get_convexity', lambda: agent.get_convexity(stimuli), None, slow_repeat, 1),
+        ('{}.__call__'.format(type(stimulus_factory).__name__), stimulus_factory, None, repeat, number)]
+    results = {}
+    for name, kernel, setup, kernel_repeat, kernel_number in kernels:
+        random.seed(params['seed'])
+        results[name] = measure(kernel, kernel_repeat, kernel_number, setup)
+        logging.info("{:>45} median {:12.1f}us min {:12.1f}us".format(name, results[name]['median_ns'] / 1000.0,
+                                                                     results[name]['min_ns'] / 1000.0))
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(results, baseline, threshold, statistic='min_ns'):
+    """(kernel, baseline ns, current ns) of kernels which got slower by more than threshold (a fraction). The fastest
+    round is compared by default, it is the least disturbed by other load of the machine."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name in baseline and result[statistic] > baseline[name][statistic] * (1.0 + threshold):
+            regressions.append((name, baseline[name][statistic], result[statistic]))
+    return regressions
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    parser = argparse.ArgumentParser(prog='kernel benchmarks')
+    parser.add_argument('--stimulus', '-stm', help='quotient or numeric', type=str, default='quotient')
+    parser.add_argument('--max_num', '-mn', help='max number for numerics or max denominator for quotients', type=int,
+                        default=100)
+    parser.add_argument('--categories', '-c', help='categories of the synthetic agent', type=int, default=20)
+    parser.add_argument('--units', '-u', help='reactive units per category', type=int, default=3)
+    parser.add_argument('--lexicon', '-lx', help='words of the synthetic agent', type=int, default=30)
+    parser.add_argument('--repeat', '-rp', help='timed rounds per kernel', type=int, default=20)
+    parser.add_argument('--number', '-n', help='calls per round of fast kernels', type=int, default=200)
+    parser.add_argument('--seed', '-sd', help='seed of the synthetic agent', type=int, default=0)
+    parser.add_argument('--output', '-o', help='json file the results are written to', type=str)
+    parser.add_argument('--baseline', '-bl', help='json results (i.e. of another commit) to compare with', type=str)
+    parser.add_argument('--threshold', '-th', help='slowdown reported as regression', type=float, default=0.1)
+    parser.add_argument('--statistic', '-st', help='min_ns (fastest round) or median_ns compared with the baseline',
+                        type=str, default='min_ns', choices=['min_ns', 'median_ns'])
+
+    parsed_params = vars(parser.parse_args())
+    results = run_benchmarks(parsed_params)
+    report = {'commit': current_commit(), 'python': platform.python_version(), 'numpy': numpy.__version__,
+              'params': dict((key, parsed_params[key]) for key in ['stimulus', 'max_num', 'categories', 'units',
+                                                                    'lexicon', 'repeat', 'number', 'seed']),
+              'results': results}
+    if parsed_params['output']:
+        with open(parsed_params['output'], 'w') as write_handle:
+            json.dump(report, write_handle, indent=2, sort_keys=True)
+
+    if parsed_params['baseline']:
+        with open(parsed_params['baseline']) as read_handle:
+            baseline = json.load(read_handle)
+        if baseline['params'] != report['params']:
+            logging.warning("baseline was measured with other params {}".format(baseline['params']))
+        regressions = find_regressions(results, baseline['results'], parsed_params['threshold'],
+                                       parsed_params['statistic'])
+        for name, baseline_ns, current_ns in regressions:
+            logging.error("{} regressed from {:.1f}us to {:.1f}us".format(name, baseline_ns / 1000.0, current_ns / 1000.0))
+        if regressions:
+            sys.exit(1)
+        logging.info("no regressions over {:.0%} against {} ({})".format(parsed_params['threshold'],
+                                                                        parsed_params['baseline'], baseline['commit']))
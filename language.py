@@ -1,7 +1,8 @@
 from __future__ import division  # force python 3 division in python 2
-import logging
-from guessing_game_exceptions import NO_WORD_FOR_CATEGORY, NO_SUCH_WORD, ERROR, NO_ASSOCIATED_CATEGORIES
+from guessing_game_exceptions import ERROR, Outcome, OUTCOME_ERRORS
 from perception import Perception
+import phase_timer
+from phase_timer import FORGET_CATEGORIES
 from perception import Category
 from numpy import empty, array, minimum
 from numpy import column_stack
@@ -9,16 +10,21 @@ from numpy import zeros
 from numpy import row_stack
 from numpy import delete
 from numpy import divide
-from itertools import izip
+from random import choice
 
 # clone https://github.com/greghaskins/gibberish.git and run ~$ python setup.py install
 from gibberish import Gibberish
 
 class Language(Perception):
+    __slots__ = ('lexicon', 'lxc', 'stm', 'delta_inc', 'delta_dec', 'delta_inh', 'discriminative_threshold', 'alpha',
+                 'beta', 'super_alpha')
     gibberish = Gibberish()
+    # Gibberish draws letters with secrets.choice from hash ordered sets, which cannot be reproduced from a seed;
+    # words are drawn from the same (sorted) components with the random module instead
+    word_components = [sorted(gibberish.initial_consonants), sorted(gibberish.vowels), sorted(gibberish.final_consonants)]
 
     def __init__(self, params):
-        Perception.__init__(self)
+        Perception.__init__(self, params['success_window'])
         self.lexicon = []
         self.lxc = AssociativeMatrix()
         self.stm = params['stimulus']
@@ -31,7 +37,7 @@ class Language(Perception):
         self.super_alpha = params['super_alpha']
 
     def add_new_word(self):
-        new_word = Language.gibberish.generate_word()
+        new_word = ''.join(choice(letters) for letters in Language.word_components)
         self.add_word(new_word)
         return new_word
 
@@ -49,18 +55,23 @@ class Language(Perception):
         return self.lxc.col_count() - 1  # this is the index of the added category
 
     def update_category(self, i, stimulus):
-        logging.debug("updating category by adding reactive unit centered on %s" % stimulus)
         self.categories[i].add_reactive_unit(stimulus)
 
     def get_most_connected_word(self, category):
+        outcome, word = self.most_connected_word_outcome(category)
+        if outcome != Outcome.OK:
+            raise OUTCOME_ERRORS[outcome]
+        return word
+
+    def most_connected_word_outcome(self, category):
+        """Returns (outcome code, word), the word is None unless the outcome is OK."""
         if category is None:
             raise ERROR
 
         if not self.lexicon or all(v == 0.0 for v in self.lxc.get_row_by_col(category)):
-            raise NO_WORD_FOR_CATEGORY
-            # print("not words or all weights are zero")
+            return Outcome.NO_WORD_FOR_CATEGORY, None
 
-        return self.get_words_sorted_by_val(category)[0]
+        return Outcome.OK, self.get_words_sorted_by_val(category)[0]
 
     def get_words_sorted_by_val(self, category, threshold=-1):
         # https://stackoverflow.com/questions/1286167/is-the-order-of-results-coming-from-a-list-comprehension-guaranteed/1286180
@@ -79,20 +90,26 @@ class Language(Perception):
         return self.lxc.get_row_by_col(category)
 
     def get_most_connected_category(self, word):
+        outcome, category_index = self.most_connected_category_outcome(word)
+        if outcome != Outcome.OK:
+            raise OUTCOME_ERRORS[outcome]
+        return category_index
+
+    def most_connected_category_outcome(self, word):
+        """Returns (outcome code, category index), the index is None unless the outcome is OK."""
         if word is None:
             raise ERROR
 
         if word not in self.lexicon:
-            raise NO_SUCH_WORD
+            return Outcome.NO_SUCH_WORD, None
 
         category_index, max_propensity = self.get_categories_sorted_by_val(word)[0]
 
         # TODO still happens
         if max_propensity == 0:
-            logging.debug("\"%s\" has no associated categories" % word)
-            raise NO_ASSOCIATED_CATEGORIES
+            return Outcome.NO_ASSOCIATED_CATEGORIES, None
 
-        return category_index
+        return Outcome.OK, category_index
 
     def initialize_word2category_connection(self, word, category_index):
         word_index = self.lexicon.index(word)
@@ -139,12 +156,26 @@ class Language(Perception):
         self.lexicon = list(delete(self.lexicon, to_forget))
 
     def discrimination_game(self, context, topic):
+        outcome, category_index = self.discrimination_game_outcome(context, topic)
+        if outcome != Outcome.OK:
+            raise OUTCOME_ERRORS[outcome]
+        return category_index
+
+    def discrimination_game_outcome(self, context, topic):
+        """Returns (outcome code, index of the winning category), the index is None unless the outcome is OK."""
         self.store_ds_result(False)
-        winning_category = self.discriminate(context, topic)
+        outcome, winning_category = self.discriminate_outcome(context, topic)
+        if outcome != Outcome.OK:
+            return outcome, None
         winning_category.reinforce(context[topic], self.beta)
+        timer = phase_timer.timer
+        if timer is not None:
+            previous = timer.switch(FORGET_CATEGORIES)
         self.forget_categories(winning_category)
+        if timer is not None:
+            timer.switch(previous)
         self.switch_ds_result()
-        return self.categories.index(winning_category)
+        return Outcome.OK, self.categories.index(winning_category)
 
     def increment_word2category_connections_by_csimilarity(self, word, csimilarities):
         row = self.lexicon.index(word)
@@ -174,7 +205,7 @@ class Language(Perception):
     def semantic_meaning(self, word, stimuli):
         word_index = self.lexicon.index(word)
         activations = [sum([float(c.response(s) > 0.0) * float(self.lxc.get_value(word_index, self.categories.index(c)) > 0.0) for c in self.categories]) for s in stimuli]
-        flat_bool_activations = map(lambda x: int(x > 0.0), activations)
+        flat_bool_activations = [int(x > 0.0) for x in activations]
         mean_bool_activations = []
         for i in range(0, len(flat_bool_activations)):
             window = flat_bool_activations[max(0, i - 5):min(len(flat_bool_activations), i + 5)]
@@ -186,7 +217,7 @@ class Language(Perception):
 
     def is_monotone(self, word, stimuli):
         bool_activations = self.semantic_meaning(word, stimuli)
-        alt = len([a for a, aa in izip(bool_activations, bool_activations[1:]) if a != aa])
+        alt = len([a for a, aa in zip(bool_activations, bool_activations[1:]) if a != aa])
         return alt == 1
 
 
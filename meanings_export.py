@@ -0,0 +1,86 @@
+import logging
+import threading
+
+import h5py
+from numpy import asarray
+
+from derived_metrics import CachedStepSamples
+
+# word id of stimuli an agent has no word for ("?")
+NO_WORD = 0
+# word id of cells not written (i.e. steps a run did not reach)
+MISSING = -1
+
+
+class MeaningsExport(CachedStepSamples):
+    """Streams the meanings (best matching word of every stimulus) of every agent at the steps into a hdf5 file, a
+    (run, step) is written as soon as its values are taken.
+
+    The file holds the int32 dataset meanings of word ids (runs x steps x agents x stimuli), resizable along runs and
+    steps, chunked per (run, step) and compressed, the string table words (id -> word, words[0] is "?") appended as
+    new words come, and the asked steps. Meanings are cached as other derived metrics (see DerivedMetricsCache)."""
+
+    def __init__(self, hdf_path, steps, cache, compression='gzip', compression_level=4):
+        CachedStepSamples.__init__(self, steps, cache, 'meanings', None)
+        self.hdf_path = hdf_path
+        self.compression = compression
+        self.compression_level = compression_level
+        self.step_indices = dict((step, index) for index, step in enumerate(steps))
+        self.word_ids = {'?': NO_WORD}
+        self.hdf = None
+        self.written = 0
+        # values are taken in the scanning thread and in the result thread of the metrics pool
+        self.lock = threading.Lock()
+
+    def open(self, agents, stimuli):
+        self.hdf = h5py.File(str(self.hdf_path), 'w')
+        self.meanings = self.hdf.create_dataset('meanings', shape=(0, len(self.steps), agents, stimuli),
+                                                maxshape=(None, None, agents, stimuli), chunks=(1, 1, agents, stimuli),
+                                                dtype='int32', fillvalue=MISSING, compression=self.compression,
+                                                compression_opts=self.compression_level, shuffle=True)
+        self.words = self.hdf.create_dataset('words', shape=(1,), maxshape=(None,), chunks=(1024,),
+                                             dtype=h5py.string_dtype('utf-8'))
+        self.words[0] = '?'
+        self.hdf.create_dataset('steps', data=asarray(self.steps, dtype='int32'))
+        self.meanings.attrs['no_word'] = NO_WORD
+        self.meanings.attrs['missing'] = MISSING
+
+    def ids(self, words):
+        new_words = []
+        ids = []
+        for word in words:
+            if word not in self.word_ids:
+                self.word_ids[word] = len(self.word_ids)
+                new_words.append(word)
+            ids.append(self.word_ids[word])
+        if new_words:
+            self.words.resize((len(self.word_ids),))
+            self.words[len(self.word_ids) - len(new_words):] = new_words
+        return ids
+
+    def take(self, run, step, values):
+        with self.lock:
+            if self.hdf is None:
+                self.open(len(values), len(values[0]))
+            if run >= self.meanings.shape[0]:
+                self.meanings.resize(run + 1, axis=0)
+            self.meanings[run, self.step_indices[step]] = asarray([self.ids(words) for words in values],
+                                                                   dtype='int32')
+            self.written += 1
+
+    def finalize(self):
+        CachedStepSamples.finalize(self)
+        if self.hdf is not None:
+            self.hdf.close()
+            self.hdf = None
+        logging.debug("exported {} steps of meanings with {} words to {}".format(self.written, len(self.word_ids),
+                                                                               self.hdf_path))
+
+
+def read_meanings(hdf_path, run):
+    """Meanings of the run as words, steps x agents x stimuli, as the former per run datasets of m.h5."""
+    with h5py.File(str(hdf_path), 'r') as hdf:
+        words = asarray([word.decode('utf-8') if isinstance(word, bytes) else word for word in hdf['words'][:]] +
+                        [''], dtype=object)
+        # missing cells (-1) map to the trailing empty word
+        return words[hdf['meanings'][run]]
@@ -0,0 +1,95 @@
+import os
+
+from numpy import dtype, zeros, fromfile, concatenate, full, arange
+
+from guessing_game_exceptions import GAME_OUTCOMES
+from record_file import RECORD_FILE_HEADER, RecordFormatError, write_record_header, read_record_header
+
+# one record per simulation step, success values are population means in percents, lexicon is the mean lexicon size,
+# followed by the number of games of the step which ended with each outcome (see guessing_game_exceptions.Outcome)
+METRICS_DTYPE = dtype([('step', '<i4'), ('ds', '<f4'), ('cs1', '<f4'), ('cs2', '<f4'), ('cs12', '<f4'),
+                       ('lexicon', '<f4')] + [(outcome, '<i4') for outcome in GAME_OUTCOMES])
+# a metrics file starts with a header (see record_file.py)
+METRICS_MAGIC = b'CQMETRIC'
+METRICS_VERSION = 1
+METRICS_HEADER = RECORD_FILE_HEADER
+MetricsFormatError = RecordFormatError
+
+
+def write_header(write_handle):
+    write_record_header(write_handle, METRICS_MAGIC, METRICS_VERSION, len(METRICS_DTYPE.names))
+
+
+class MetricsRecorder:
+    """Records per step population metrics into a preallocated array and appends them to a binary log."""
+
+    def __init__(self, metrics_path, steps, flush_every=100):
+        self.metrics_path = str(metrics_path)
+        self.records = zeros(max(steps, 1), dtype=METRICS_DTYPE)
+        self.flush_every = flush_every
+        self.count = 0
+        self.flushed = 0
+
+    def record(self, step, population):
+        if self.count == len(self.records):
+            self.flush()
+            self.count = self.flushed = 0
+        self.records[self.count] = (step, population.ds, population.cs1, population.cs2, population.cs12,
+                                    population.lexicon_size) + tuple(population.outcome_counts)
+        self.count += 1
+        if self.count - self.flushed >= self.flush_every:
+            self.flush()
+        return self.records[self.count - 1]
+
+    def flush(self):
+        if self.count == self.flushed:
+            return
+        with open(self.metrics_path, 'ab') as write_handle:
+            if write_handle.tell() == 0:
+                write_header(write_handle)
+            self.records[self.flushed:self.count].tofile(write_handle)
+            write_handle.flush()
+            os.fsync(write_handle.fileno())
+        self.flushed = self.count
+
+    def close(self):
+        self.flush()
+
+
+def read_metrics(metrics_path):
+    with open(str(metrics_path), 'rb') as read_handle:
+        if not read_record_header(read_handle, metrics_path, METRICS_MAGIC, METRICS_VERSION, len(METRICS_DTYPE.names),
+                                  'metrics'):
+            return zeros(0, dtype=METRICS_DTYPE)
+        return fromfile(read_handle, dtype=METRICS_DTYPE)
+
+
+def truncate_metrics(metrics_path, last_step):
+    """Drops records of steps after last_step (written before a run was interrupted), returns the kept records."""
+    metrics_path = str(metrics_path)
+    if not os.path.exists(metrics_path):
+        return zeros(0, dtype=METRICS_DTYPE)
+    records = read_metrics(metrics_path)
+    records = records[records['step'] <= last_step]
+    with open(metrics_path, 'wb') as write_handle:
+        write_header(write_handle)
+        records.tofile(write_handle)
+    return records
+
+
+def metrics_of_history(history):
+    """Records of the metric histories ({metric: values of every step}) kept by populations pickled before the metrics
+    file, fields without a history are 0."""
+    length = max(len(values) for values in history.values())
+    records = zeros(length, dtype=METRICS_DTYPE)
+    records['step'] = arange(length)
+    for metric, values in history.items():
+        records[metric][:len(values)] = values
+    return records
+
+
+def carry_forward(values, length):
+    """Pads the series of a run which stopped early with its last value."""
+    if len(values) >= length:
+        return values[:length]
+    return concatenate((values, full(length - len(values), values[-1] if len(values) else 0.0, dtype=values.dtype)))
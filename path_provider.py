@@ -28,6 +28,27 @@ class PathProvider:
     def get_simulation_step_path(self, step):
         return self.data_path.joinpath('step{}.p'.format(step))
 
+    def get_archive_path(self):
+        return self.root_path.joinpath('steps.pack')
+
+    def get_metrics_path(self):
+        return self.root_path.joinpath('metrics.bin')
+
+    def get_events_path(self):
+        return self.root_path.joinpath('events.bin')
+
+    def get_event_words_path(self):
+        return self.root_path.joinpath('event_words.bin')
+
+    def get_timings_path(self):
+        return self.root_path.joinpath('timings.bin')
+
+    def get_profile_path(self, first, last):
+        return self.root_path.joinpath('profile{}-{}.pstats'.format(first, last))
+
+    def get_stop_path(self):
+        return self.root_path.joinpath('stop.p')
+
     def get_simulation_params_path(self):
         return self.root_path.joinpath('params.p')
 
@@ -2,18 +2,29 @@ from __future__ import division  # force python 3 division in python 2
 
 import matplotlib.pyplot as plt
 
-from guessing_game_exceptions import NO_NOTICEABLE_DIFFERENCE, NO_CATEGORY, NO_DISCRIMINATION
-from collections import deque
+from guessing_game_exceptions import Outcome, OUTCOME_ERRORS
+from success_window import SuccessWindow, WINDOW, as_success_window
+from slotted import Slotted, slot_state
 from inmemory_calculus import inmem
 import numpy as np
 from random import choice
 
-class Category:
+class Category(Slotted):
+    __slots__ = ('id', '__weights', '__reactive_indicies')
+
     def __init__(self, id):
         self.id = id
         self.__weights = []
         self.__reactive_indicies = []
 
+    @staticmethod
+    def of_reactive_units(id, indices, weights):
+        """Category with reactive units of the given stimulus indices and weights (see reactive_units)."""
+        category = Category(id)
+        category.__reactive_indicies = indices
+        category.__weights = weights
+        return category
+
     def response(self, stimulus, REACTIVE_X_REACTIVE=None):
         if REACTIVE_X_REACTIVE is None:
             REACTIVE_X_REACTIVE = inmem['REACTIVE_X_REACTIVE']
@@ -42,6 +53,10 @@ class Category:
     def max_weigth(self):
         return max(self.__weights)
 
+    def reactive_units(self):
+        # (stimulus index, weight) pairs
+        return list(zip(self.__reactive_indicies, self.__weights))
+
     def discretized_distribution(self, REACTIVE_UNIT_DIST=None):
         return self.__apply_fun_to_coordinates(lambda x: np.sum(x, axis=0), REACTIVE_UNIT_DIST)
 
@@ -63,32 +78,38 @@ class Category:
         plt.show()
 
 
-class Perception:
+class Perception(Slotted):
+    __slots__ = ('categories', 'ds_scores', '_id_')
+
     class Result:
         SUCCESS = 1
         FAILURE = 0
 
-    def __init__(self):
+    def __init__(self, window=WINDOW):
         self.categories = []
-        self.ds_scores = deque([0])
+        self.ds_scores = SuccessWindow(window)
         self._id_ = 0
-        self.discriminative_success = 0.0
+
+    def __setstate__(self, state):
+        state = slot_state(state)
+        # perceptions pickled before success windows kept the success next to a deque of results
+        state.pop('discriminative_success', None)
+        state['ds_scores'] = as_success_window(state['ds_scores'])
+        Slotted.__setstate__(self, state)
+
+    @property
+    def discriminative_success(self):
+        return self.ds_scores.mean()
 
     def get_cat_id(self):
         self._id_ = self._id_ + 1
         return self._id_ - 1
 
     def store_ds_result(self, result):
-        if len(self.ds_scores) == 50:
-            self.ds_scores.rotate(-1)
-            self.ds_scores[-1] = result
-        else:
-            self.ds_scores.append(result)
-        self.discriminative_success = sum(self.ds_scores) / len(self.ds_scores)
+        self.ds_scores.store(result)
 
     def switch_ds_result(self):
-        self.ds_scores[-1] = 1 - self.ds_scores[-1]
-        self.discriminative_success = sum(self.ds_scores) / len(self.ds_scores)
+        self.ds_scores.switch_last()
 
     def get_best_matching_category(self, stimulus):
         responses = [c.response(stimulus) for c in self.categories]
@@ -100,37 +121,27 @@ class Perception:
         return max_args[0]
 
     def discriminate(self, context, topic):
+        outcome, category = self.discriminate_outcome(context, topic)
+        if outcome != Outcome.OK:
+            raise OUTCOME_ERRORS[outcome]
+        return category
+
+    def discriminate_outcome(self, context, topic):
+        """Returns (outcome code, winning category), the category is None unless the outcome is OK."""
         if not self.categories:
-            # self.store_ds_result(Perception.Result.FAILURE)
-            raise NO_CATEGORY
+            return Outcome.NO_CATEGORY, None
 
         s1, s2 = context[0], context[1]
 
         # TODO do wywalnie prawdopodobnie, ze wzgledu na sposob generowania kontekstow
         if not s1.is_noticeably_different_from(s2):
-            # self.store_ds_result(Perception.Result.FAILURE)
-            raise NO_NOTICEABLE_DIFFERENCE
+            return Outcome.NO_NOTICEABLE_DIFFERENCE, None
 
         i = self.get_best_matching_category(s1)
         j = self.get_best_matching_category(s2)
-        # TODO discuss
-        #if max1 == 0.0:
-        #    # self.store_ds_result(Perception.Result.FAILURE)
-        #    raise NO_POSITIVE_RESPONSE_1
-
-        #if max2 == 0.0:
-        #    # self.store_ds_result(Perception.Result.FAILURE)
-        #    raise NO_POSITIVE_RESPONSE_2
-
-        #if len(max_args1) > 1 or len(max_args2) > 1:
-        #    raise Exception("Two categories give the same maximal value for stimulus")
 
         if i == j:
-            raise NO_DISCRIMINATION
-            # self.store_ds_result(Perception.Result.FAILURE)
-            #raise NO_DISCRIMINATION_LOWER_1(i) if max1 < max2 else \
-            #    NO_DISCRIMINATION_LOWER_2(i)
+            return Outcome.NO_DISCRIMINATION, None
 
         # discrimination successful
-        # self.store_ds_result(Perception.Result.SUCCESS)
-        return self.categories[i] if topic == 0 else self.categories[j]
\ No newline at end of file
+        return Outcome.OK, self.categories[i] if topic == 0 else self.categories[j]
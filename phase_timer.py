@@ -0,0 +1,165 @@
+import argparse
+import cProfile
+import logging
+import os
+import sys
+from pathlib import Path
+from time import perf_counter_ns
+
+from numpy import dtype, zeros, fromfile, percentile
+
+from path_provider import PathProvider
+from record_file import write_record_header, read_record_header
+
+# phases of a step, time outside of the other phases (pair selection, contexts, engines which play a round at once)
+# counts to round; forget_categories is split off discrimination
+PHASES = ['round', 'discrimination', 'forget_categories', 'naming', 'association', 'forget_words', 'metrics',
+          'snapshot']
+ROUND, DISCRIMINATION, FORGET_CATEGORIES, NAMING, ASSOCIATION, FORGET_WORDS, METRICS, SNAPSHOT = range(len(PHASES))
+
+# one record per simulation step, nanoseconds spent in every phase, behind a header (see record_file.py)
+TIMINGS_DTYPE = dtype([('step', '<i4')] + [(phase, '<i8') for phase in PHASES])
+TIMINGS_MAGIC = b'CQTIMING'
+TIMINGS_VERSION = 1
+
+# timer of the run played in this process, None unless it runs with --timings; games and languages switch it
+timer = None
+
+
+class PhaseTimer:
+    """Attributes wall time to the phase the run is in. A phase lasts until the next switch, nested phases switch
+    back to the phase they interrupted, so every nanosecond is counted once. Totals of a step are appended to a
+    binary log."""
+
+    def __init__(self, timings_path, steps, flush_every=100):
+        self.timings_path = str(timings_path)
+        self.records = zeros(max(steps, 1), dtype=TIMINGS_DTYPE)
+        self.flush_every = flush_every
+        self.count = 0
+        self.flushed = 0
+        self.reset()
+
+    def reset(self):
+        """Drops time measured so far in the step (i.e. spent on setting up the run)."""
+        self.totals = [0] * len(PHASES)
+        self.phase = ROUND
+        self.last = perf_counter_ns()
+
+    def switch(self, phase):
+        """Enters the phase, returns the one left."""
+        now = perf_counter_ns()
+        self.totals[self.phase] += now - self.last
+        self.last = now
+        previous = self.phase
+        self.phase = phase
+        return previous
+
+    def end_step(self, step):
+        self.switch(ROUND)
+        if self.count == len(self.records):
+            self.flush()
+            self.count = self.flushed = 0
+        self.records[self.count] = (step,) + tuple(self.totals)
+        self.count += 1
+        self.totals = [0] * len(PHASES)
+        if self.count - self.flushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.count == self.flushed:
+            return
+        with open(self.timings_path, 'ab') as write_handle:
+            if write_handle.tell() == 0:
+                write_timings_header(write_handle)
+            self.records[self.flushed:self.count].tofile(write_handle)
+        self.flushed = self.count
+
+    def close(self):
+        self.flush()
+
+
+class StepProfiler:
+    """Profiles steps first..last (inclusive) with cProfile and dumps pstats to the given path."""
+
+    def __init__(self, first, last, profile_path):
+        self.first = first
+        self.last = last
+        self.profile_path = str(profile_path)
+        self.profile = None
+
+    @staticmethod
+    def parse(step_range):
+        """Parses first:last (or a single step)."""
+        first, _, last = step_range.partition(':')
+        return int(first), int(last or first)
+
+    def start_step(self, step):
+        if self.profile is None and self.first <= step <= self.last:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def end_step(self, step):
+        if self.profile is not None and step >= self.last:
+            self.close()
+
+    def close(self):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.profile.dump_stats(self.profile_path)
+        self.profile = None
+        logging.info("profile of steps {}-{} dumped to {}".format(self.first, self.last, self.profile_path))
+
+
+def write_timings_header(write_handle):
+    write_record_header(write_handle, TIMINGS_MAGIC, TIMINGS_VERSION, len(TIMINGS_DTYPE.names))
+
+
+def read_timings(timings_path):
+    with open(str(timings_path), 'rb') as read_handle:
+        if not read_record_header(read_handle, timings_path, TIMINGS_MAGIC, TIMINGS_VERSION, len(TIMINGS_DTYPE.names),
+                                  'timings'):
+            return zeros(0, dtype=TIMINGS_DTYPE)
+        return fromfile(read_handle, dtype=TIMINGS_DTYPE)
+
+
+def truncate_timings(timings_path, last_step):
+    """Drops records of steps after last_step (timed before a run was interrupted)."""
+    timings_path = str(timings_path)
+    if not os.path.exists(timings_path):
+        return
+    records = read_timings(timings_path)
+    with open(timings_path, 'wb') as write_handle:
+        write_timings_header(write_handle)
+        records[records['step'] <= last_step].tofile(write_handle)
+
+
+def summarize_timings(records):
+    """Lines with steps/sec and per phase total, share and percentiles of step times."""
+    if not len(records):
+        return ['no timed steps']
+    step_times = sum(records[phase] for phase in PHASES)
+    total = step_times.sum()
+    lines = ['{} steps in {:.3f}sec, {:.2f} steps/sec, step p50 {:.3f}ms p90 {:.3f}ms p99 {:.3f}ms'.format(
+        len(records), total / 1e9, len(records) / (total / 1e9),
+        *[percentile(step_times, q) / 1e6 for q in (50, 90, 99)])]
+    for phase in PHASES:
+        lines.append('{:>18} {:10.3f}sec {:6.2f}%  p50 {:9.3f}ms p90 {:9.3f}ms p99 {:9.3f}ms'.format(
+            phase, records[phase].sum() / 1e9, 100.0 * records[phase].sum() / total,
+            *[percentile(records[phase], q) / 1e6 for q in (50, 90, 99)]))
+    return lines
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    parser = argparse.ArgumentParser(prog='step timings summary')
+    parser.add_argument('simulation_root', help='simulation root with run[0-9]* directories or a single run directory',
+                        type=str)
+
+    parsed_params = vars(parser.parse_args())
+    root_path = Path(parsed_params['simulation_root'])
+    for run_path in sorted(root_path.glob('run[0-9]*')) or [root_path]:
+        timings_path = PathProvider.new_path_provider(run_path).get_timings_path()
+        if timings_path.exists():
+            print(run_path.name)
+            print('\n'.join(summarize_timings(read_timings(timings_path))))
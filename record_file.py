@@ -0,0 +1,31 @@
+import struct
+
+# binary record files of a run (metrics, game events and their words, step timings) start with the magic of their
+# kind, the version of their format and the number of fields of their records, so that files of older versions or
+# of another record layout are rejected instead of misread
+RECORD_FILE_HEADER = struct.Struct('<8sII')
+
+
+class RecordFormatError(Exception):
+    pass
+
+
+def write_record_header(write_handle, magic, version, fields):
+    write_handle.write(RECORD_FILE_HEADER.pack(magic, version, fields))
+
+
+def read_record_header(read_handle, path, magic, version, fields, kind):
+    """Checks the header of the record file of the given kind (i.e. 'metrics'), returns False if the file is empty.
+    Raises RecordFormatError naming the file if it has no or another header."""
+    header = read_handle.read(RECORD_FILE_HEADER.size)
+    if not header:
+        return False
+    if len(header) < RECORD_FILE_HEADER.size:
+        raise RecordFormatError('{} is not a {} file'.format(path, kind))
+    file_magic, file_version, file_fields = RECORD_FILE_HEADER.unpack(header)
+    if file_magic != magic:
+        raise RecordFormatError('{} is not a {} file or was written by an older version'.format(path, kind))
+    if file_version != version or file_fields != fields:
+        raise RecordFormatError('{} has version {} with {} fields, expected version {} with {} fields'.format(
+            path, file_version, file_fields, version, fields))
+    return True
@@ -0,0 +1,366 @@
+import argparse
+import bisect
+import logging
+import lzma
+import os
+import pickle
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+from path_provider import PathProvider
+
+# Layout of a run archive:
+#   ARCHIVE_MAGIC
+#   record*        - RECORD_HEADER, key (utf-8), compressed payload
+#   index          - zlib compressed pickle of {key: record offset}
+#   FOOTER         - index offset, index length, crc32 of index, FOOTER_MAGIC
+# Records are only ever appended; the index is rewritten behind the last record on every flush.
+# Until the archive is closed, every record is also appended to its journal (archive path + '.journal'):
+#   JOURNAL_MAGIC
+#   entry*         - JOURNAL_ENTRY (record offset, record end, key length), key (utf-8)
+# so that archives of live or killed writers are opened without scanning all of their records.
+ARCHIVE_MAGIC = b'CQARCH01'
+FOOTER_MAGIC = b'CQINDEX1'
+RECORD_MAGIC = b'CQRC'
+RECORD_HEADER = struct.Struct('<4sBHII')  # magic, compression, key length, payload length, payload crc32
+FOOTER = struct.Struct('<QII8s')
+JOURNAL_MAGIC = b'CQJRNL01'
+JOURNAL_ENTRY = struct.Struct('<QQH')
+
+COMPRESSIONS = {'none': 0, 'zlib': 1, 'lzma': 2}
+
+
+def compress(data, compression):
+    if compression == 1:
+        return zlib.compress(data, 6)
+    if compression == 2:
+        return lzma.compress(data)
+    return data
+
+
+def decompress(data, compression):
+    if compression == 1:
+        return zlib.decompress(data)
+    if compression == 2:
+        return lzma.decompress(data)
+    return data
+
+
+def step_key(step):
+    return 'step{}'.format(step)
+
+
+class RunArchiveError(Exception):
+    pass
+
+
+def read_index(read_handle):
+    """Returns (index, end of records); the end is None if the archive has no valid trailing index."""
+    read_handle.seek(0, os.SEEK_END)
+    size = read_handle.tell()
+    if size < len(ARCHIVE_MAGIC) + FOOTER.size:
+        return None, None
+    read_handle.seek(size - FOOTER.size)
+    index_offset, index_length, index_crc, magic = FOOTER.unpack(read_handle.read(FOOTER.size))
+    if magic != FOOTER_MAGIC or index_offset + index_length + FOOTER.size != size:
+        return None, None
+    read_handle.seek(index_offset)
+    index_blob = read_handle.read(index_length)
+    if zlib.crc32(index_blob) & 0xffffffff != index_crc:
+        return None, None
+    return pickle.loads(zlib.decompress(index_blob)), index_offset
+
+
+def scan_records(read_handle, index=None, offset=None):
+    """Rebuilds the index of an archive which was not closed (i.e. the writer was killed mid-write), continuing the
+    index from offset, the end of its records, if given.
+
+    Returns (index, end of the last complete record)."""
+    if offset is None:
+        read_handle.seek(0)
+        if read_handle.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise RunArchiveError('not a run archive')
+        index, offset = {}, len(ARCHIVE_MAGIC)
+    read_handle.seek(offset)
+    while True:
+        header = read_handle.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            break
+        magic, compression, key_length, payload_length, payload_crc = RECORD_HEADER.unpack(header)
+        if magic != RECORD_MAGIC:
+            break
+        key = read_handle.read(key_length)
+        payload = read_handle.read(payload_length)
+        if len(key) < key_length or len(payload) < payload_length or zlib.crc32(payload) & 0xffffffff != payload_crc:
+            break
+        index[key.decode('utf-8')] = offset
+        offset += RECORD_HEADER.size + key_length + payload_length
+    return index, offset
+
+
+def journal_path(archive_path):
+    return str(archive_path) + '.journal'
+
+
+def read_journal(archive_path, archive_size):
+    """Returns (index, end of records) of the journal entries of records within the archive size, (None, None) without
+    a journal."""
+    try:
+        with open(journal_path(archive_path), 'rb') as read_handle:
+            journal = read_handle.read()
+    except FileNotFoundError:
+        return None, None
+    if not journal.startswith(JOURNAL_MAGIC):
+        return None, None
+    index, end = {}, len(ARCHIVE_MAGIC)
+    position = len(JOURNAL_MAGIC)
+    while position + JOURNAL_ENTRY.size <= len(journal):
+        offset, record_end, key_length = JOURNAL_ENTRY.unpack_from(journal, position)
+        key = journal[position + JOURNAL_ENTRY.size:position + JOURNAL_ENTRY.size + key_length]
+        # a torn entry, or a record the writer did not get to write
+        if len(key) < key_length or record_end > archive_size:
+            break
+        index[key.decode('utf-8')] = offset
+        end = max(end, record_end)
+        position += JOURNAL_ENTRY.size + key_length
+    return index, end
+
+
+def recover_index(read_handle, archive_path):
+    """Index and end of records of an archive without a valid trailing index, taken from its journal; only records
+    behind the last journaled one are scanned."""
+    read_handle.seek(0, os.SEEK_END)
+    index, end = read_journal(archive_path, read_handle.tell())
+    if index is None:
+        return scan_records(read_handle)
+    return scan_records(read_handle, index, end)
+
+
+class RunArchive:
+    """Append-only container for all step records of a run.
+
+    Opening an existing archive continues it: a missing or torn index (the writer did not close the archive)
+    is rebuilt from the journal and the complete records behind it. Every record is flushed and journaled as it is
+    put, the journal is removed once the archive is closed with its index. Implements the sink interface expected
+    by SnapshotWriter."""
+
+    def __init__(self, archive_path, compression='zlib'):
+        self.archive_path = str(archive_path)
+        self.compression = COMPRESSIONS[compression]
+        if os.path.exists(self.archive_path):
+            self.handle = open(self.archive_path, 'r+b')
+            self.index, self.end = read_index(self.handle)
+            if self.index is None:
+                logging.warning('run archive %s was not closed, recovering its records' % self.archive_path)
+                self.index, self.end = recover_index(self.handle, self.archive_path)
+        else:
+            self.handle = open(self.archive_path, 'w+b')
+            self.handle.write(ARCHIVE_MAGIC)
+            self.index, self.end = {}, len(ARCHIVE_MAGIC)
+        self.indexed = False
+        # journal of the records so far, in offset order, a record ends at most where the next one starts
+        self.journal = open(journal_path(self.archive_path), 'wb')
+        self.journal.write(JOURNAL_MAGIC)
+        records = sorted(self.index.items(), key=lambda item: item[1])
+        for (key, offset), end in zip(records, [offset for _, offset in records[1:]] + [self.end]):
+            self.journal_record(key, offset, end)
+        self.journal.flush()
+
+    def journal_record(self, key, offset, end):
+        key_bytes = key.encode('utf-8')
+        self.journal.write(JOURNAL_ENTRY.pack(offset, end, len(key_bytes)))
+        self.journal.write(key_bytes)
+
+    def put(self, key, data):
+        payload = compress(data, self.compression)
+        key_bytes = key.encode('utf-8')
+        # drop the index written by the previous flush before appending behind the last record
+        self.handle.seek(self.end)
+        self.handle.truncate()
+        self.handle.write(RECORD_HEADER.pack(RECORD_MAGIC, self.compression, len(key_bytes), len(payload),
+                                             zlib.crc32(payload) & 0xffffffff))
+        self.handle.write(key_bytes)
+        self.handle.write(payload)
+        # the record reaches the file before its journal entry
+        self.handle.flush()
+        self.index[key] = self.end
+        self.journal_record(key, self.end, self.handle.tell())
+        self.journal.flush()
+        self.end = self.handle.tell()
+        self.indexed = False
+
+    def write(self, step, payload):
+        self.put(step_key(step), payload)
+
+    def flush(self):
+        if not self.indexed:
+            index_blob = zlib.compress(pickle.dumps(self.index, protocol=2))
+            self.handle.seek(self.end)
+            self.handle.truncate()
+            self.handle.write(index_blob)
+            self.handle.write(FOOTER.pack(self.end, len(index_blob), zlib.crc32(index_blob) & 0xffffffff, FOOTER_MAGIC))
+            self.indexed = True
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def close(self):
+        if self.handle is not None:
+            self.flush()
+            self.handle.close()
+            self.handle = None
+            self.journal.close()
+            os.remove(journal_path(self.archive_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RunArchiveReader:
+    """Random access to the records of a run archive, every read seeks straight to the indexed offset."""
+
+    def __init__(self, archive_path):
+        self.archive_path = str(archive_path)
+        with open(self.archive_path, 'rb') as read_handle:
+            self.index, _ = read_index(read_handle)
+            if self.index is None:
+                self.index, _ = recover_index(read_handle, self.archive_path)
+
+    def keys(self):
+        return self.index.keys()
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, key):
+        if key not in self.index:
+            raise KeyError(key)
+        # opened per read, so that a reader may be shared with forked processes
+        with open(self.archive_path, 'rb') as read_handle:
+            read_handle.seek(self.index[key])
+            magic, compression, key_length, payload_length, payload_crc = RECORD_HEADER.unpack(
+                read_handle.read(RECORD_HEADER.size))
+            read_handle.seek(key_length, os.SEEK_CUR)
+            payload = read_handle.read(payload_length)
+        if magic != RECORD_MAGIC or zlib.crc32(payload) & 0xffffffff != payload_crc:
+            raise RunArchiveError('corrupted record {} in {}'.format(key, self.archive_path))
+        return decompress(payload, compression)
+
+    def steps(self):
+        return sorted(int(key[len('step'):]) for key in self.index if key.startswith('step'))
+
+    def read_step(self, step):
+        return self.get(step_key(step))
+
+    def record_checksum(self, key):
+        """(payload length, payload crc) from the record header, without reading the payload."""
+        with open(self.archive_path, 'rb') as read_handle:
+            read_handle.seek(self.index[key])
+            _, _, _, payload_length, payload_crc = RECORD_HEADER.unpack(read_handle.read(RECORD_HEADER.size))
+        return payload_length, payload_crc
+
+
+class RunSnapshots:
+    """Snapshots of a single run, read from the run archive if there is one, from data/stepN.p files otherwise."""
+
+    def __init__(self, path_provider):
+        self.path_provider = path_provider
+        archive_path = path_provider.get_archive_path()
+        self.archive = RunArchiveReader(archive_path) if archive_path.exists() else None
+
+    def steps(self):
+        if self.archive is not None:
+            return self.archive.steps()
+        return sorted(int(path.name[len('step'):-len('.p')]) for path in self.path_provider.get_data_paths())
+
+    def read(self, step):
+        if self.archive is not None:
+            return self.archive.read_step(step)
+        with self.path_provider.get_simulation_step_path(step).open('rb') as read_handle:
+            return read_handle.read()
+
+    def snapshot_key(self, step):
+        """Identifies the content of a snapshot (for caches of values derived from it): the size and crc of its
+        archive record or the size and modification time of its step file."""
+        if self.archive is not None:
+            return (step, 'crc') + self.archive.record_checksum(step_key(step))
+        stat = os.stat(str(self.path_provider.get_simulation_step_path(step)))
+        return step, 'mtime', stat.st_size, stat.st_mtime_ns
+
+    def load(self, step):
+        snapshot = self.load_snapshot(step)
+        return snapshot[0], snapshot[1]
+
+    def load_at_or_before(self, step):
+        """Loads the given step or, for a run stopped before it, the last step of the run."""
+        return self.load(step_at_or_before(self.steps(), step))
+
+    def load_snapshot(self, step):
+        """Returns (step, population, rng state), rng state is None for snapshots which do not carry it."""
+        return self.unpickle(self.read(step))
+
+    @staticmethod
+    def unpickle(data):
+        """(step, population, rng state) of the bytes of a snapshot (see load_snapshot)."""
+        snapshot = pickle.loads(data)
+        return snapshot if len(snapshot) == 3 else (snapshot[0], snapshot[1], None)
+
+    def load_latest_snapshot(self):
+        """Returns the latest snapshot which can be read completely or None if there is no such snapshot."""
+        for step in reversed(self.steps()):
+            try:
+                return self.load_snapshot(step)
+            except Exception as e:
+                logging.warning("skipping incomplete snapshot of step %d in %s: %s" % (step, self.path_provider.root_path, e))
+        return None
+
+
+def step_at_or_before(steps, step):
+    """The last of the (sorted) snapshot steps not after step, the first one if all are after it."""
+    return steps[max(bisect.bisect_right(steps, step) - 1, 0)]
+
+
+__run_snapshots = {}
+
+
+def open_run_snapshots(run_path):
+    """Returns (cached) snapshots of the run rooted at run_path."""
+    key = str(run_path)
+    if key not in __run_snapshots:
+        __run_snapshots[key] = RunSnapshots(PathProvider.new_path_provider(run_path))
+    return __run_snapshots[key]
+
+
+def convert_run_directory(run_path, compression='zlib', remove=False):
+    """Packs data/stepN.p files of a run into the run archive."""
+    path_provider = PathProvider.new_path_provider(run_path)
+    step_paths = sorted(path_provider.get_data_paths(), key=lambda path: int(path.name[len('step'):-len('.p')]))
+    with RunArchive(path_provider.get_archive_path(), compression) as archive:
+        for step_path in step_paths:
+            step = int(step_path.name[len('step'):-len('.p')])
+            with step_path.open('rb') as read_handle:
+                archive.write(step, read_handle.read())
+    if remove:
+        for step_path in step_paths:
+            os.remove(str(step_path))
+    logging.debug("packed %d steps of %s" % (len(step_paths), run_path))
+    return len(step_paths)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+    parser = argparse.ArgumentParser(prog='run archive converter')
+    parser.add_argument('simulation_root', help='simulation root with run[0-9]* directories or a single run directory',
+                        type=str)
+    parser.add_argument('--compression', '-c', help='none, zlib or lzma', type=str, default='zlib')
+    parser.add_argument('--remove', '-rm', help='remove step files after packing them', type=bool, default=False)
+
+    parsed_params = vars(parser.parse_args())
+    root_path = Path(parsed_params['simulation_root'])
+    run_paths = sorted(root_path.glob('run[0-9]*')) or [root_path]
+    for run_path in run_paths:
+        convert_run_directory(run_path, parsed_params['compression'], parsed_params['remove'])
@@ -0,0 +1,136 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from inmemory_calculus import generate_inmemory_calculus, save_inmemory_calculus
+from kernel_benchmark import current_commit
+from path_provider import PathProvider
+from phase_timer import PHASES, read_timings
+
+SIMULATION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulation.py')
+
+
+def config_name(config):
+    return '{stimulus}_mn{max_num}_p{population_size}_gg{guessing_game_2}'.format(**config)
+
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+def run_config(config, params, calculus_path, simulation_path):
+    """Runs a single headless simulation of the config, returns its measurements."""
+    args = [sys.executable, SIMULATION_SCRIPT, '-sn', simulation_path, '-p', str(config['population_size']),
+            '-stm', config['stimulus'], '-mn', str(config['max_num']), '-s', str(params['steps']), '-r', '1',
+            '-np', '1', '-sd', str(params['seed']), '-path', calculus_path, '-tm', '1', '-ll', 'WARNING']
+    if config['guessing_game_2']:
+        # type=bool options are switched on by any non empty value
+        args += ['-gg2', '1']
+    args += params['simulation_args'].split()
+    start_time = time.time()
+    process = subprocess.Popen(args)
+    # resources of the simulation process and of its (waited for) run processes
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.time() - start_time
+    if status != 0:
+        raise RuntimeError('simulation {} failed with status {}'.format(config_name(config), status))
+
+    run_path = PathProvider.new_path_provider(Path(simulation_path).joinpath('run0'))
+    timings = read_timings(run_path.get_timings_path())
+    step_time = sum(timings[phase] for phase in PHASES).sum() / 1e9
+    steps = len(timings)
+    return dict(config,
+                steps=steps,
+                wall_time=wall_time,
+                step_time=step_time,
+                steps_per_sec=steps / step_time,
+                games_per_sec=steps * (config['population_size'] // 2) / step_time,
+                # ru_maxrss is in kilobytes on linux
+                peak_rss_mb=rusage.ru_maxrss / 1024.0,
+                bytes_per_step=directory_size(run_path.root_path) / steps,
+                phase_shares=dict((phase, float(timings[phase].sum() / 1e9 / step_time)) for phase in PHASES))
+
+
+def plot_scaling(results, output_dir):
+    """Steps/sec, games/sec, peak RSS and bytes per step against population size, a curve per other settings."""
+    curves = {}
+    for result in results:
+        key = '{stimulus} mn={max_num} gg2={guessing_game_2}'.format(**result)
+        curves.setdefault(key, []).append(result)
+    for measure, label in [('steps_per_sec', 'steps/sec'), ('games_per_sec', 'games/sec'),
+                           ('peak_rss_mb', 'peak RSS [MB]'), ('bytes_per_step', 'bytes written per step')]:
+        plt.figure()
+        for key, curve in sorted(curves.items()):
+            curve = sorted(curve, key=lambda result: result['population_size'])
+            plt.plot([result['population_size'] for result in curve], [result[measure] for result in curve], 'o-',
+                     label=key)
+        plt.xscale('log')
+        plt.yscale('log')
+        plt.xlabel('population size')
+        plt.ylabel(label)
+        plt.legend(loc='best', prop={'size': 7})
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_dir, '{}.png'.format(measure)))
+        plt.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    parser = argparse.ArgumentParser(prog='simulation scaling benchmark')
+    parser.add_argument('--population_sizes', '-ps', help='population sizes', type=int, nargs='+',
+                        default=[10, 20, 50, 100])
+    parser.add_argument('--max_nums', '-mns', help='max numbers for numerics or max denominators for quotients',
+                        type=int, nargs='+', default=[20, 100])
+    parser.add_argument('--stimuli', '-stms', help='quotient and/or numeric', type=str, nargs='+',
+                        default=['quotient', 'numeric'])
+    parser.add_argument('--guessing_game_2', '-gg2', help='0 and/or 1 for the second stage off/on', type=int,
+                        nargs='+', default=[0, 1])
+    parser.add_argument('--steps', '-s', help='number of steps', type=int, default=100)
+    parser.add_argument('--seed', '-sd', help='random seed of every simulation', type=int, default=0)
+    parser.add_argument('--simulation_args', '-sa', help='further simulation.py arguments, i.e. "-e vectorized -si 10"',
+                        type=str, default='')
+    parser.add_argument('--output_dir', '-o', help='directory of results, charts and the generated calculus', type=str,
+                        default='scaling_benchmark')
+    parser.add_argument('--keep_simulations', '-k', help='keep the simulation outputs', type=bool, default=False)
+
+    parsed_params = vars(parser.parse_args())
+    output_dir = os.path.abspath(parsed_params['output_dir'])
+    calculus_path = os.path.join(output_dir, 'calculus')
+    for stimulus in parsed_params['stimuli']:
+        save_inmemory_calculus(calculus_path, stimulus,
+                               generate_inmemory_calculus(stimulus, max(parsed_params['max_nums'])))
+
+    results = []
+    for stimulus, max_num, guessing_game_2, population_size in itertools.product(
+            parsed_params['stimuli'], parsed_params['max_nums'], parsed_params['guessing_game_2'],
+            parsed_params['population_sizes']):
+        config = {'stimulus': stimulus, 'max_num': max_num, 'guessing_game_2': guessing_game_2,
+                  'population_size': population_size}
+        simulation_path = os.path.join(output_dir, 'simulations', config_name(config))
+        result = run_config(config, parsed_params, calculus_path, simulation_path)
+        logging.info("{:>28} {:9.2f} steps/sec {:10.1f} games/sec {:8.1f}MB peak RSS {:10.0f} bytes/step".format(
+            config_name(config), result['steps_per_sec'], result['games_per_sec'], result['peak_rss_mb'],
+            result['bytes_per_step']))
+        results.append(result)
+        if not parsed_params['keep_simulations']:
+            shutil.rmtree(simulation_path, ignore_errors=True)
+
+    with open(os.path.join(output_dir, 'results.json'), 'w') as write_handle:
+        json.dump({'commit': current_commit(), 'python': platform.python_version(),
+                   'steps': parsed_params['steps'], 'seed': parsed_params['seed'],
+                   'simulation_args': parsed_params['simulation_args'], 'results': results},
+                  write_handle, indent=2, sort_keys=True)
+    plot_scaling(results, output_dir)
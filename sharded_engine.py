@@ -0,0 +1,172 @@
+import logging
+import random
+import traceback
+from multiprocessing import Pipe, Process
+
+import dill
+
+from numpy import array
+
+from event_log import GAME_EVENT_DTYPE
+from guessing_game import GuessingGame
+from guessing_game_exceptions import GAME_OUTCOMES
+from inmemory_calculus import inmem
+
+
+def game_seed(run_seed, step, game):
+    """Seed of a single game, the outcome of a game does not depend on the worker which plays it."""
+    return (run_seed << 40) + (step << 20) + game
+
+
+class ShardWorker(Process):
+    """Persistent process owning a shard of the population agents.
+
+    Commands (sent over the pipe as tuples):
+      ('adopt', serialized agents)  - takes ownership of the agents
+      ('release', agent ids)        - gives up the agents, replies with them serialized
+      ('play', games)               - plays games (seed, game index, speaker id, hearer id), replies with outcome
+                                      counts of the games, metrics of its agents and with --events the games
+                                      (see GameEventLog.record_game)
+      ('gather',)                   - replies with all its agents serialized
+      ('stop',)"""
+
+    def __init__(self, connection, params, context_constructor, inmem):
+        super(ShardWorker, self).__init__()
+        self.daemon = True
+        self.connection = connection
+        self.params = params
+        self.context_constructor = context_constructor
+        self.inmem = inmem
+        self.agents = {}
+        self.game = GuessingGame(params['guessing_game_2'])
+
+    def run(self):
+        # install calculus once per worker (spawned workers do not inherit module state)
+        inmem.update(self.inmem)
+        while True:
+            command = self.connection.recv()
+            try:
+                if command[0] == 'stop':
+                    break
+                self.connection.send(('ok', self.execute(command)))
+            except Exception:
+                self.connection.send(('error', traceback.format_exc()))
+
+    def execute(self, command):
+        if command[0] == 'adopt':
+            for agent in dill.loads(command[1]):
+                self.agents[agent.id] = agent
+        elif command[0] == 'release':
+            return dill.dumps([self.agents.pop(agent_id) for agent_id in command[1]])
+        elif command[0] == 'play':
+            outcome_counts = [0] * len(GAME_OUTCOMES)
+            events = []
+            game = self.game
+            for seed, index, speaker_id, hearer_id in command[1]:
+                random.seed(seed)
+                game.reset()
+                self.context_constructor.fill(game.context)
+                game.play(speaker=self.agents[speaker_id], hearer=self.agents[hearer_id])
+                outcome_counts[game.outcome - 1] += 1
+                if self.params['events']:
+                    events.append((index, speaker_id, hearer_id, game.context[0].index, game.context[1].index,
+                                   game.outcome, -1 if game.success2 is None else game.success2, game.speaker_word,
+                                   game.speaker_category_id, game.hearer_category_id))
+            return outcome_counts, events, [(agent.id, agent.get_discriminative_success(), agent.get_communicative_success(),
+                                     agent.get_communicative_success2(), agent.get_communicative_success12(),
+                                     len(agent.get_lexicon())) for agent in self.agents.values()]
+        elif command[0] == 'gather':
+            return dill.dumps(list(self.agents.values()))
+
+
+class ShardedRoundExecutor:
+    """Plays the disjoint games of a round in parallel on agents partitioned across persistent workers.
+
+    A game is played by the worker owning its speaker, the hearer migrates there if it lives elsewhere. Each game
+    is seeded from (run seed, step, game index), so results do not depend on the number of workers."""
+
+    def __init__(self, population, params, context_constructor, run_seed, num_workers, event_log=None):
+        self.population = population
+        self.params = params
+        self.run_seed = run_seed
+        self.event_log = event_log
+        self.connections = []
+        self.workers = []
+        for _ in range(num_workers):
+            connection, worker_connection = Pipe()
+            worker = ShardWorker(worker_connection, params, context_constructor, dict(inmem))
+            worker.start()
+            self.connections.append(connection)
+            self.workers.append(worker)
+        self.owner = {}
+        shards = [[] for _ in range(num_workers)]
+        for agent in population.agents:
+            self.owner[agent.id] = agent.id % num_workers
+            shards[agent.id % num_workers].append(agent)
+        self.broadcast([('adopt', dill.dumps(shard)) for shard in shards])
+
+    def broadcast(self, commands):
+        """Sends a command (or None) to every worker, then collects the replies in worker order."""
+        for connection, command in zip(self.connections, commands):
+            if command is not None:
+                connection.send(command)
+        replies = []
+        for connection, command in zip(self.connections, commands):
+            if command is None:
+                replies.append(None)
+                continue
+            status, reply = connection.recv()
+            if status == 'error':
+                raise RuntimeError('shard worker failed:\n' + reply)
+            replies.append(reply)
+        return replies
+
+    def play_round(self, step):
+        selected_pairs = self.population.select_pairs_per_round(self.population.population_size // 2)
+
+        games = [[] for _ in self.workers]
+        migrations = [[] for _ in self.workers]
+        for game, (speaker, hearer) in enumerate(selected_pairs):
+            worker = self.owner[speaker.id]
+            if self.owner[hearer.id] != worker:
+                migrations[self.owner[hearer.id]].append((hearer.id, worker))
+            games[worker].append((game_seed(self.run_seed, step, game), game, speaker.id, hearer.id))
+
+        if any(migrations):
+            released = self.broadcast([('release', [agent_id for agent_id, _ in worker_migrations])
+                                       if worker_migrations else None for worker_migrations in migrations])
+            adopted = [[] for _ in self.workers]
+            for worker_migrations, released_agents in zip(migrations, released):
+                if released_agents is None:
+                    continue
+                for (agent_id, target), agent in zip(worker_migrations, dill.loads(released_agents)):
+                    adopted[target].append(agent)
+                    self.owner[agent_id] = target
+            self.broadcast([('adopt', dill.dumps(agents)) if agents else None for agents in adopted])
+
+        replies = self.broadcast([('play', g) for g in games])
+        self.population.outcome_counts = [sum(counts) for counts in zip(*[outcome_counts for outcome_counts, _, _ in replies])]
+        if self.event_log is not None:
+            events = sorted(event for _, worker_events, _ in replies for event in worker_events)
+            records = array([(step,) + event[:7] + (-1,) + event[8:] for event in events], dtype=GAME_EVENT_DTYPE)
+            self.event_log.record_games(step, records, [event[7] for event in events])
+        agent_metrics = sorted(metric for _, _, worker_metrics in replies for metric in worker_metrics)
+        n = len(agent_metrics)
+        self.population.ds = sum(m[1] * 100.0 for m in agent_metrics) / n
+        self.population.cs1 = sum(m[2] * 100.0 for m in agent_metrics) / n
+        self.population.cs2 = sum(m[3] * 100.0 for m in agent_metrics) / n
+        self.population.cs12 = sum(m[4] * 100.0 for m in agent_metrics) / n
+        self.population.lexicon_size = sum(m[5] for m in agent_metrics) / n
+
+    def gather(self):
+        """Brings the current state of all agents back into the population (i.e. before it is snapshot)."""
+        agents = [agent for shard in self.broadcast([('gather',)] * len(self.workers)) for agent in dill.loads(shard)]
+        self.population.agents = sorted(agents, key=lambda agent: agent.id)
+        self.population.track_success()
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('stop',))
+        for worker in self.workers:
+            worker.join()
+        logging.debug("sharded executor stopped %d workers" % len(self.workers))
@@ -3,15 +3,26 @@ from __future__ import division  # force python 3 division in python 2
 import argparse
 import logging, sys
 import pickle
+import random
 import time
-from multiprocessing import Process
+from multiprocessing import Process, cpu_count
 
 import dill
+import numpy
 
 import matplotlib
 from pathlib import Path
 
+from event_log import GameEventLog, truncate_events
 from path_provider import PathProvider
+import phase_timer
+from phase_timer import PhaseTimer, StepProfiler, METRICS, SNAPSHOT, read_timings, summarize_timings, truncate_timings
+from metrics import MetricsRecorder, truncate_metrics, read_metrics
+from run_archive import RunArchive, RunSnapshots
+from sharded_engine import ShardedRoundExecutor
+from snapshot_writer import SnapshotWriter, StepFileSink
+from stopping import new_stopping_criteria
+from vectorized_engine import VectorizedRoundExecutor, StackedPopulation, ContextSampler
 from inmemory_calculus import load_inmemory_calculus, inmem
 import os
 import shutil
@@ -21,10 +32,11 @@ from stimulus import QuotientBasedStimulusFactory, ContextFactory, NumericBasedS
 matplotlib.use('Agg')
 from agent import Population
 from guessing_game import GuessingGame
+from guessing_game_exceptions import GAME_OUTCOMES
 
 class Simulation(Process):
 
-    def __init__(self, params, step_offset, population, context_constructor, num, path_provider):
+    def __init__(self, params, step_offset, population, context_constructor, num, path_provider, rng_state=None):
         super(Simulation, self).__init__()
         self.num = num
         self.path_provider = path_provider
@@ -32,35 +44,262 @@ class Simulation(Process):
         self.step_offset = step_offset
         self.params = params
         self.context_constructor = context_constructor
+        self.rng_state = rng_state
+        # every game of the run is played on this one (reset) game
+        self.game = GuessingGame(params['guessing_game_2'])
+        # GameEventLog of the run while it runs with --events, None otherwise
+        self.event_log = None
+        # PhaseTimer of the run while it runs with --timings, None otherwise
+        self.timer = None
 
     def run(self):
 
         start_time = time.time()
-        for step in range(self.params["steps"]):
-            step_with_offset = step + self.step_offset
-            logging.critical("\n------------\nSTEP %d" % step_with_offset)
-            selected_pairs = self.population.select_pairs_per_round(self.population.population_size // 2)
-
-            for speaker, hearer in selected_pairs:
-                game = GuessingGame(self.params['guessing_game_2'], self.context_constructor())
-                logging.debug("\nGAME(%d, %d)" % (speaker.id, hearer.id))
-                game.play(speaker=speaker, hearer=hearer)
-                logging.debug("Number of categories of Agent(%d): %d" % (speaker.id, len(speaker.get_categories())))
-                logging.debug("Number of categories of Agent(%d): %d" % (hearer.id, len(hearer.get_categories())))
-
-            self.population.update_metrics()
+        # every run owns the stream of the random module: seeded per run, restored from the snapshot on resume
+        if self.rng_state is None:
+            random.seed(self.params['seed'] + self.num)
+        else:
+            random.setstate(self.rng_state)
+        snapshot_writer, metrics_recorder, stopping_criteria = self.open_outputs()
+        round_executor = None
+        if self.params['engine'] == 'vectorized':
+            round_executor = VectorizedRoundExecutor(self.population, self.params, self.context_constructor,
+                                                     self.params['seed'] + self.num, self.event_log)
+        elif self.params['workers'] > 0:
+            round_executor = ShardedRoundExecutor(self.population, self.params, self.context_constructor,
+                                                  self.params['seed'] + self.num, self.params['workers'],
+                                                  self.event_log)
+        # games of the classic engine switch the phases of the run timer
+        phase_timer.timer = self.timer
+        profiler = new_step_profiler(self.params, self.path_provider)
+        try:
+            self.run_steps(snapshot_writer, metrics_recorder, stopping_criteria, round_executor, profiler)
+        except KeyboardInterrupt:
+            logging.critical("simulation {} interrupted, flushing pending steps".format(self.num))
+            raise
+        finally:
+            if profiler is not None:
+                profiler.close()
+            if round_executor is not None:
+                round_executor.close()
+            self.close_outputs(snapshot_writer, metrics_recorder)
+
+        exec_time = time.time() - start_time
+        logging.debug("simulation {} took {}sec (with params {})".format(self.num, exec_time, self.params))
+
+    def open_outputs(self):
+        """Returns (snapshot writer, metrics recorder, stopping criteria) of the run."""
+        snapshot_writer = SnapshotWriter(self.new_snapshot_sink(), self.params['snapshot_queue_size'])
+        snapshot_writer.start()
+        metrics_recorder = MetricsRecorder(self.path_provider.get_metrics_path(), self.params['steps'] - self.step_offset)
+        stopping_criteria = new_stopping_criteria(self.params)
+        if len(stopping_criteria) and self.step_offset > 0:
+            for record in read_metrics(self.path_provider.get_metrics_path()):
+                stopping_criteria.update(record)
+        if self.params['events']:
+            self.event_log = GameEventLog(self.path_provider.get_events_path(),
+                                          self.path_provider.get_event_words_path())
+        if self.params['timings']:
+            self.timer = PhaseTimer(self.path_provider.get_timings_path(), self.params['steps'] - self.step_offset)
+        return snapshot_writer, metrics_recorder, stopping_criteria
+
+    def close_outputs(self, snapshot_writer, metrics_recorder):
+        if self.event_log is not None:
+            self.event_log.close()
+        metrics_recorder.close()
+        snapshot_writer.close()
+        logging.info("simulation {} blocked {:.3f}sec on writing {} steps ({} bytes)".format(
+            self.num, snapshot_writer.blocked_time, snapshot_writer.written_steps, snapshot_writer.written_bytes))
+        if self.timer is not None:
+            self.timer.close()
+            logging.info("simulation {} timings:\n{}".format(
+                self.num, '\n'.join(summarize_timings(read_timings(self.path_provider.get_timings_path())))))
+
+    def new_snapshot_sink(self):
+        if self.params['archive']:
+            return RunArchive(self.path_provider.get_archive_path(), self.params['archive_compression'])
+        return StepFileSink(self.path_provider)
+
+    def run_steps(self, snapshot_writer, metrics_recorder, stopping_criteria, round_executor, profiler=None):
+        if self.timer is not None:
+            self.timer.reset()
+        for step_with_offset in range(self.step_offset, self.params["steps"]):
+            logging.debug("simulation %d step %d", self.num, step_with_offset)
+            if profiler is not None:
+                profiler.start_step(step_with_offset)
+            if round_executor is None:
+                self.play_round(step_with_offset)
+                if self.timer is not None:
+                    self.timer.switch(METRICS)
+                self.population.update_metrics()
+            else:
+                round_executor.play_round(step_with_offset)
             #logging.critical(self.population.get_meanings(self.context_constructor.new_stimulus.get_all_stimuli()))
+            stopped = self.end_step(step_with_offset, snapshot_writer, metrics_recorder, stopping_criteria,
+                                    round_executor.gather if round_executor is not None else None)
+            if profiler is not None:
+                profiler.end_step(step_with_offset)
+            if stopped:
+                break
+
+    def end_step(self, step, snapshot_writer, metrics_recorder, stopping_criteria, gather=None):
+        """Records metrics of the played step and snapshots it if due, returns True if the run stops after it.
+        gather brings the population up to date before it is snapshot."""
+        if self.timer is not None:
+            self.timer.switch(METRICS)
+        record = metrics_recorder.record(step, self.population)
+        stop_reason = stopping_criteria.update(record)
+
+        if self.is_snapshot_step(step) or stop_reason is not None:
+            if self.timer is not None:
+                self.timer.switch(SNAPSHOT)
+            if gather is not None:
+                gather()
+            if self.params['snapshot_interval'] > 1:
+                # steps between snapshots cannot be backfilled from snapshots on resume
+                metrics_recorder.flush()
+            if self.event_log is not None:
+                self.event_log.flush()
+            # serialize in the loop (the population mutates in the next step), write in background
+            snapshot_writer.submit(step, dill.dumps((step, self.population, random.getstate())))
+
+        if stop_reason is not None:
+            self.stop(step, stop_reason)
+        if self.timer is not None:
+            self.timer.end_step(step)
+        return stop_reason is not None
 
-            serialized_step_path = str(self.path_provider.get_simulation_step_path(step_with_offset))
-            with open(serialized_step_path, "wb") as write_handle:
-                dill.dump((step_with_offset, self.population), write_handle)
+    def play_round(self, step):
+        selected_pairs = self.population.select_pairs_per_round(self.population.population_size // 2)
+        outcome_counts = [0] * len(GAME_OUTCOMES)
+
+        game = self.game
+
+        for index, (speaker, hearer) in enumerate(selected_pairs):
+            game.reset()
+            self.context_constructor.fill(game.context)
+            game.play(speaker=speaker, hearer=hearer)
+            outcome_counts[game.outcome - 1] += 1
+            if self.event_log is not None:
+                self.event_log.record_game(step, index, game, speaker, hearer)
+        self.population.outcome_counts = outcome_counts
+
+    def is_snapshot_step(self, step):
+        # with interval k steps 0, k-1, 2k-1, ... and the last one are kept, as sampled by the postprocess
+        return step == 0 or (step + 1) % self.params['snapshot_interval'] == 0 or step + 1 == self.params['steps']
+
+    def stop(self, step, reason):
+        logging.info("simulation {} stopped after step {}: {}".format(self.num, step, reason))
+        with self.path_provider.get_stop_path().open('wb') as write_handle:
+            dill.dump({'step': step, 'reason': reason}, write_handle)
+
+
+class LockstepSimulation(Process):
+    """Advances several runs in lockstep within a single process. Their populations are stacked into one
+    StackedPopulation, so that the array operations of a round amortize over the runs. Every run keeps its own
+    random stream, snapshots, metrics and stopping criteria, and ends up exactly as with --engine vectorized."""
+
+    def __init__(self, simulations):
+        super(LockstepSimulation, self).__init__()
+        self.simulations = simulations
+
+    def run(self):
+        start_time = time.time()
+        params = self.simulations[0].params
+        stacked = StackedPopulation.from_populations([simulation.population for simulation in self.simulations], params,
+                                                     ContextSampler(self.simulations[0].context_constructor.new_stimulus))
+        outputs = [simulation.open_outputs() for simulation in self.simulations]
+        stacked.record_events = params['events']
+        stopped = [False] * len(self.simulations)
+        # timers of the runs share the wall time of rounds, the profile of the group goes to the first run
+        for simulation in self.simulations:
+            if simulation.timer is not None:
+                simulation.timer.reset()
+        profiler = new_step_profiler(params, self.simulations[0].path_provider)
+        try:
+            for step in range(min(simulation.step_offset for simulation in self.simulations), params['steps']):
+                logging.debug("step %d (%d runs)", step, stopped.count(False))
+                if profiler is not None:
+                    profiler.start_step(step)
+                runs = [run for run, simulation in enumerate(self.simulations)
+                        if not stopped[run] and step >= simulation.step_offset]
+                stacked.play_round([numpy.random.default_rng([params['seed'] + self.simulations[run].num, step])
+                                    for run in runs], runs)
+                for run in runs:
+                    simulation = self.simulations[run]
+                    stacked.update_metrics(run, simulation.population)
+                    if simulation.event_log is not None:
+                        simulation.event_log.record_games(step, *stacked.game_events(run))
+                    gather = lambda: setattr(simulation.population, 'agents', stacked.run_agents(run))
+                    stopped[run] = simulation.end_step(step, *outputs[run], gather=gather)
+                if profiler is not None:
+                    profiler.end_step(step)
+                if all(stopped):
+                    break
+        except KeyboardInterrupt:
+            logging.critical("simulations {} interrupted, flushing pending steps".format(
+                [simulation.num for simulation in self.simulations]))
+            raise
+        finally:
+            if profiler is not None:
+                profiler.close()
+            for simulation, (snapshot_writer, metrics_recorder, _) in zip(self.simulations, outputs):
+                simulation.close_outputs(snapshot_writer, metrics_recorder)
 
         exec_time = time.time() - start_time
-        logging.debug("simulation {} took {}sec (with params {})".format(self.num, exec_time, self.params))
+        logging.debug("simulations {} took {}sec in lockstep".format([simulation.num for simulation in self.simulations],
+                                                                    exec_time))
+
+
+def new_step_profiler(params, path_provider):
+    """StepProfiler of the step range given by --profile, None without it."""
+    if not params['profile']:
+        return None
+    first, last = StepProfiler.parse(params['profile'])
+    return StepProfiler(first, last, path_provider.get_profile_path(first, last))
+
+
+def resume_simulation(params, context_constructor, num, path_provider):
+    """Continues the run from its latest complete snapshot, returns None if the run is already finished."""
+    if path_provider.get_stop_path().exists():
+        return None
+    snapshot = RunSnapshots(path_provider).load_latest_snapshot()
+    if snapshot is None:
+        logging.info("run {} has no complete snapshot, restarting it".format(num))
+        truncate_metrics(path_provider.get_metrics_path(), -1)
+        truncate_events(path_provider.get_events_path(), -1)
+        truncate_timings(path_provider.get_timings_path(), -1)
+        return Simulation(params=params, step_offset=0, population=Population(params),
+                          context_constructor=context_constructor, num=num, path_provider=path_provider)
+
+    step, population, rng_state = snapshot
+    if step + 1 >= params['steps']:
+        return None
+    if rng_state is None:
+        logging.warning("snapshot of step {} of run {} has no random state, "
+                        "the resumed run will differ from an uninterrupted one".format(step, num))
+
+    # metrics are appended in batches, so they may lag behind the snapshots; each snapshot carries the metrics
+    # of its step, which fills the gap
+    records = truncate_metrics(path_provider.get_metrics_path(), step)
+    truncate_events(path_provider.get_events_path(), step)
+    truncate_timings(path_provider.get_timings_path(), step)
+    last_recorded_step = records['step'].max() if len(records) else -1
+    missing_steps = [s for s in RunSnapshots(path_provider).steps() if last_recorded_step < s < step]
+    metrics_recorder = MetricsRecorder(path_provider.get_metrics_path(), len(missing_steps) + 1)
+    for missing_step in missing_steps:
+        metrics_recorder.record(missing_step, RunSnapshots(path_provider).load(missing_step)[1])
+    if last_recorded_step < step:
+        metrics_recorder.record(step, population)
+    metrics_recorder.close()
+
+    logging.info("resuming run {} from step {}".format(num, step + 1))
+    return Simulation(params=params, step_offset=step + 1, population=population,
+                      context_constructor=context_constructor, num=num, path_provider=path_provider,
+                      rng_state=rng_state)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
     parser = argparse.ArgumentParser(prog='quantifiers simulation')
 
     parser.add_argument('--simulation_name', '-sn', help='simulation name', type=str, default='test')
@@ -75,17 +314,85 @@ if __name__ == "__main__":
     parser.add_argument('--super_alpha', '-sa', help='complete forgetting of categories that have smaller weights',
                         type=float, default=.001)
     parser.add_argument('--beta', '-b', help='learning rate', type=float, default=0.2)
+    parser.add_argument('--success_window', '-sw', help='number of last games the discriminative and communicative '
+                                                        'successes are computed over', type=int, default=50)
     parser.add_argument('--steps', '-s', help='number of steps', type=int, default=200)
     parser.add_argument('--runs', '-r', help='number of runs', type=int, default=1)
     parser.add_argument('--guessing_game_2', '-gg2', help='is the second stage of the guessing game on', type=bool,
                         default=False)
-    parser.add_argument('--load_simulation', '-l', help='load and rerun simulation from pickled simulation step',
+    parser.add_argument('--load_simulation', '-l', help='resume unfinished runs of the simulation rooted at the given path',
                         type=str)
     parser.add_argument('--parallel', '-pl', help='run parallel runs', type=bool, default=True)
+    parser.add_argument('--processes', '-np', help='max number of runs executed in parallel', type=int,
+                        default=cpu_count())
+    parser.add_argument('--seed', '-sd', help='random seed, run k is seeded with seed + k', type=int)
+    parser.add_argument('--snapshot_interval', '-si', help='snapshot every k-th step', type=int, default=1)
+    parser.add_argument('--workers', '-w', help='play games of a round on agents sharded across given number of '
+                        'worker processes (0 plays them sequentially)', type=int, default=0)
+    parser.add_argument('--engine', '-e', help='classic plays games one by one, vectorized plays all games of a round '
+                        'as array operations (ignores workers)', type=str, default='classic',
+                        choices=['classic', 'vectorized'])
+    parser.add_argument('--lockstep', '-ls', help='advance groups of given number of runs in lockstep within one process '
+                        '(uses the vectorized engine, 0 gives every run its own process)', type=int, default=0)
+    parser.add_argument('--snapshot_queue_size', '-sqs', help='number of serialized steps buffered for the background writer',
+                        type=int, default=8)
+    parser.add_argument('--archive', '-ar', help='pack steps of a run into a single archive file instead of step files',
+                        type=bool, default=False)
+    parser.add_argument('--archive_compression', '-arc', help='none, zlib or lzma', type=str, default='zlib')
+    parser.add_argument('--stop_slope', '-ssl', help='stop once slope of metric over window <= threshold, '
+                        'given as metric:window:threshold, i.e. ds:200:0.01', type=str, nargs='+')
+    parser.add_argument('--stop_variance', '-sva', help='stop once variance of metric over window <= threshold, '
+                        'given as metric:window:threshold, i.e. cs1:200:1.0', type=str, nargs='+')
+    parser.add_argument('--stop_lexicon', '-sle', help='stop once mean lexicon size stays within tolerance over window, '
+                        'given as window:tolerance, i.e. 200:0.5', type=str)
+    parser.add_argument('--stop_min_steps', '-smin', help='steps made regardless of stopping criteria', type=int,
+                        default=0)
+    parser.add_argument('--events', '-ev', help='log every played game to a binary event file of the run (see event_log.py)',
+                        type=bool, default=False)
+    parser.add_argument('--timings', '-tm', help='time phases of every step into a binary file of the run and summarize '
+                        'them at its end (see phase_timer.py)', type=bool, default=False)
+    parser.add_argument('--profile', '-pf', help='cProfile steps first:last (inclusive) of every run into its directory',
+                        type=str)
+    parser.add_argument('--log_level', '-ll', help='DEBUG, INFO, WARNING, ERROR or CRITICAL', type=str, default='INFO')
     parser.add_argument('--in_mem_calculus_path', '-path', help='path to precomputed integrals', type=str, default='inmemory_calculus')
 
     parsed_params = vars(parser.parse_args())
-    load_inmemory_calculus(parsed_params['in_mem_calculus_path'], parsed_params['stimulus'])
+    logging.basicConfig(stream=sys.stderr, level=parsed_params['log_level'].upper())
+
+    # fail fast on malformed stopping criteria
+    try:
+        new_stopping_criteria(parsed_params)
+    except ValueError as e:
+        parser.error(str(e))
+    if parsed_params['profile']:
+        try:
+            StepProfiler.parse(parsed_params['profile'])
+        except ValueError:
+            parser.error('--profile expects first:last steps, got {}'.format(parsed_params['profile']))
+    if parsed_params['lockstep'] > 0 and not parsed_params['load_simulation']:
+        parsed_params['engine'] = 'vectorized'
+
+    if parsed_params['load_simulation']:
+        # the simulation continues with its own parameters, only the execution parameters are taken from the command line
+        path_provider = PathProvider.new_path_provider(parsed_params['load_simulation'])
+        with path_provider.get_simulation_params_path().open('rb') as read_handle:
+            simulation_params = pickle.load(read_handle)
+        with path_provider.get_inmem_calc_path().open('rb') as read_handle:
+            inmem.update(pickle.load(read_handle))
+        execution_params = ['load_simulation', 'parallel', 'processes', 'snapshot_queue_size', 'workers', 'lockstep',
+                            'log_level', 'timings', 'profile']
+        parsed_params.update((key, value) for key, value in simulation_params.items() if key not in execution_params)
+        if simulation_params.get('seed') is None:
+            # simulations started before --seed kept no seed, they continue with the one of the command line or a
+            # fresh one
+            if parsed_params['seed'] is None:
+                parsed_params['seed'] = random.SystemRandom().randint(0, 2 ** 31)
+            logging.warning("{} has no seed, resuming with seed {}".format(parsed_params['load_simulation'],
+                                                                            parsed_params['seed']))
+    else:
+        load_inmemory_calculus(parsed_params['in_mem_calculus_path'], parsed_params['stimulus'])
+        if parsed_params['seed'] is None:
+            parsed_params['seed'] = random.SystemRandom().randint(0, 2 ** 31)
 
     stimulus_factory = None
     if parsed_params['stimulus'] == 'quotient':
@@ -96,18 +403,15 @@ if __name__ == "__main__":
 
     simulation_tasks = []
     if parsed_params['load_simulation']:
-        for run in Path(parsed_params['load_simulation']).glob('*'):
-            pickled_simulation_file = parsed_params['load_simulation']
-            logging.debug("loading pickled simulation from {} file".format(pickled_simulation_file))
-            with open(pickled_simulation_file, 'rb') as read_handle:
-                step, population = pickle.load(read_handle)
-
-        simulation_tasks.append(Simulation(params=parsed_params,
-                                           step_offset=step + 1,
-                                           population=population,
-                                           context_constructor=context_constructor,
-                                           num=0,
-                                           path_provider=PathProvider.new_path_provider(parsed_params['simulation_name'])))
+        simulation_path = os.path.abspath(parsed_params['load_simulation'])
+        for run in range(parsed_params['runs']):
+            path_provider = PathProvider.new_path_provider(Path(simulation_path).joinpath('run' + str(run)))
+            if not path_provider.data_path.exists():
+                path_provider.create_directory_structure()
+            simulation = resume_simulation(parsed_params, context_constructor, run, path_provider)
+            if simulation is not None:
+                simulation_tasks.append(simulation)
+        logging.info("resuming {} unfinished runs".format(len(simulation_tasks)))
     else:
         simulation_path = os.path.abspath(parsed_params['simulation_name'])
         if os.path.exists(simulation_path):
@@ -115,37 +419,43 @@ if __name__ == "__main__":
         os.makedirs(simulation_path)
         os.makedirs(simulation_path + '/stats')
 
+        # written upfront, so that an interrupted simulation can be resumed
+        path_provider = PathProvider.new_path_provider(simulation_path)
+        with path_provider.get_simulation_params_path().open('wb') as write_params:
+            dill.dump(parsed_params, write_params)
+
+        with path_provider.get_inmem_calc_path().open('wb') as write_inmem:
+            dill.dump(inmem, write_inmem)
+
+        with path_provider.get_stimuluses_path().open('wb') as write_stimuluses:
+            dill.dump(stimulus_factory.get_all_stimuli(), write_stimuluses)
+
         for run in range(parsed_params['runs']):
             population = Population(parsed_params)
             root_path = Path(simulation_path).joinpath('run' + str(run))
             path_provider = PathProvider.new_path_provider(root_path)
             path_provider.create_directory_structure()
-            simulation = Simulation(params=parsed_params,
-                                    step_offset=0,
-                                    population=population,
-                                    context_constructor=context_constructor,
-                                    num=run,
-                                    path_provider=path_provider)
-            # if parsed_params['parallel']:
-            #     simulation_tasks.append(simulation)
-            # else:
-            simulation.run()
-
-    path_provider = PathProvider.new_path_provider(parsed_params['simulation_name'])
-    params_path = str(Path(path_provider.root_path).joinpath('params.p'))
-    with open(params_path, 'wb') as write_params:
-        dill.dump(parsed_params, write_params)
-
-    in_mem_path = str(Path(path_provider.root_path).joinpath('inmem_calc.p'))
-    with open(in_mem_path, 'wb') as write_inmem:
-        dill.dump(inmem, write_inmem)
-
-    stimuluses_path = str(Path(path_provider.root_path).joinpath('stimuluses.p'))
-    with open(stimuluses_path, 'wb') as write_stimuluses:
-        dill.dump(stimulus_factory.get_all_stimuli(), write_stimuluses)
+            simulation_tasks.append(Simulation(params=parsed_params,
+                                               step_offset=0,
+                                               population=population,
+                                               context_constructor=context_constructor,
+                                               num=run,
+                                               path_provider=path_provider))
+
+    if parsed_params['lockstep'] > 0:
+        if parsed_params['engine'] != 'vectorized':
+            parser.error('lockstep runs need the vectorized engine, the simulation uses the {} one'.format(
+                parsed_params['engine']))
+        simulation_tasks = [LockstepSimulation(simulation_tasks[i:i + parsed_params['lockstep']])
+                            for i in range(0, len(simulation_tasks), parsed_params['lockstep'])]
 
     if parsed_params['parallel']:
+        processes = max(parsed_params['processes'], 1)
+        for i in range(0, len(simulation_tasks), processes):
+            for simulation_task in simulation_tasks[i:i + processes]:
+                simulation_task.start()
+            for simulation_task in simulation_tasks[i:i + processes]:
+                simulation_task.join()
+    else:
         for simulation_task in simulation_tasks:
-            simulation_task.start()
-        for simulation_task in simulation_tasks:
-            simulation_task.join()
+            simulation_task.run()
@@ -0,0 +1,16 @@
+class Slotted(object):
+    """Base of classes with __slots__ (one per class of the hierarchy). Slotted objects pickle their slots, objects
+    pickled before the classes got slots carry a __dict__ state, both are restored by __setstate__."""
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        for name, value in slot_state(state).items():
+            setattr(self, name, value)
+
+
+def slot_state(state):
+    """Attributes of a pickled state, either a __dict__ or the (__dict__, slots) pair of slotted objects."""
+    if isinstance(state, tuple):
+        dict_state, slots = state
+        state = dict(dict_state or {}, **(slots or {}))
+    return state
@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# default number of snapshots read ahead and not yet taken, the one taken next included
+READ_AHEAD = 4
+# default bound of the bytes of snapshots read ahead and not yet taken
+MEMORY_BUDGET = 256 * 2 ** 20
+
+
+class SnapshotPrefetcher:
+    """Iterates over (step, population) of the given snapshot steps of a run in their order, while threads read (and
+    decompress) the bytes of up to read_ahead snapshots, the one taken next included, so that waiting for the disk
+    (i.e. network storage) overlaps the processing of the current population. Populations are unpickled by the
+    iterating thread.
+
+    A read is started only while the bytes read ahead and not yet taken stay under memory_budget, the snapshot
+    taken next is always read. read_ahead 0 reads every snapshot when it is taken."""
+
+    def __init__(self, snapshots, steps, read_ahead=READ_AHEAD, memory_budget=MEMORY_BUDGET, threads=2):
+        self.snapshots = snapshots
+        self.steps = list(steps)
+        self.read_ahead = read_ahead
+        self.memory_budget = memory_budget
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.held = 0
+
+    def read(self, step):
+        data = self.snapshots.read(step)
+        with self.lock:
+            self.held += len(data)
+        return data
+
+    def take(self, future):
+        data = future.result()
+        with self.lock:
+            self.held -= len(data)
+        return data
+
+    def __iter__(self):
+        if self.read_ahead <= 0:
+            for step in self.steps:
+                yield step, self.snapshots.unpickle(self.snapshots.read(step))[1]
+            return
+        executor = ThreadPoolExecutor(max(1, min(self.threads, self.read_ahead)))
+        pending = deque()
+        steps = iter(self.steps)
+        try:
+            while True:
+                while len(pending) < self.read_ahead and (not pending or self.held < self.memory_budget):
+                    step = next(steps, None)
+                    if step is None:
+                        break
+                    pending.append((step, executor.submit(self.read, step)))
+                if not pending:
+                    break
+                step, future = pending.popleft()
+                yield step, self.snapshots.unpickle(self.take(future))[1]
+        finally:
+            # a consumer which stops early drops the reads ahead
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
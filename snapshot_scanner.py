@@ -0,0 +1,149 @@
+import logging
+import time
+from multiprocessing import cpu_count
+from pathlib import Path
+
+from derived_metrics import measure_snapshot, init_metrics_worker
+from inmemory_calculus import inmem
+from run_archive import open_run_snapshots, step_at_or_before
+from snapshot_prefetcher import SnapshotPrefetcher, READ_AHEAD, MEMORY_BUDGET
+from task_pool import TaskPool
+
+
+def run_number(run_path):
+    return int(run_path.name[len('run'):])
+
+
+def run_paths(root_path):
+    """run[0-9]* directories of a simulation ordered by the run number."""
+    return sorted(Path(root_path).glob('run[0-9]*'), key=run_number)
+
+
+class SnapshotScanner:
+    """Reads the snapshots of every run of a simulation once and pushes each loaded population to all consumers
+    which asked for its step.
+
+    A consumer has a steps attribute, the steps it asks for or None for every snapshot step of a run (every stride-th
+    one if it has a stride attribute), and the methods consume(run, step, population) and finalize(). Steps asked
+    for are resolved like RunSnapshots.load_at_or_before, so runs stopped early feed their last population to the
+    later steps. A consumer may also have lookup(run, step), which returns True when it got what it needs of the
+    step without the population (i.e. from a cache); snapshots nobody needs are not loaded.
+
+    Given a task pool, consumers which have gathered(run, step, values) (see CachedStepSamples) are served by tasks
+    measuring their metric in a worker, which loads the snapshot itself, the values are handed back to them in the
+    main process. The other consumers are still fed in the main process, from snapshots read ahead by a
+    SnapshotPrefetcher."""
+
+    def __init__(self, root_path, read_ahead=READ_AHEAD, memory_budget=MEMORY_BUDGET):
+        self.root_path = Path(root_path)
+        self.read_ahead = read_ahead
+        self.memory_budget = memory_budget
+        self.consumers = []
+
+    def add(self, consumer):
+        self.consumers.append(consumer)
+
+    def requests(self, run, snapshot_steps):
+        """Maps snapshot steps to the (consumer, asked step) pairs they are pushed to."""
+        requests = {}
+        for consumer in self.consumers:
+            lookup = getattr(consumer, 'lookup', None)
+            steps = snapshot_steps[::getattr(consumer, 'stride', 1)] if consumer.steps is None else consumer.steps
+            for step in steps:
+                if lookup is not None and lookup(run, step):
+                    continue
+                requests.setdefault(step_at_or_before(snapshot_steps, step), []).append((consumer, step))
+        return requests
+
+    def scan(self, task_pool=None):
+        """task_pool returns the pool gathering metrics, None to feed all consumers in this process."""
+        start_time = time.time()
+        loaded = 0
+        submitted = 0
+        for run_path in run_paths(self.root_path):
+            run = run_number(run_path)
+            snapshots = open_run_snapshots(run_path)
+            snapshot_steps = snapshots.steps()
+            if not snapshot_steps:
+                continue
+            requests = self.requests(run, snapshot_steps)
+            if task_pool is not None:
+                for snapshot_step in sorted(requests):
+                    gathered = [(consumer, step) for consumer, step in requests[snapshot_step]
+                                if hasattr(consumer, 'gathered')]
+                    if gathered:
+                        submitted += self.submit(task_pool(), run_path, run, snapshot_step, gathered)
+                        requests[snapshot_step] = [(consumer, step) for consumer, step in requests[snapshot_step]
+                                                   if not hasattr(consumer, 'gathered')]
+            steps = [snapshot_step for snapshot_step in sorted(requests) if requests[snapshot_step]]
+            for snapshot_step, population in SnapshotPrefetcher(snapshots, steps, self.read_ahead, self.memory_budget):
+                loaded += 1
+                for consumer, step in requests[snapshot_step]:
+                    consumer.consume(run, step, population)
+        logging.debug("scanned {} snapshots of {} in {:.1f}sec, {} submitted to workers".format(
+            loaded, self.root_path, time.time() - start_time, submitted))
+
+    @staticmethod
+    def submit(pool, run_path, run, snapshot_step, gathered):
+        """Submits a task per metrics cache measuring all metrics the consumers ask of the snapshot."""
+        by_cache = {}
+        for consumer, step in gathered:
+            by_cache.setdefault(consumer.cache, []).append((consumer, step))
+
+        def hand_back(consumers):
+            def callback(values):
+                for consumer, step in consumers:
+                    consumer.gathered(run, step, values[consumer.name])
+            return callback
+
+        for cache, consumers in by_cache.items():
+            names = sorted(set(consumer.name for consumer, _ in consumers))
+            pool.submit(measure_snapshot, (str(run_path), snapshot_step, cache.stimuli, names),
+                        key=(str(run_path), snapshot_step), callback=hand_back(consumers))
+        return len(by_cache)
+
+
+class ScanPlan:
+    """Scanners of the simulations the requested commands read. Every simulation is scanned once, then every
+    consumer and then every command (which plots what its consumers collected) finalized once, in the order they
+    were added. Metrics are gathered by a pool of parallelism workers (one per cpu if 0), failures of its tasks
+    are kept in failures. Snapshots loaded in this process are read ahead as set by read_ahead and memory_budget
+    (see SnapshotPrefetcher)."""
+
+    def __init__(self, parallelism=1, read_ahead=READ_AHEAD, memory_budget=MEMORY_BUDGET):
+        self.read_ahead = read_ahead
+        self.memory_budget = memory_budget
+        self.scanners = {}
+        self.consumers = []
+        self.commands = []
+        self.processes = parallelism or cpu_count()
+        self.pool = None
+        self.failures = []
+
+    def add(self, root_path, consumer):
+        key = str(Path(root_path).absolute())
+        if key not in self.scanners:
+            self.scanners[key] = SnapshotScanner(root_path, self.read_ahead, self.memory_budget)
+        self.scanners[key].add(consumer)
+        if consumer not in self.consumers:
+            self.consumers.append(consumer)
+
+    def add_command(self, command):
+        self.commands.append(command)
+
+    def task_pool(self):
+        if self.pool is None:
+            self.pool = TaskPool(self.processes, init_metrics_worker, (dict(inmem),), name='metrics')
+        return self.pool
+
+    def run(self):
+        for scanner in self.scanners.values():
+            scanner.scan(self.task_pool if self.processes > 1 else None)
+        if self.pool is not None:
+            self.failures = self.pool.close()
+            self.pool = None
+        for consumer in self.consumers:
+            consumer.finalize()
+        for command in self.commands:
+            command.finalize()
+
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from queue import Queue
+
+
+class StepFileSink:
+    """Writes each serialized step into its own data/stepN.p file of a run."""
+
+    def __init__(self, path_provider):
+        self.path_provider = path_provider
+        self.unsynced_paths = []
+
+    def write(self, step, payload):
+        step_path = str(self.path_provider.get_simulation_step_path(step))
+        # write aside and rename, so that a reader never sees a half written step file
+        part_path = step_path + '.part'
+        with open(part_path, 'wb') as write_handle:
+            write_handle.write(payload)
+        os.rename(part_path, step_path)
+        self.unsynced_paths.append(step_path)
+
+    def flush(self):
+        for step_path in self.unsynced_paths:
+            fd = os.open(step_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.unsynced_paths = []
+        fsync_directory(str(self.path_provider.data_path))
+
+    def close(self):
+        self.flush()
+
+
+def fsync_directory(path):
+    # makes renames durable, not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SnapshotWriter(threading.Thread):
+    """Persists serialized simulation steps in background.
+
+    The simulation loop hands already serialized step buffers over a bounded queue; when the queue is full
+    submit blocks (back-pressure) and the time spent waiting is accumulated in blocked_time."""
+
+    __STOP = object()
+
+    def __init__(self, sink, queue_size=8):
+        super(SnapshotWriter, self).__init__()
+        self.daemon = True
+        self.sink = sink
+        self.queue = Queue(maxsize=max(queue_size, 1))
+        self.blocked_time = 0.0
+        self.written_steps = 0
+        self.written_bytes = 0
+        self.error = None
+
+    def submit(self, step, payload):
+        if self.error is not None:
+            raise self.error
+        start_time = time.time()
+        self.queue.put((step, payload))
+        self.blocked_time += time.time() - start_time
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is SnapshotWriter.__STOP:
+                break
+            if self.error is not None:
+                # keep draining, so that the producer never blocks forever on a failed writer
+                continue
+            step, payload = item
+            try:
+                self.sink.write(step, payload)
+                self.written_steps += 1
+                self.written_bytes += len(payload)
+            except Exception as e:
+                logging.error("snapshot writer failed on step %d: %s" % (step, e))
+                self.error = e
+
+    def close(self):
+        """Drains pending steps, then flushes and fsyncs the sink."""
+        start_time = time.time()
+        self.queue.put(SnapshotWriter.__STOP)
+        self.join()
+        self.blocked_time += time.time() - start_time
+        self.sink.close()
+        if self.error is not None:
+            raise self.error
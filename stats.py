@@ -1,29 +1,150 @@
-from numpy import mean
-from numpy import std
+from numpy import mean, std, asarray, full, nan, isnan, zeros, empty, where, flatnonzero, sqrt as array_sqrt, errstate, \
+    percentile
+from numpy.random import RandomState
 from scipy import stats
 from math import sqrt
 
 
+def critical_value(level=0.95, method='t', dof=None):
+    # dof may be an array (one per step), t.ppf is evaluated for all of them at once
+    if method == 't':
+        return stats.t.ppf((level + 1) / 2, dof)
+    elif method == 'z':
+        return stats.norm.ppf((level + 1) / 2)
+    raise ValueError("unknown method {}".format(method))
+
+
 def confidence_interval(sample, level=0.95, method='t'):
     mean_val = mean(sample)
     n = len(sample)
-    stdev = std(sample)
-    if method == 't':
-        test_stat = stats.t.ppf((level + 1) / 2, n)
-    elif method == 'z':
-        test_stat = stats.norm.ppf((level + 1) / 2)
+    if n < 2:
+        return mean_val, mean_val
+    # sample standard deviation with n - 1 degrees of freedom
+    stdev = std(sample, ddof=1)
+    test_stat = critical_value(level, method, n - 1)
     lower_bound = mean_val - test_stat * stdev / sqrt(n)
     upper_bound = mean_val + test_stat * stdev / sqrt(n)
 
     return lower_bound, upper_bound
 
 
+def as_samples(sample_series):
+    """(steps x runs) float array of samples per step, rows shorter than the longest one are padded with nan."""
+    if hasattr(sample_series, 'ndim') and sample_series.ndim == 2:
+        return asarray(sample_series, dtype=float)
+    runs = max([len(samples) for samples in sample_series] or [0])
+    samples = full((len(sample_series), runs), nan)
+    for t, step_samples in enumerate(sample_series):
+        samples[t, :len(step_samples)] = step_samples
+    return samples
+
+
+class EnsembleStats:
+    """Count, mean and sum of squared deviations (Welford) of the samples of every step, so that means, variances and
+    confidence intervals per step are at hand while runs are still read or produced. Accumulators of disjoint
+    samples (i.e. of runs read by different workers) are combined by merge; nan samples are ignored."""
+
+    def __init__(self, steps):
+        self.count = zeros(steps)
+        self.mean = zeros(steps)
+        self.m2 = zeros(steps)
+
+    @staticmethod
+    def of(sample_series):
+        """Statistics of all samples of a (steps x runs) array or of samples per step at once."""
+        samples = as_samples(sample_series)
+        ensemble = EnsembleStats(samples.shape[0])
+        present = ~isnan(samples)
+        ensemble.count = present.sum(axis=1).astype(float)
+        with errstate(invalid='ignore', divide='ignore'):
+            ensemble.mean = where(present, samples, 0.0).sum(axis=1) / ensemble.count
+        ensemble.mean[ensemble.count == 0] = 0.0
+        ensemble.m2 = (where(present, samples - ensemble.mean[:, None], 0.0) ** 2).sum(axis=1)
+        return ensemble
+
+    def add(self, values):
+        """Adds a sample to every step, i.e. the series of a run (nan where the run has no sample)."""
+        values = asarray(values, dtype=float)
+        present = ~isnan(values)
+        self.count[present] += 1
+        delta = values[present] - self.mean[present]
+        self.mean[present] += delta / self.count[present]
+        self.m2[present] += delta * (values[present] - self.mean[present])
+
+    def add_sample(self, step, value):
+        self.count[step] += 1
+        delta = value - self.mean[step]
+        self.mean[step] += delta / self.count[step]
+        self.m2[step] += delta * (value - self.mean[step])
+
+    def merge(self, other):
+        """Adds the samples accumulated by other (Chan et al. pairwise update)."""
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with errstate(invalid='ignore', divide='ignore'):
+            mean = where(count > 0, self.mean + delta * other.count / count, 0.0)
+            m2 = where(count > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / count, 0.0)
+        self.count, self.mean, self.m2 = count, mean, m2
+        return self
+
+    def means(self):
+        return where(self.count > 0, self.mean, nan)
+
+    def variances(self, ddof=1):
+        with errstate(invalid='ignore', divide='ignore'):
+            return where(self.count > ddof, self.m2 / (self.count - ddof), nan)
+
+    def confidence_intervals(self, level=0.95, method='t'):
+        """(lower bounds, upper bounds) per step; steps of a single sample collapse to it, steps of none are nan."""
+        several = self.count >= 2
+        half_widths = zeros(len(self.count))
+        if several.any():
+            n = self.count[several]
+            test_stat = critical_value(level, method, n - 1)
+            half_widths[several] = test_stat * array_sqrt(self.m2[several] / (n - 1)) / array_sqrt(n)
+        means = self.means()
+        return means - half_widths, means + half_widths
+
+
+# number of resampled values bootstrap_confidence_intervals holds at once (float64, 32MB)
+BOOTSTRAP_CHUNK = 2 ** 22
+
+
+def bootstrap_confidence_intervals(sample_series, level=0.95, resamples=1000, seed=None, chunk=BOOTSTRAP_CHUNK):
+    """Percentile bootstrap intervals of the mean per step, the runs of all steps are resampled the same way, in
+    blocks of steps (and of resamples) of at most chunk resampled values. Rows with missing (nan) samples are
+    resampled among their present samples."""
+    samples = as_samples(sample_series)
+    random = RandomState(seed)
+    lower = full(samples.shape[0], nan)
+    upper = full(samples.shape[0], nan)
+    present = ~isnan(samples)
+    counts = present.sum(axis=1)
+    # steps with the same number of samples are resampled together
+    for n in sorted(set(counts.tolist()) - {0}):
+        steps = flatnonzero(counts == n)
+        packed = samples[steps][present[steps]].reshape(-1, n)
+        picks = random.randint(0, n, size=(resamples, n))
+        step_block = max(1, chunk // (resamples * n))
+        resample_block = max(1, chunk // (step_block * n))
+        for first in range(0, len(steps), step_block):
+            block = packed[first:first + step_block]
+            resampled_means = empty((len(block), resamples))
+            for pick in range(0, resamples, resample_block):
+                resampled_means[:, pick:pick + resample_block] = block[:, picks[pick:pick + resample_block]].mean(axis=2)
+            lower[steps[first:first + step_block]], upper[steps[first:first + step_block]] = \
+                percentile(resampled_means, [50 * (1 - level), 50 * (1 + level)], axis=1)
+    return lower, upper
+
+
 def means(sample_series):
-    return [mean(sample_series[t]) for t in range(len(sample_series))]
+    return EnsembleStats.of(sample_series).means().tolist()
 
 
-def confidence_intervals(sample_series):
-    cis = [confidence_interval(sample_series[t]) for t in range(len(sample_series))]
-    cis_l = [i[0] for i in cis]
-    cis_u = [i[1] for i in cis]
-    return cis_l, cis_u
+def confidence_intervals(sample_series, level=0.95, method='t'):
+    """Lists of lower and upper bounds per step, method is t, z or bootstrap."""
+    if method == 'bootstrap':
+        cis_l, cis_u = bootstrap_confidence_intervals(sample_series, level)
+    else:
+        cis_l, cis_u = EnsembleStats.of(sample_series).confidence_intervals(level, method)
+    return cis_l.tolist(), cis_u.tolist()
@@ -19,6 +19,10 @@ class ContextFactory:
         self.new_stimulus = stimulus_factory
 
     def __call__(self):
+        return self.fill([None, None])
+
+    def fill(self, context):
+        """Draws a context into the given list (i.e. of a reused game)."""
         s1 = self.new_stimulus()
         s2 = self.new_stimulus()
 
@@ -26,7 +30,9 @@ class ContextFactory:
             s1 = self.new_stimulus()
             s2 = self.new_stimulus()
 
-        return [s1, s2]
+        context[0] = s1
+        context[1] = s2
+        return context
 
 
 class NumericBasedStimulusFactory(AbstractStimulusFactory):
@@ -0,0 +1,112 @@
+from abc import ABC, abstractmethod
+from collections import deque
+
+from numpy import arange, asarray
+
+from metrics import METRICS_DTYPE
+
+
+class WindowCriterion(ABC):
+    """Base of criteria evaluated over the last `window` values of a metric (see metrics.METRICS_DTYPE), subclasses
+    name themselves and measure the values."""
+
+    def __init__(self, metric, window, threshold):
+        if metric not in METRICS_DTYPE.names:
+            raise ValueError('unknown metric {}, expected one of {}'.format(metric, METRICS_DTYPE.names))
+        self.metric = metric
+        self.window = window
+        self.threshold = threshold
+        self.values = deque(maxlen=window)
+
+    def update(self, record):
+        self.values.append(float(record[self.metric]))
+
+    def is_met(self):
+        return len(self.values) == self.window and self.measure(asarray(self.values)) <= self.threshold
+
+    @abstractmethod
+    def measure(self, values):
+        """The value compared with the threshold."""
+
+    def describe(self):
+        return '{} of {} over {} steps <= {}'.format(self.name, self.metric, self.window, self.threshold)
+
+
+class SlopeCriterion(WindowCriterion):
+    """Met when the absolute least squares slope (percents per step) of the metric flattens."""
+    name = 'slope'
+
+    def measure(self, values):
+        x = arange(len(values)) - (len(values) - 1) / 2.0
+        return abs((x * (values - values.mean())).sum() / (x * x).sum())
+
+
+class VarianceCriterion(WindowCriterion):
+    """Met when the variance of the metric drops below threshold."""
+    name = 'variance'
+
+    def measure(self, values):
+        return values.var()
+
+
+class LexiconSizeCriterion(WindowCriterion):
+    """Met when the mean lexicon size of the population stays within `tolerance` words over the window."""
+    name = 'lexicon size range'
+
+    def __init__(self, window, tolerance):
+        WindowCriterion.__init__(self, 'lexicon', window, tolerance)
+
+    def measure(self, values):
+        return values.max() - values.min()
+
+
+class StoppingCriteria:
+    """Stops a run once every criterion is met, but not before min_steps."""
+
+    def __init__(self, criteria, min_steps=0):
+        self.criteria = criteria
+        self.min_steps = min_steps
+
+    def __len__(self):
+        return len(self.criteria)
+
+    def update(self, record):
+        """Feeds the metrics record of a step, returns the stop reason or None if the run should go on."""
+        for criterion in self.criteria:
+            criterion.update(record)
+        if not self.criteria or record['step'] + 1 < self.min_steps:
+            return None
+        if all(criterion.is_met() for criterion in self.criteria):
+            return ', '.join(criterion.describe() for criterion in self.criteria)
+        return None
+
+
+def split_spec(spec, form, types):
+    """Fields of a criterion spec of the form (i.e. 'window:tolerance') converted to the types, ValueError naming
+    the spec if malformed."""
+    fields = spec.split(':')
+    try:
+        if len(fields) != len(types):
+            raise ValueError('expected {}'.format(form))
+        return [field_type(field) for field_type, field in zip(types, fields)]
+    except ValueError as e:
+        raise ValueError('malformed stopping criterion {}: {}'.format(spec, e))
+
+
+def new_stopping_criteria(params):
+    """Builds criteria from the simulation params:
+    stop_slope, stop_variance - lists of 'metric:window:threshold', i.e. ds:200:0.01
+    stop_lexicon - 'window:tolerance', i.e. 200:0.5
+    stop_min_steps - number of steps each run makes regardless of criteria.
+    Raises ValueError on malformed specs."""
+    criteria = []
+    for spec in params.get('stop_slope') or []:
+        metric, window, threshold = split_spec(spec, 'metric:window:threshold', (str, int, float))
+        criteria.append(SlopeCriterion(metric, window, threshold))
+    for spec in params.get('stop_variance') or []:
+        metric, window, threshold = split_spec(spec, 'metric:window:threshold', (str, int, float))
+        criteria.append(VarianceCriterion(metric, window, threshold))
+    if params.get('stop_lexicon'):
+        window, tolerance = split_spec(params['stop_lexicon'], 'window:tolerance', (int, float))
+        criteria.append(LexiconSizeCriterion(window, tolerance))
+    return StoppingCriteria(criteria, params.get('stop_min_steps') or 0)
@@ -0,0 +1,84 @@
+from __future__ import division  # force python 3 division in python 2
+
+from numpy import zeros
+
+# default number of last results a success measure is computed over
+WINDOW = 50
+
+
+class SuccessWindow(object):
+    """The last `size` results (0/1 or booleans) in a ring with their running sum, so storing a result and the success
+    (mean) are O(1). Like the deques it replaces, a window starts with a single failure by default and iterates over
+    its results from the oldest one. A window attached to WindowTotals keeps its entry there up to date."""
+    __slots__ = ('size', 'results', 'length', 'last', 'sum', 'totals', 'index')
+
+    def __init__(self, size=WINDOW, results=(0,)):
+        self.size = size
+        self.results = [0] * size
+        self.length = 0
+        self.last = size - 1
+        self.sum = 0
+        self.totals = None
+        self.index = 0
+        for result in results:
+            self.store(result)
+
+    def store(self, result):
+        if self.length == self.size:
+            self.last = (self.last + 1) % self.size
+            self.sum -= self.results[self.last]
+        else:
+            self.last = self.length
+            self.length += 1
+        self.results[self.last] = result
+        self.sum += result
+        if self.totals is not None:
+            self.totals.sums[self.index] = self.sum
+            self.totals.lengths[self.index] = self.length
+
+    def switch_last(self):
+        result = self.results[self.last]
+        self.results[self.last] = 1 - result
+        self.sum += 1 - 2 * result
+        if self.totals is not None:
+            self.totals.sums[self.index] = self.sum
+
+    def mean(self):
+        return self.sum / self.length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        if self.length < self.size:
+            return iter(self.results[:self.length])
+        return iter(self.results[self.last + 1:] + self.results[:self.last + 1])
+
+    def __getstate__(self):
+        return self.size, list(self)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class WindowTotals:
+    """Running sums and lengths of a group of windows (i.e. one per agent of a population) in arrays, updated in place
+    by the windows as they store results, so that the mean success of the group needs no pass over the windows."""
+
+    def __init__(self, windows):
+        self.sums = zeros(len(windows))
+        self.lengths = zeros(len(windows))
+        for index, window in enumerate(windows):
+            window.totals = self
+            window.index = index
+            self.sums[index] = window.sum
+            self.lengths[index] = window.length
+
+    def mean_success(self):
+        # in percents
+        return (self.sums / self.lengths * 100.0).mean()
+
+
+def as_success_window(scores, size=WINDOW):
+    """Scores of agents pickled before success windows (deques) as a window."""
+    return scores if isinstance(scores, SuccessWindow) else SuccessWindow(size, scores)
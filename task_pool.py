@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+import traceback
+from multiprocessing import Pool, cpu_count
+
+
+def run_task(function, args):
+    """Runs a task in a worker, returns (None, result) or (traceback, None) if it failed."""
+    try:
+        return None, function(*args)
+    except Exception:
+        return traceback.format_exc(), None
+
+
+class TaskPool:
+    """Bounded pool of worker processes pulling tasks one by one from a shared queue, so that a worker which is done
+    takes the next task whatever the sizes of the tasks (no static chunks).
+
+    submit blocks while max_pending tasks are queued or running, which bounds the memory held by their arguments.
+    Results are handed to the callback of the task in the main process; failures are collected as (task key,
+    traceback) and the progress is logged every report_interval seconds. Functions run by the workers must be module
+    level functions; initializer(*initargs) sets up every worker once."""
+
+    def __init__(self, processes=0, initializer=None, initargs=(), max_pending=None, name='tasks',
+                 report_interval=10.0):
+        self.processes = processes or cpu_count()
+        self.name = name
+        self.report_interval = report_interval
+        self.slots = threading.Semaphore(max_pending or 4 * self.processes)
+        self.submitted = 0
+        self.done = 0
+        self.failures = []
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.pool = Pool(self.processes, initializer, initargs)
+
+    def submit(self, function, args, key=None, callback=None):
+        self.slots.acquire()
+        self.submitted += 1
+        self.pool.apply_async(run_task, (function, args),
+                              callback=lambda result: self.on_result(key, callback, result),
+                              error_callback=lambda error: self.on_result(key, None, (repr(error), None)))
+
+    def on_result(self, key, callback, result):
+        # runs in the result handler thread of the pool
+        error, value = result
+        try:
+            if error is None and callback is not None:
+                try:
+                    callback(value)
+                except Exception:
+                    # an exception escaping here would kill the result handler thread and block submit forever
+                    error = traceback.format_exc()
+            if error is not None:
+                self.failures.append((key, error))
+                logging.error("{} task {} failed:\n{}".format(self.name, key, error))
+        finally:
+            self.done += 1
+            self.slots.release()
+        now = time.time()
+        if now - self.last_report >= self.report_interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = time.time() - self.start_time
+        logging.info("{}: {} of {} done ({:.1f}/sec), {} failed".format(
+            self.name, self.done, self.submitted, self.done / max(elapsed, 1e-9), len(self.failures)))
+
+    def close(self):
+        """Waits for all submitted tasks, returns the failures."""
+        self.pool.close()
+        self.pool.join()
+        self.report()
+        return self.failures
@@ -0,0 +1,40 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import dill
+import pytest
+
+from inmemory_calculus import generate_inmemory_calculus, save_inmemory_calculus
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_PATH = Path(__file__).resolve().parent.joinpath('data')
+
+
+def run_script(script, *args, status=0):
+    """Runs a script of the repository in a separate interpreter, fails the test unless it exits with the status.
+    Returns its output."""
+    completed = subprocess.run([sys.executable, str(REPO_ROOT.joinpath(script))] + [str(arg) for arg in args],
+                               cwd=str(REPO_ROOT), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert completed.returncode == status, completed.stdout.decode()
+    return completed.stdout.decode()
+
+
+@pytest.fixture
+def calculus_path(tmp_path):
+    """Generated quotient calculus (max denominator 20) laid out as the precomputed one."""
+    path = tmp_path.joinpath('calculus')
+    save_inmemory_calculus(str(path), 'quotient', generate_inmemory_calculus('quotient', 20))
+    return path
+
+
+@pytest.fixture
+def baseline_run(tmp_path):
+    """Copy of a simulation of 4 agents over 10 steps written by the code before the metrics file and --seed (steps
+    pickled as (step, population) with the metric histories in lists), with a generated calculus."""
+    path = tmp_path.joinpath('baseline_run')
+    shutil.copytree(str(DATA_PATH.joinpath('baseline_run')), str(path))
+    with path.joinpath('inmem_calc.p').open('wb') as write_handle:
+        dill.dump(generate_inmemory_calculus('quotient', 20), write_handle)
+    return path
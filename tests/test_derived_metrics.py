@@ -0,0 +1,39 @@
+import threading
+
+import dill
+
+from conftest import run_script
+from derived_metrics import DerivedMetricsCache
+
+
+def test_cache_is_shared_by_gathering_and_scanning_threads(tmp_path, calculus_path):
+    simulation_path = tmp_path.joinpath('simulation')
+    run_script('simulation.py', '-sn', simulation_path, '-p', 4, '-s', 10, '-r', 2, '-mn', 20, '-sd', 1,
+               '-path', calculus_path, '-np', 1, '-ll', 'WARNING')
+    with simulation_path.joinpath('stimuluses.p').open('rb') as read_handle:
+        stimuli = dill.load(read_handle)
+    cache = DerivedMetricsCache(simulation_path, stimuli)
+    misses = []
+
+    def gather(name):
+        # as the result thread of the task pool and the scanning thread do
+        for _ in range(20):
+            for run in range(2):
+                for step in range(10):
+                    cache.put(run, step, name, [run, step])
+                    if cache.get(run, step, name) != [run, step]:
+                        misses.append((name, run, step))
+
+    threads = [threading.Thread(target=gather, args=(name,)) for name in ['convexity', 'monotonicity']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert misses == []
+    cache.flush()
+
+    reloaded = DerivedMetricsCache(simulation_path, stimuli)
+    for run in range(2):
+        for step in range(10):
+            assert reloaded.get(run, step, 'convexity') == [run, step]
+            assert reloaded.get(run, step, 'monotonicity') == [run, step]
@@ -0,0 +1,59 @@
+import pickle
+
+import dill
+import numpy
+import pytest
+
+import perception
+from agent import Population
+from engine_parity import SIMULATION_PARAMS, SharedDraws, check_parity, compare_populations
+from inmemory_calculus import generate_inmemory_calculus, inmem
+from language import Language
+from stimulus import QuotientBasedStimulusFactory
+from vectorized_engine import ContextSampler, StackedPopulation
+
+
+@pytest.fixture(autouse=True)
+def restore_calculus():
+    # check_parity loads its calculus into the shared inmem
+    saved = dict(inmem)
+    yield
+    inmem.clear()
+    inmem.update(saved)
+
+
+@pytest.mark.parametrize('stimulus', ['quotient', 'numeric'])
+@pytest.mark.parametrize('guessing_game_2', [False, True])
+def test_engines_play_the_same_games(stimulus, guessing_game_2):
+    params = {'stimulus': stimulus, 'max_num': 20, 'population_size': 10, 'steps': 60,
+              'guessing_game_2': guessing_game_2, 'seed': 1}
+    counts = check_parity(params)
+    assert counts.sum() == 60 * 5
+
+
+def test_shared_draws_restore_patched_functions():
+    choice, add_new_word = perception.choice, Language.add_new_word
+    with pytest.raises(AssertionError):
+        with SharedDraws():
+            assert perception.choice is not choice
+            assert Language.add_new_word is not add_new_word
+            raise AssertionError('engines differ')
+    assert perception.choice is choice
+    assert Language.add_new_word is add_new_word
+
+
+def test_stacked_agents_unpickle_as_their_agents():
+    params = dict(SIMULATION_PARAMS, stimulus='quotient', max_num=20, population_size=10, guessing_game_2=True)
+    inmem.update(generate_inmemory_calculus('quotient', 20))
+    sampler = ContextSampler(QuotientBasedStimulusFactory(inmem['STIMULUS_LIST'], 20))
+    stacked = StackedPopulation.from_populations([Population(params)], params, sampler)
+    rng = numpy.random.default_rng(2)
+    for _ in range(30):
+        stacked.play_round([rng])
+
+    population = stacked.to_population(0)
+    snapshot = Population(params)
+    # snapshots are written by dill and read by pickle
+    snapshot.agents = pickle.loads(dill.dumps(stacked.run_agents(0)))
+    compare_populations(30, population, snapshot)
+    assert [len(agent.get_lexicon()) for agent in snapshot.agents] == stacked.word_count.tolist()
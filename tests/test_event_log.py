@@ -0,0 +1,88 @@
+import shutil
+
+import numpy
+import pytest
+
+from conftest import run_script
+from event_log import GAME_EVENT_DTYPE, GameEventLog, read_events, read_event_words, truncate_events
+from record_file import RecordFormatError
+
+
+def games(words):
+    events = numpy.zeros(len(words), dtype=GAME_EVENT_DTYPE)
+    events['game'] = numpy.arange(len(words))
+    return events
+
+
+def test_new_words_are_appended(tmp_path):
+    events_path, words_path = tmp_path.joinpath('events.bin'), tmp_path.joinpath('event_words.bin')
+    log = GameEventLog(events_path, words_path)
+    log.record_games(0, games(['ab', 'cd', None]), ['ab', 'cd', None])
+    written = words_path.read_bytes()
+    log.record_games(1, games(['cd', 'ab']), ['cd', 'ab'])
+    assert words_path.read_bytes() == written
+    log.record_games(2, games(['ef']), ['ef'])
+    log.close()
+    # the table only grows, words written before are left as they are
+    assert words_path.read_bytes().startswith(written)
+
+    events = read_events(events_path)
+    assert events['step'].tolist() == [0, 0, 0, 1, 1, 2]
+    words = read_event_words(words_path)
+    assert words == ['ab', 'cd', 'ef']
+    assert [words[word] if word >= 0 else None for word in events['word'].tolist()] == \
+        ['ab', 'cd', None, 'cd', 'ab', 'ef']
+
+
+def test_torn_word_is_dropped_and_table_continued(tmp_path):
+    events_path, words_path = tmp_path.joinpath('events.bin'), tmp_path.joinpath('event_words.bin')
+    log = GameEventLog(events_path, words_path)
+    log.record_games(0, games(['ab', 'cd']), ['ab', 'cd'])
+    log.close()
+    with words_path.open('ab') as write_handle:
+        write_handle.write(b'\x05\x00\x00\x00ef')
+    assert read_event_words(words_path) == ['ab', 'cd']
+
+    log = GameEventLog(events_path, words_path)
+    log.record_games(1, games(['gh', 'ab']), ['gh', 'ab'])
+    log.close()
+    assert read_event_words(words_path) == ['ab', 'cd', 'gh']
+    assert read_events(events_path)['word'].tolist() == [0, 1, 2, 0]
+
+
+def test_files_without_header_are_rejected(tmp_path):
+    events_path, words_path = tmp_path.joinpath('events.bin'), tmp_path.joinpath('event_words.bin')
+    games(['ab']).tofile(str(events_path))
+    words_path.write_bytes(b'\x80\x03]q\x00.')
+    with pytest.raises(RecordFormatError):
+        read_events(events_path)
+    with pytest.raises(RecordFormatError):
+        read_event_words(words_path)
+    with pytest.raises(RecordFormatError):
+        truncate_events(events_path, 0)
+
+
+def test_truncated_events_keep_header(tmp_path):
+    events_path, words_path = tmp_path.joinpath('events.bin'), tmp_path.joinpath('event_words.bin')
+    log = GameEventLog(events_path, words_path)
+    for step in range(5):
+        log.record_games(step, games(['ab']), ['ab'])
+    log.close()
+    truncate_events(events_path, 2)
+    assert read_events(events_path)['step'].tolist() == [0, 1, 2]
+
+
+def test_resumed_run_logs_events_as_an_uninterrupted_one(tmp_path, calculus_path):
+    uninterrupted = tmp_path.joinpath('uninterrupted')
+    run_script('simulation.py', '-sn', uninterrupted, '-p', 6, '-s', 20, '-r', 1, '-mn', 20, '-sd', 3,
+               '-path', calculus_path, '-np', 1, '-ll', 'WARNING', '-ev', 1)
+    interrupted = tmp_path.joinpath('interrupted')
+    shutil.copytree(str(uninterrupted), str(interrupted))
+    for step in range(10, 20):
+        interrupted.joinpath('run0', 'data', 'step{}.p'.format(step)).unlink()
+
+    run_script('simulation.py', '-l', interrupted, '-ll', 'WARNING')
+
+    expected, resumed = uninterrupted.joinpath('run0'), interrupted.joinpath('run0')
+    assert read_events(resumed.joinpath('events.bin')).tolist() == read_events(expected.joinpath('events.bin')).tolist()
+    assert read_event_words(resumed.joinpath('event_words.bin')) == read_event_words(expected.joinpath('event_words.bin'))
@@ -0,0 +1,94 @@
+import struct
+
+import numpy
+import pytest
+
+from conftest import run_script
+from data_postprocess import read_run_metrics
+from metrics import METRICS_DTYPE, METRICS_HEADER, METRICS_MAGIC, METRICS_VERSION, MetricsFormatError, \
+    MetricsRecorder, read_metrics, truncate_metrics, metrics_of_history
+
+
+class StepPopulation:
+
+    def __init__(self, step):
+        self.ds = self.cs1 = self.cs2 = self.cs12 = float(step)
+        self.lexicon_size = step / 2.0
+        self.outcome_counts = [step] * (len(METRICS_DTYPE.names) - 6)
+
+
+def record_steps(metrics_path, steps, flush_every=3):
+    recorder = MetricsRecorder(metrics_path, len(steps), flush_every=flush_every)
+    for step in steps:
+        recorder.record(step, StepPopulation(step))
+    recorder.close()
+
+
+def test_records_round_trip_behind_header(tmp_path):
+    metrics_path = tmp_path.joinpath('metrics.bin')
+    record_steps(metrics_path, range(10))
+
+    with metrics_path.open('rb') as read_handle:
+        assert METRICS_HEADER.unpack(read_handle.read(METRICS_HEADER.size)) == \
+            (METRICS_MAGIC, METRICS_VERSION, len(METRICS_DTYPE.names))
+    records = read_metrics(metrics_path)
+    assert records['step'].tolist() == list(range(10))
+    assert records['lexicon'].tolist() == [step / 2.0 for step in range(10)]
+
+
+def test_appending_recorder_writes_a_single_header(tmp_path):
+    metrics_path = tmp_path.joinpath('metrics.bin')
+    record_steps(metrics_path, range(5))
+    record_steps(metrics_path, range(5, 8))
+    assert read_metrics(metrics_path)['step'].tolist() == list(range(8))
+
+
+def test_truncate_keeps_header(tmp_path):
+    metrics_path = tmp_path.joinpath('metrics.bin')
+    record_steps(metrics_path, range(10))
+    assert truncate_metrics(metrics_path, 4)['step'].tolist() == list(range(5))
+    assert read_metrics(metrics_path)['step'].tolist() == list(range(5))
+
+
+def test_headerless_file_is_rejected(tmp_path):
+    metrics_path = tmp_path.joinpath('metrics.bin')
+    numpy.zeros(3, dtype=METRICS_DTYPE).tofile(str(metrics_path))
+    with pytest.raises(MetricsFormatError):
+        read_metrics(metrics_path)
+    with pytest.raises(MetricsFormatError):
+        truncate_metrics(metrics_path, 1)
+
+
+def test_other_layout_is_rejected(tmp_path):
+    metrics_path = tmp_path.joinpath('metrics.bin')
+    with metrics_path.open('wb') as write_handle:
+        write_handle.write(METRICS_HEADER.pack(METRICS_MAGIC, METRICS_VERSION, len(METRICS_DTYPE.names) - 1))
+        write_handle.write(struct.pack('<i', 0) * 10)
+    with pytest.raises(MetricsFormatError):
+        read_metrics(metrics_path)
+
+
+def test_metrics_of_history():
+    records = metrics_of_history({'ds': [0.0, 10.0, 20.0], 'cs1': [0.0, 5.0, 7.5]})
+    assert records['step'].tolist() == [0, 1, 2]
+    assert records['ds'].tolist() == [0.0, 10.0, 20.0]
+    assert records['cs1'].tolist() == [0.0, 5.0, 7.5]
+    assert records['cs2'].tolist() == [0.0, 0.0, 0.0]
+
+
+def test_runs_without_metrics_file_use_snapshot_histories(baseline_run):
+    records = read_run_metrics(baseline_run.joinpath('run0'))
+    assert records['step'].tolist() == list(range(10))
+
+    run_script('data_postprocess.py', '-d', baseline_run, '-s', 1)
+    assert baseline_run.joinpath('stats', 'succ.pdf').exists()
+
+
+def test_run_without_metrics_nor_histories_is_named(tmp_path, calculus_path):
+    simulation_path = tmp_path.joinpath('simulation')
+    run_script('simulation.py', '-sn', simulation_path, '-p', 4, '-s', 5, '-r', 1, '-mn', 20, '-sd', 1,
+               '-path', calculus_path, '-np', 1, '-ll', 'WARNING')
+    run_path = simulation_path.joinpath('run0')
+    run_path.joinpath('metrics.bin').unlink()
+    with pytest.raises(FileNotFoundError, match=str(run_path)):
+        read_run_metrics(run_path)
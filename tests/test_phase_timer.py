@@ -0,0 +1,39 @@
+import numpy
+import pytest
+
+from phase_timer import PhaseTimer, TIMINGS_DTYPE, PHASES, NAMING, read_timings, truncate_timings, summarize_timings
+from record_file import RecordFormatError
+
+
+def time_steps(timings_path, steps):
+    timer = PhaseTimer(timings_path, len(steps), flush_every=3)
+    for step in steps:
+        previous = timer.switch(NAMING)
+        timer.switch(previous)
+        timer.end_step(step)
+    timer.close()
+
+
+def test_timings_round_trip_behind_header(tmp_path):
+    timings_path = tmp_path.joinpath('timings.bin')
+    time_steps(timings_path, range(7))
+    time_steps(timings_path, range(7, 10))
+    records = read_timings(timings_path)
+    assert records['step'].tolist() == list(range(10))
+    assert (records['naming'] >= 0).all() and (records['round'] > 0).all()
+    assert summarize_timings(records)[0].startswith('10 steps')
+    assert len(summarize_timings(records)) == len(PHASES) + 1
+
+
+def test_truncate_keeps_header(tmp_path):
+    timings_path = tmp_path.joinpath('timings.bin')
+    time_steps(timings_path, range(10))
+    truncate_timings(timings_path, 3)
+    assert read_timings(timings_path)['step'].tolist() == list(range(4))
+
+
+def test_headerless_timings_are_rejected(tmp_path):
+    timings_path = tmp_path.joinpath('timings.bin')
+    numpy.zeros(3, dtype=TIMINGS_DTYPE).tofile(str(timings_path))
+    with pytest.raises(RecordFormatError):
+        read_timings(timings_path)
@@ -0,0 +1,60 @@
+import shutil
+
+import dill
+import numpy
+
+from conftest import run_script
+from metrics import read_metrics
+
+
+def load_step(run_path, step):
+    with run_path.joinpath('data', 'step{}.p'.format(step)).open('rb') as read_handle:
+        return dill.load(read_handle)
+
+
+def test_baseline_population_is_reduced_to_last_metrics(baseline_run):
+    step, population = load_step(baseline_run.joinpath('run0'), 9)[:2]
+    assert step == 9
+    for metric in ['ds', 'cs1', 'cs2', 'cs12']:
+        assert isinstance(getattr(population, metric), float)
+    assert population.lexicon_size == numpy.mean([len(agent.get_lexicon()) for agent in population.agents])
+    assert population.outcome_counts == [0] * len(population.outcome_counts)
+    population.update_metrics()
+
+
+def test_resume_baseline_run(baseline_run):
+    run_path = baseline_run.joinpath('run0')
+    for step in range(5, 10):
+        run_path.joinpath('data', 'step{}.p'.format(step)).unlink()
+
+    run_script('simulation.py', '-l', baseline_run, '-ll', 'WARNING')
+
+    records = read_metrics(run_path.joinpath('metrics.bin'))
+    assert records['step'].tolist() == list(range(10))
+    for step in range(10):
+        assert run_path.joinpath('data', 'step{}.p'.format(step)).exists()
+    # steps before the interruption are backfilled from their snapshots
+    for step in range(5):
+        population = load_step(run_path, step)[1]
+        assert records['ds'][step] == numpy.float32(population.ds)
+        assert records['lexicon'][step] == numpy.float32(population.lexicon_size)
+
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path, calculus_path):
+    uninterrupted = tmp_path.joinpath('uninterrupted')
+    run_script('simulation.py', '-sn', uninterrupted, '-p', 6, '-s', 20, '-r', 1, '-mn', 20, '-sd', 3,
+               '-path', calculus_path, '-np', 1, '-ll', 'WARNING')
+    interrupted = tmp_path.joinpath('interrupted')
+    shutil.copytree(str(uninterrupted), str(interrupted))
+    # as if the run had been killed after the snapshot of step 9
+    for step in range(10, 20):
+        interrupted.joinpath('run0', 'data', 'step{}.p'.format(step)).unlink()
+
+    run_script('simulation.py', '-l', interrupted, '-ll', 'WARNING')
+
+    expected = read_metrics(uninterrupted.joinpath('run0', 'metrics.bin'))
+    resumed = read_metrics(interrupted.joinpath('run0', 'metrics.bin'))
+    assert resumed.tolist() == expected.tolist()
+    expected_agents = load_step(uninterrupted.joinpath('run0'), 19)[1].agents
+    resumed_agents = load_step(interrupted.joinpath('run0'), 19)[1].agents
+    assert [agent.get_lexicon() for agent in resumed_agents] == [agent.get_lexicon() for agent in expected_agents]
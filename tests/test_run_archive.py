@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import run_archive
+from run_archive import RunArchive, RunArchiveReader, journal_path, JOURNAL_ENTRY
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Offsets the recovery of readers scanned records from, None for scans of the whole archive."""
+    offsets = []
+    scan_records = run_archive.scan_records
+
+    def recorded_scan(read_handle, index=None, offset=None):
+        offsets.append(offset)
+        return scan_records(read_handle, index, offset)
+    monkeypatch.setattr(run_archive, 'scan_records', recorded_scan)
+    return offsets
+
+
+def payload(step):
+    return 'payload of step {}'.format(step).encode('utf-8') * (step + 1)
+
+
+def test_closed_archive_is_read_from_its_index(tmp_path, scans):
+    archive_path = tmp_path.joinpath('steps.pack')
+    with RunArchive(archive_path) as archive:
+        for step in range(5):
+            archive.write(step, payload(step))
+    assert not os.path.exists(journal_path(archive_path))
+
+    reader = RunArchiveReader(archive_path)
+    assert reader.steps() == list(range(5))
+    assert [reader.read_step(step) for step in range(5)] == [payload(step) for step in range(5)]
+    assert scans == []
+
+
+def test_live_archive_is_opened_from_its_journal(tmp_path, scans):
+    archive_path = tmp_path.joinpath('steps.pack')
+    archive = RunArchive(archive_path)
+    sizes = []
+    for step in range(5):
+        archive.write(step, payload(step))
+        reader = RunArchiveReader(archive_path)
+        assert reader.steps() == list(range(step + 1))
+        assert reader.read_step(step) == payload(step)
+        sizes.append(os.path.getsize(str(archive_path)))
+    # only the end of the archive behind the journaled records is scanned
+    assert scans == sizes
+    archive.close()
+
+
+def test_killed_writer_is_recovered_from_journal_and_tail(tmp_path, scans):
+    archive_path = tmp_path.joinpath('steps.pack')
+    archive = RunArchive(archive_path)
+    for step in range(5):
+        archive.write(step, payload(step))
+    archive.journal.close()
+    archive.handle.close()
+    # killed after writing the record of step 4 but before journaling it, and in the middle of the next record
+    with open(journal_path(archive_path), 'r+b') as journal:
+        journal.truncate(os.path.getsize(journal_path(archive_path)) - JOURNAL_ENTRY.size - len('step4'))
+    with open(str(archive_path), 'ab') as write_handle:
+        write_handle.write(b'CQRC\x01')
+
+    assert RunArchiveReader(archive_path).steps() == list(range(5))
+    with RunArchive(archive_path) as resumed:
+        resumed.write(5, payload(5))
+    reader = RunArchiveReader(archive_path)
+    assert [reader.read_step(step) for step in range(6)] == [payload(step) for step in range(6)]
+    assert None not in scans
+
+
+def test_archive_without_journal_is_scanned(tmp_path, scans):
+    archive_path = tmp_path.joinpath('steps.pack')
+    archive = RunArchive(archive_path)
+    for step in range(3):
+        archive.write(step, payload(step))
+    archive.journal.close()
+    archive.handle.close()
+    os.remove(journal_path(archive_path))
+
+    assert RunArchiveReader(archive_path).steps() == list(range(3))
+    assert scans == [None]
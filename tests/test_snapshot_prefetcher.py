@@ -0,0 +1,45 @@
+import threading
+
+from snapshot_prefetcher import SnapshotPrefetcher
+
+
+class RecordedSnapshots:
+    """Snapshots of steps whose bytes are the step, records the reads started."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = []
+
+    def read(self, step):
+        with self.lock:
+            self.started.append(step)
+        return bytes(10)
+
+    def unpickle(self, data):
+        return None, len(data), None
+
+
+def reads_started_per_take(read_ahead, memory_budget=2 ** 20):
+    snapshots = RecordedSnapshots()
+    started = []
+    for step, population in SnapshotPrefetcher(snapshots, range(10), read_ahead, memory_budget):
+        assert population == 10
+        started.append(len(snapshots.started))
+    return started
+
+
+def test_at_most_read_ahead_snapshots_are_read_at_once():
+    # reads run in threads, when the i-th snapshot is taken at most read_ahead have been started past the ones taken
+    # before, the one taken included
+    for read_ahead in [1, 3]:
+        started = reads_started_per_take(read_ahead)
+        assert all(count <= taken + read_ahead for taken, count in enumerate(started))
+    assert reads_started_per_take(1) == list(range(1, 11))
+
+
+def test_snapshots_are_read_when_taken_without_read_ahead():
+    assert reads_started_per_take(0) == list(range(1, 11))
+
+
+def test_memory_budget_leaves_only_the_next_snapshot():
+    assert reads_started_per_take(3, memory_budget=0) == list(range(1, 11))
@@ -0,0 +1,58 @@
+import numpy
+import pytest
+
+from stats import EnsembleStats, bootstrap_confidence_intervals, confidence_interval, means, confidence_intervals
+
+
+@pytest.fixture
+def samples():
+    samples = numpy.random.default_rng(0).normal(50.0, 10.0, size=(40, 12))
+    samples[3, 5:] = numpy.nan
+    samples[4, 1:] = numpy.nan
+    samples[5] = numpy.nan
+    return samples
+
+
+def test_ensemble_stats_match_numpy(samples):
+    ensemble = EnsembleStats.of(samples)
+    numpy.testing.assert_allclose(ensemble.means()[:5], numpy.nanmean(samples[:5], axis=1))
+    numpy.testing.assert_allclose(ensemble.variances()[:4], numpy.nanvar(samples[:4], axis=1, ddof=1))
+    assert numpy.isnan(ensemble.means()[5]) and numpy.isnan(ensemble.variances()[4])
+
+    lower, upper = ensemble.confidence_intervals()
+    assert (lower[0], upper[0]) == pytest.approx(confidence_interval(samples[0]))
+    # a single sample collapses the interval to it, no sample leaves it undefined
+    assert lower[4] == upper[4] == samples[4, 0]
+    assert numpy.isnan(lower[5]) and numpy.isnan(upper[5])
+
+
+def test_runs_added_one_by_one_or_merged_match_all_at_once(samples):
+    expected = EnsembleStats.of(samples)
+    added = EnsembleStats(len(samples))
+    for run in samples.T:
+        added.add(run)
+    merged = EnsembleStats.of(samples[:, :7]).merge(EnsembleStats.of(samples[:, 7:]))
+    for ensemble in [added, merged]:
+        numpy.testing.assert_allclose(ensemble.count, expected.count)
+        numpy.testing.assert_allclose(ensemble.means(), expected.means())
+        numpy.testing.assert_allclose(ensemble.variances(), expected.variances())
+
+
+def test_samples_per_step_lists(samples):
+    series = [[value for value in row if not numpy.isnan(value)] for row in samples]
+    assert means(series) == pytest.approx(EnsembleStats.of(samples).means().tolist(), nan_ok=True)
+    lower, upper = confidence_intervals(series)
+    assert lower[:5] == pytest.approx(EnsembleStats.of(samples).confidence_intervals()[0][:5].tolist())
+
+
+def test_bootstrap_in_chunks_matches_a_single_pass(samples):
+    lower, upper = bootstrap_confidence_intervals(samples, seed=1, chunk=10 ** 9)
+    # one resampled step at a time and a few resamples at a time
+    for chunk in [1000 * 12, 50]:
+        chunk_lower, chunk_upper = bootstrap_confidence_intervals(samples, seed=1, chunk=chunk)
+        numpy.testing.assert_allclose(chunk_lower, lower)
+        numpy.testing.assert_allclose(chunk_upper, upper)
+    present = ~numpy.isnan(lower)
+    assert (present == ~numpy.isnan(samples).all(axis=1)).all()
+    step_means = numpy.nanmean(samples[present], axis=1)
+    assert (lower[present] <= step_means).all() and (step_means <= upper[present]).all()
@@ -0,0 +1,73 @@
+import numpy
+import pytest
+
+from conftest import run_script
+from metrics import METRICS_DTYPE, read_metrics
+from stopping import WindowCriterion, SlopeCriterion, VarianceCriterion, LexiconSizeCriterion, StoppingCriteria, \
+    new_stopping_criteria
+
+
+def records(metric, values):
+    records = numpy.zeros(len(values), dtype=METRICS_DTYPE)
+    records['step'] = numpy.arange(len(values))
+    records[metric] = values
+    return records
+
+
+def met_after(criteria, records):
+    """Step after which the criteria stop the run, None if they do not."""
+    for record in records:
+        if criteria.update(record) is not None:
+            return int(record['step'])
+    return None
+
+
+def test_window_criterion_is_abstract():
+    with pytest.raises(TypeError):
+        WindowCriterion('ds', 10, 0.1)
+
+
+def test_criteria_are_met_once_the_window_settles():
+    rising_then_flat = numpy.concatenate((numpy.arange(0, 100, 10.0), numpy.full(20, 100.0)))
+    assert met_after(StoppingCriteria([SlopeCriterion('ds', 5, 0.01)]), records('ds', rising_then_flat)) == 14
+    assert met_after(StoppingCriteria([VarianceCriterion('ds', 5, 0.01)]), records('ds', rising_then_flat)) == 14
+    assert met_after(StoppingCriteria([LexiconSizeCriterion(5, 0.5)]), records('lexicon', rising_then_flat)) == 14
+    assert met_after(StoppingCriteria([SlopeCriterion('ds', 5, 0.01)]), records('ds', numpy.arange(30.0))) is None
+
+
+def test_all_criteria_and_min_steps_are_required():
+    flat_ds = records('ds', numpy.full(30, 50.0))
+    assert met_after(StoppingCriteria([VarianceCriterion('ds', 5, 0.01)], min_steps=20), flat_ds) == 19
+    assert met_after(StoppingCriteria([VarianceCriterion('ds', 5, 0.01), VarianceCriterion('cs1', 5, 0.01),
+                                       LexiconSizeCriterion(5, 0.5)]), flat_ds) == 4
+    assert met_after(StoppingCriteria([]), flat_ds) is None
+
+
+def test_criteria_of_params():
+    criteria = new_stopping_criteria({'stop_slope': ['ds:200:0.01'], 'stop_variance': ['cs1:100:0.5'],
+                                      'stop_lexicon': '50:1', 'stop_min_steps': 300})
+    assert [criterion.describe() for criterion in criteria.criteria] == \
+        ['slope of ds over 200 steps <= 0.01', 'variance of cs1 over 100 steps <= 0.5',
+         'lexicon size range of lexicon over 50 steps <= 1.0']
+    assert criteria.min_steps == 300
+
+
+@pytest.mark.parametrize('params', [{'stop_slope': ['ds:200']}, {'stop_variance': ['ds:many:0.1']},
+                                    {'stop_lexicon': '50:1:2'}, {'stop_slope': ['speed:10:0.1']}])
+def test_malformed_specs_are_rejected(params):
+    with pytest.raises(ValueError):
+        new_stopping_criteria(params)
+
+
+def test_simulation_rejects_malformed_spec(tmp_path):
+    output = run_script('simulation.py', '-sn', tmp_path.joinpath('simulation'), '-ssl', 'ds:200', status=2)
+    assert 'malformed stopping criterion ds:200' in output
+    assert 'Traceback' not in output
+
+
+def test_simulation_stops_early(tmp_path, calculus_path):
+    simulation_path = tmp_path.joinpath('simulation')
+    run_script('simulation.py', '-sn', simulation_path, '-p', 4, '-s', 50, '-r', 1, '-mn', 20, '-sd', 1,
+               '-path', calculus_path, '-np', 1, '-ll', 'WARNING', '-sle', '3:1000', '-smin', 10)
+    assert simulation_path.joinpath('run0', 'stop.p').exists()
+    assert read_metrics(simulation_path.joinpath('run0', 'metrics.bin'))['step'].tolist() == list(range(10))
@@ -0,0 +1,39 @@
+import operator
+import threading
+
+from task_pool import TaskPool
+
+
+def test_results_are_handed_to_callbacks():
+    results = {}
+    pool = TaskPool(2, max_pending=2, name='squares')
+    for n in range(20):
+        pool.submit(pow, (n, 2), key=n, callback=lambda value, n=n: results.__setitem__(n, value))
+    assert pool.close() == []
+    assert results == dict((n, n * n) for n in range(20))
+    assert pool.done == pool.submitted == 20
+
+
+def test_failures_are_collected_and_do_not_block_submit():
+    def failing_callback(value):
+        raise ValueError('cannot take {}'.format(value))
+
+    pool = TaskPool(2, max_pending=2, name='failures')
+
+    def submit_all():
+        # more tasks than pending slots, every one of them fails in the worker or in its callback
+        for n in range(10):
+            if n % 2:
+                pool.submit(operator.truediv, (n, 0), key=('task', n))
+            else:
+                pool.submit(pow, (n, 2), key=('callback', n), callback=failing_callback)
+
+    submitter = threading.Thread(target=submit_all)
+    submitter.start()
+    submitter.join(timeout=60)
+    assert not submitter.is_alive()
+    failures = dict(pool.close())
+    assert sorted(failures) == sorted([('task', n) for n in range(1, 10, 2)] + [('callback', n) for n in range(0, 10, 2)])
+    assert 'ZeroDivisionError' in failures[('task', 1)]
+    assert 'cannot take 16' in failures[('callback', 4)]
+    assert pool.done == 10
@@ -0,0 +1,605 @@
+from __future__ import division  # force python 3 division in python 2
+
+from fractions import Fraction
+
+import numpy as np
+
+from agent import Population
+from event_log import GAME_EVENT_DTYPE
+from guessing_game_exceptions import Outcome, GAME_OUTCOMES
+from inmemory_calculus import inmem
+from language import Language
+from perception import Category
+from stimulus import QuotientBasedStimulusFactory, QuotientBasedStimulus, NumericBasedStimulus
+from success_window import SuccessWindow
+
+# associations weaker than that are forgotten, as in Language.forget_words
+WORD_FORGETTING = 0.01
+
+
+def grow(array, axis, size, fill=0):
+    """Returns the array padded along axis to at least size (doubling its capacity), or the array itself."""
+    if array.shape[axis] >= size:
+        return array
+    shape = list(array.shape)
+    shape[axis] = max(size, 2 * array.shape[axis])
+    grown = np.full(shape, fill, dtype=array.dtype)
+    grown[tuple(slice(0, s) for s in array.shape)] = array
+    return grown
+
+
+class ScoreWindows:
+    """Ring buffers of the last size results of every agent with running sums; like the classic success windows
+    (see success_window.py) a window starts with a single failure."""
+
+    def __init__(self, num_agents, size):
+        self.size = size
+        self.results = np.zeros((num_agents, size))
+        self.length = np.ones(num_agents, dtype=np.int64)
+        self.last = np.zeros(num_agents, dtype=np.int64)
+        self.sum = np.zeros(num_agents)
+
+    def store(self, agents, results):
+        full = self.length[agents] == self.size
+        last = np.where(full, (self.last[agents] + 1) % self.size, self.length[agents])
+        self.sum[agents] += results - np.where(full, self.results[agents, last], 0.0)
+        self.results[agents, last] = results
+        self.last[agents] = last
+        self.length[agents] = np.minimum(self.length[agents] + 1, self.size)
+
+    def switch_last(self, agents):
+        last = self.results[agents, self.last[agents]]
+        self.results[agents, self.last[agents]] = 1 - last
+        self.sum[agents] += 1 - 2 * last
+
+    def mean(self, agents):
+        return self.sum[agents] / self.length[agents]
+
+    def ordered(self, agents):
+        """Results of the windows of agents from the oldest one (padded past their lengths) and their lengths."""
+        length = self.length[agents]
+        first = (self.last[agents] + 1) % length
+        columns = (first[:, None] + np.arange(self.size)) % length[:, None]
+        return self.results[agents[:, None], columns].astype(np.int8), length.copy()
+
+    def load(self, agent, scores):
+        self.results[agent] = 0.0
+        self.results[agent, :len(scores)] = list(scores)
+        self.length[agent] = len(scores)
+        self.last[agent] = len(scores) - 1
+        self.sum[agent] = sum(scores)
+
+
+class ContextSampler:
+    """Draws contexts the way ContextFactory does, for many games at once, as arrays of stimulus indices."""
+
+    def __init__(self, stimulus_factory):
+        self.quotient = isinstance(stimulus_factory, QuotientBasedStimulusFactory)
+        if self.quotient:
+            self.pairs = stimulus_factory.stimulus_list
+            self.values = np.array([n / k for n, k in self.pairs], dtype=float)
+            index = dict((tuple(pair), i) for i, pair in enumerate(self.pairs))
+            self.max = stimulus_factory.max
+            # index of n/k, for k drawn from 1..max and n from 1..k
+            self.quotients = np.zeros((self.max + 1, self.max + 1), dtype=np.int64)
+            for k in range(1, self.max + 1):
+                for n in range(1, k + 1):
+                    f = Fraction(n, k)
+                    self.quotients[k, n] = index[(f.numerator, f.denominator)]
+        else:
+            self.candidates = np.array([s.index for s in stimulus_factory.get_all_stimuli()], dtype=np.int64)
+            self.values = np.arange(1, self.candidates.max() + 2, dtype=float)
+
+    def new_stimuli(self, rng, size):
+        if self.quotient:
+            k = rng.integers(1, self.max + 1, size)
+            return self.quotients[k, rng.integers(1, k + 1)]
+        return self.candidates[rng.integers(0, len(self.candidates), size)]
+
+    def sample(self, rng, size):
+        s1, s2 = self.new_stimuli(rng, size), self.new_stimuli(rng, size)
+        redraw = np.abs(self.values[s1] - self.values[s2]) <= 0.3 * self.values[s1]
+        while redraw.any():
+            s1[redraw], s2[redraw] = self.new_stimuli(rng, redraw.sum()), self.new_stimuli(rng, redraw.sum())
+            redraw = np.abs(self.values[s1] - self.values[s2]) <= 0.3 * self.values[s1]
+        return s1, s2
+
+    def stimulus(self, index):
+        if self.quotient:
+            n, k = self.pairs[index]
+            return QuotientBasedStimulus(int(index), Fraction(int(n), int(k)))
+        return NumericBasedStimulus(int(index) + 1)
+
+
+class StackedPopulation:
+    """Agents of one or more runs held in stacked arrays, all games of a round are resolved as batched array
+    operations. GuessingGame.play stays the reference, the outcome of a game follows it step by step.
+
+    Agent a of run r is row r * population_size + a of:
+      units, weights   - stimulus indices and weights of reactive units of categories (zero weight padded)
+      unit_count, category_count, category_ids, next_category_id
+      lxc              - word x category associations (zero padded)
+      lexicon          - ids of words (into words, -1 padded), word_count
+      max_shape        - AssociativeMatrix.max_shape
+    """
+
+    def __init__(self, params, sampler, num_runs=1):
+        self.params = params
+        self.sampler = sampler
+        self.num_runs = num_runs
+        self.population_size = params['population_size']
+        self.RxR = inmem['REACTIVE_X_REACTIVE']
+        self.delta_inc = params['delta_inc']
+        self.delta_dec = params['delta_dec']
+        self.delta_inh = params['delta_inh']
+        self.discriminative_threshold = params['discriminative_threshold']
+        self.alpha = params['alpha']
+        self.beta = params['beta']
+        self.super_alpha = params['super_alpha']
+        self.words = []
+        self.word_ids = {}
+        n = num_runs * self.population_size
+        self.units = np.zeros((n, 4, 4), dtype=np.int64)
+        self.weights = np.zeros((n, 4, 4))
+        self.unit_count = np.zeros((n, 4), dtype=np.int64)
+        self.category_count = np.zeros(n, dtype=np.int64)
+        self.category_ids = np.zeros((n, 4), dtype=np.int64)
+        self.next_category_id = np.zeros(n, dtype=np.int64)
+        self.lxc = np.zeros((n, 4, 4))
+        self.lexicon = np.full((n, 4), -1, dtype=np.int64)
+        self.word_count = np.zeros(n, dtype=np.int64)
+        self.max_shape = np.zeros((n, 2), dtype=np.int64)
+        self.ds = ScoreWindows(n, params['success_window'])
+        self.cs1 = ScoreWindows(n, params['success_window'])
+        self.cs2 = ScoreWindows(n, params['success_window'])
+        self.cs12 = ScoreWindows(n, params['success_window'])
+        # outcome counts of the last round of every run
+        self.outcome_counts = np.zeros((num_runs, len(GAME_OUTCOMES)), dtype=np.int64)
+        # with record_events play_round keeps the games of the last round of every run (see game_events)
+        self.record_events = False
+        self.round_events = {}
+
+    @staticmethod
+    def from_populations(populations, params, sampler):
+        stacked = StackedPopulation(params, sampler, len(populations))
+        for run, population in enumerate(populations):
+            for agent in population.agents:
+                stacked.load_agent(run * stacked.population_size + agent.id, agent)
+        return stacked
+
+    def load_agent(self, i, agent):
+        language = agent.language
+        self.ensure_categories(len(language.categories))
+        self.ensure_units(max([len(c.reactive_units()) for c in language.categories] + [1]))
+        self.ensure_words(len(language.lexicon))
+        for c, category in enumerate(language.categories):
+            units = category.reactive_units()
+            self.units[i, c, :len(units)] = [index for index, _ in units]
+            self.weights[i, c, :len(units)] = [weight for _, weight in units]
+            self.unit_count[i, c] = len(units)
+            self.category_ids[i, c] = category.id
+        self.category_count[i] = len(language.categories)
+        self.next_category_id[i] = language._id_
+        self.word_count[i] = len(language.lexicon)
+        self.lexicon[i, :self.word_count[i]] = self.new_word_ids(language.lexicon)
+        self.lxc[i, :self.word_count[i], :self.category_count[i]] = language.lxc.to_array().reshape(
+            self.word_count[i], self.category_count[i])
+        self.max_shape[i] = language.lxc.max_shape()
+        self.ds.load(i, language.ds_scores)
+        self.cs1.load(i, agent.cs1_scores)
+        self.cs2.load(i, agent.cs2_scores)
+        self.cs12.load(i, agent.cs12_scores)
+
+    def to_population(self, run):
+        population = Population(self.params)
+        population.agents = self.run_agents(run).to_agents()
+        population.track_success()
+        return population
+
+    def run_agents(self, run):
+        """Agents of the run as RunAgents, trimmed copies of their rows."""
+        agents = np.arange(run * self.population_size, (run + 1) * self.population_size)
+        categories = self.category_count[agents].max()
+        units = self.unit_count[agents, :categories].max(initial=0)
+        words = self.word_count[agents].max()
+        # ids of the words known to the run
+        lexicon = self.lexicon[agents, :words]
+        known, lexicon = np.unique(lexicon, return_inverse=True)
+        arrays = {
+            'units': self.units[agents, :categories, :units],
+            'weights': self.weights[agents, :categories, :units],
+            'unit_count': self.unit_count[agents, :categories],
+            'category_ids': self.category_ids[agents, :categories],
+            'category_count': self.category_count[agents],
+            'next_category_id': self.next_category_id[agents],
+            'lxc': self.lxc[agents, :words, :categories],
+            'lexicon': lexicon.reshape(len(agents), words),
+            'word_count': self.word_count[agents],
+            'max_shape': self.max_shape[agents],
+        }
+        for scores in ['ds', 'cs1', 'cs2', 'cs12']:
+            arrays[scores], arrays[scores + '_length'] = getattr(self, scores).ordered(agents)
+        return RunAgents(self.params, arrays, [self.words[word] if word >= 0 else None for word in known.tolist()])
+
+    def update_metrics(self, run, population):
+        agents = np.arange(run * self.population_size, (run + 1) * self.population_size)
+        population.ds = (self.ds.mean(agents) * 100.0).sum() / len(agents)
+        population.cs1 = (self.cs1.mean(agents) * 100.0).sum() / len(agents)
+        population.cs2 = (self.cs2.mean(agents) * 100.0).sum() / len(agents)
+        population.cs12 = (self.cs12.mean(agents) * 100.0).sum() / len(agents)
+        population.lexicon_size = self.word_count[agents].sum() / len(agents)
+        population.outcome_counts = self.outcome_counts[run].tolist()
+
+    def ensure_categories(self, size):
+        self.units = grow(self.units, 1, size)
+        self.weights = grow(self.weights, 1, size)
+        self.unit_count = grow(self.unit_count, 1, size)
+        self.category_ids = grow(self.category_ids, 1, size)
+        self.lxc = grow(self.lxc, 2, size)
+
+    def ensure_units(self, size):
+        self.units = grow(self.units, 2, size)
+        self.weights = grow(self.weights, 2, size)
+
+    def ensure_words(self, size):
+        self.lxc = grow(self.lxc, 1, size)
+        self.lexicon = grow(self.lexicon, 1, size, fill=-1)
+
+    def new_word_ids(self, words):
+        ids = []
+        for word in words:
+            if word not in self.word_ids:
+                self.word_ids[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.word_ids[word])
+        return np.array(ids, dtype=np.int64)
+
+    def new_words(self, letters):
+        components = Language.word_components
+        return self.new_word_ids([''.join(components[c][i] for c, i in enumerate(word_letters))
+                                  for word_letters in letters.tolist()])
+
+    def draw_round(self, rng):
+        """Draws everything random of a round of a run: games (speaker, hearer), contexts, topic tie breaks of
+        hearers and letters of words which speakers may introduce."""
+        games = self.population_size // 2
+        agents = rng.permutation(self.population_size)[:2 * games]
+        s1, s2 = self.sampler.sample(rng, games)
+        ties = rng.integers(0, 2, games)
+        letters = rng.integers(0, [len(letters) for letters in Language.word_components], (games, 3))
+        return agents[0::2], agents[1::2], s1, s2, ties, letters
+
+    def play_round(self, rngs, runs=None):
+        """Plays a round of the given runs (all by default), rngs are their random generators."""
+        if runs is None:
+            runs = range(self.num_runs)
+        rounds = [self.draw_round(rng) for rng in rngs]
+        offsets = [run * self.population_size for run in runs]
+        outcomes, events = self.play_games(np.concatenate([r[0] + offset for r, offset in zip(rounds, offsets)]),
+                                           np.concatenate([r[1] + offset for r, offset in zip(rounds, offsets)]),
+                                           *[np.concatenate([r[k] for r in rounds]) for k in range(2, 6)])
+        for run, run_outcomes in zip(runs, outcomes.reshape(len(rounds), -1)):
+            self.outcome_counts[run] = np.bincount(run_outcomes - 1, minlength=len(GAME_OUTCOMES))
+        if events is not None:
+            self.round_events = dict(zip(runs, events.reshape(len(rounds), -1)))
+
+    def game_events(self, run):
+        """Games of the last round of the run as (GAME_EVENT_DTYPE records, words), see GameEventLog.record_games."""
+        events = self.round_events[run].copy()
+        events['speaker'] -= run * self.population_size
+        events['hearer'] -= run * self.population_size
+        return events, [self.words[word] if word >= 0 else None for word in events['word'].tolist()]
+
+    def play_games(self, speakers, hearers, s1, s2, ties, letters):
+        """Plays games of distinct agents (see GuessingGame.play), the topic is s1. Returns (outcome codes of the
+        games, their GAME_EVENT_DTYPE records with ids into words or None unless record_events)."""
+        games = len(speakers)
+        success1 = np.zeros(games, dtype=bool)
+        success2 = np.zeros(games, dtype=bool)
+        stage7 = np.zeros(games, dtype=bool)
+        events = None
+
+        outcomes, speaker_category = self.discrimination_game(speakers, s1, s2)
+        if self.record_events:
+            events = np.zeros(games, dtype=GAME_EVENT_DTYPE)
+            events['game'] = np.arange(games) % (self.population_size // 2)
+            events['speaker'], events['hearer'], events['stimulus1'], events['stimulus2'] = speakers, hearers, s1, s2
+            events['word'], events['hearer_category'] = -1, -1
+            events['speaker_category'] = np.where(outcomes == Outcome.OK, self.category_ids[speakers, speaker_category], -1)
+
+        # speaker names its category, or introduces a new word for it
+        said = np.flatnonzero(outcomes == Outcome.OK)
+        X, category = speakers[said], speaker_category[said]
+        column = self.lxc[X, :, category]
+        words = np.arange(self.lxc.shape[1]) < self.word_count[X][:, None]
+        has_word = (words & (column != 0)).any(axis=1)
+        speaker_row = np.where(words, column, -np.inf).argmax(axis=1)
+        if not has_word.all():
+            outcomes[said[~has_word]] = Outcome.NO_WORD_FOR_CATEGORY
+            new_words = self.new_words(letters[said[~has_word]])
+            rows = self.add_words(X[~has_word], new_words)
+            self.lxc[X[~has_word], rows, category[~has_word]] = 0.5
+            if events is not None:
+                events['word'][said[~has_word]] = new_words
+        said, speaker_row = said[has_word], speaker_row[has_word]
+        speaker_word = self.lexicon[speakers[said], speaker_row]
+        if events is not None:
+            events['word'][said] = speaker_word
+
+        # hearer looks the word up, learns unknown or unassociated words
+        Y = hearers[said]
+        match = self.lexicon[Y] == speaker_word[:, None]
+        known = match.any(axis=1)
+        hearer_row = match.argmax(axis=1)
+        if not known.all():
+            unknown = ~known
+            outcomes[said[unknown]] = Outcome.NO_SUCH_WORD
+            rows = self.add_words(Y[unknown], speaker_word[unknown])
+            self.discriminate_and_associate(Y[unknown], rows, s1[said[unknown]], s2[said[unknown]])
+        said, Y, speaker_row, speaker_word, hearer_row = \
+            said[known], Y[known], speaker_row[known], speaker_word[known], hearer_row[known]
+        associations = self.lxc[Y, hearer_row]
+        associations = np.where(np.arange(self.lxc.shape[2]) < self.category_count[Y][:, None], associations, -np.inf)
+        hearer_category = associations.argmax(axis=1)
+        associated = (self.category_count[Y] > 0) & (associations.max(axis=1) != 0)
+        if not associated.all():
+            unassociated = ~associated
+            outcomes[said[unassociated]] = Outcome.NO_ASSOCIATED_CATEGORIES
+            self.discriminate_and_associate(Y[unassociated], hearer_row[unassociated],
+                                            s1[said[unassociated]], s2[said[unassociated]])
+        completed = said[associated]
+        speaker_row, speaker_word = speaker_row[associated], speaker_word[associated]
+        hearer_row, hearer_category = hearer_row[associated], hearer_category[associated]
+
+        # hearer points at the stimulus its category responds to most
+        S, H = speakers[completed], hearers[completed]
+        if events is not None:
+            events['hearer_category'][completed] = self.category_ids[H, hearer_category]
+        r1 = self.category_responses(H, hearer_category, s1[completed])
+        r2 = self.category_responses(H, hearer_category, s2[completed])
+        success1[completed] = np.where(r1 == r2, ties[completed] == 0, r1 > r2)
+        outcomes[completed] = np.where(success1[completed], Outcome.SUCCESS, Outcome.FAILURE)
+
+        won = success1[completed]
+        self.update_on_success(S[won], speaker_row[won], speaker_category[completed][won],
+                               H[won], hearer_row[won], hearer_category[won])
+        lost = ~won
+        self.lxc[H[lost], hearer_row[lost], hearer_category[lost]] -= \
+            self.delta_dec * self.lxc[H[lost], hearer_row[lost], hearer_category[lost]]
+        self.lxc[S[lost], speaker_row[lost], speaker_category[completed][lost]] -= \
+            self.delta_dec * self.lxc[S[lost], speaker_row[lost], speaker_category[completed][lost]]
+
+        if self.params['guessing_game_2'] and lost.any():
+            failed = completed[lost]
+            stage7[failed] = True
+            success2[failed] = self.stage7(failed, speakers, hearers, s1, s2, speaker_row[lost],
+                                           speaker_category[failed], speaker_word[lost])
+
+        both = np.concatenate((speakers, hearers))
+        self.cs1.store(both, np.tile(success1, 2))
+        self.cs2.store(np.concatenate((speakers[stage7], hearers[stage7])), np.tile(success2[stage7], 2))
+        self.cs12.store(both, np.tile(success1 | success2, 2))
+        self.forget_words(both)
+        if events is not None:
+            events['outcome'] = outcomes
+            events['success2'] = np.where(stage7, success2, -1)
+        return outcomes, events
+
+    def stage7(self, games, speakers, hearers, s1, s2, speaker_row, speaker_category, speaker_word):
+        """Agent.select_word after a failed guess, returns whether the hearer came up with the speaker's word."""
+        outcomes, hearer_category = self.discrimination_game(hearers[games], s1[games], s2[games])
+        discriminated = outcomes == Outcome.OK
+        success2 = np.zeros(len(games), dtype=bool)
+        if not discriminated.any():
+            return success2
+        Z, category = hearers[games[discriminated]], hearer_category[discriminated]
+        words = np.arange(self.lxc.shape[1]) < self.word_count[Z][:, None]
+        column = np.where(words, self.lxc[Z, :, category], -np.inf)
+        word0 = column.argmax(axis=1)
+        column[np.arange(len(Z)), word0] = -np.inf
+        word1 = column.argmax(axis=1)
+        categories = np.arange(self.lxc.shape[2]) < self.category_count[Z][:, None]
+        categories0 = categories & (self.lxc[Z, word0] > 0)
+        categories1 = categories & (self.lxc[Z, word1] > 0)
+        first = (self.word_count[Z] == 1) | (categories0.sum(axis=1) > categories1.sum(axis=1))
+        word = np.where(first, word0, word1)
+        success2[discriminated] = (self.word_count[Z] > 0) & (self.lexicon[Z, word] == speaker_word[discriminated])
+
+        X, row, category = speakers[games[success2]], speaker_row[success2], speaker_category[success2]
+        self.lxc[X, row, category] += self.delta_inc * self.lxc[X, row, category]
+        won = success2[discriminated]
+        Z, word, categories = Z[won], word[won], np.where(first[won, None], categories0[won], categories1[won])
+        self.lxc[Z, word] += np.where(categories, self.delta_inc * self.lxc[Z, word], 0.0)
+        return success2
+
+    def update_on_success(self, S, speaker_row, speaker_category, H, hearer_row, hearer_category):
+        # speaker strengthens the word-category connection and inhibits the word with its other categories
+        row = self.lxc[S, speaker_row]
+        categories = np.arange(self.lxc.shape[2])
+        used = categories == speaker_category[:, None]
+        inhibited = ~used & (categories < self.category_count[S][:, None])
+        self.lxc[S, speaker_row] = row + np.where(used, self.delta_inc * row, 0.0) \
+            - np.where(inhibited, self.delta_inh * row, 0.0)
+        # hearer strengthens it and inhibits its category with the other words
+        column = self.lxc[H, :, hearer_category]
+        words = np.arange(self.lxc.shape[1])
+        used = words == hearer_row[:, None]
+        inhibited = ~used & (words < self.word_count[H][:, None])
+        self.lxc[H, :, hearer_category] = column + np.where(used, self.delta_inc * column, 0.0) \
+            - np.where(inhibited, self.delta_inh * column, 0.0)
+
+    def responses(self, agents, stimuli):
+        """Responses of all categories of agents to their stimuli, -inf for missing categories."""
+        responses = (self.weights[agents] * self.RxR[self.units[agents], stimuli[:, None, None]]).sum(axis=2)
+        return np.where(np.arange(self.units.shape[1]) < self.category_count[agents][:, None], responses, -np.inf)
+
+    def category_responses(self, agents, categories, stimuli):
+        return (self.weights[agents, categories] * self.RxR[self.units[agents, categories], stimuli[:, None]]).sum(axis=1)
+
+    def discrimination_game(self, agents, s1, s2):
+        """Language.discrimination_game for the topic s1 followed by Agent.learn_stimulus if it fails.
+        Returns (outcome codes, indices of the winning categories)."""
+        self.ds.store(agents, 0.0)
+        best1 = self.responses(agents, s1).argmax(axis=1)
+        best2 = self.responses(agents, s2).argmax(axis=1)
+        outcomes = np.where(self.category_count[agents] == 0, Outcome.NO_CATEGORY,
+                            np.where(best1 == best2, Outcome.NO_DISCRIMINATION, Outcome.OK))
+        discriminated = outcomes == Outcome.OK
+        category = best1.copy()
+        if discriminated.any():
+            category[discriminated] = self.reinforce_and_forget(agents[discriminated], best1[discriminated],
+                                                                s1[discriminated])
+            self.ds.switch_last(agents[discriminated])
+        if not discriminated.all():
+            failed = ~discriminated
+            self.learn_stimulus(agents[failed], s1[failed], best1[failed])
+        return outcomes, category
+
+    def discriminate_and_associate(self, agents, rows, s1, s2):
+        # OutcomeHandler.on_NO_SUCH_WORD and on_NO_ASSOCIATED_CATEGORIES
+        outcomes, category = self.discrimination_game(agents, s1, s2)
+        discriminated = outcomes == Outcome.OK
+        self.lxc[agents[discriminated], rows[discriminated], category[discriminated]] = 0.5
+
+    def reinforce_and_forget(self, agents, winners, topics):
+        """Reinforces the winning categories, then decays all categories and forgets the weak ones.
+        Returns indices of the winning categories after forgetting."""
+        units = np.arange(self.units.shape[2])
+        gain = self.beta * self.RxR[self.units[agents, winners], topics[:, None]]
+        self.weights[agents, winners] += np.where(units < self.unit_count[agents, winners][:, None], gain, 0.0)
+        weights = self.weights[agents]
+        weights -= self.alpha * weights
+        self.weights[agents] = weights
+        max_weight = np.where(units < self.unit_count[agents][:, :, None], weights, -np.inf).max(axis=2)
+        categories = np.arange(self.units.shape[1])
+        forgotten = (max_weight < self.super_alpha) & (categories < self.category_count[agents][:, None]) & \
+                    (categories != winners[:, None])
+        if forgotten.any():
+            self.remove_categories(agents, forgotten)
+            winners = winners - (forgotten & (categories < winners[:, None])).sum(axis=1)
+        return winners
+
+    def remove_categories(self, agents, forgotten):
+        order = np.argsort(forgotten, axis=1, kind='stable')
+        rows = np.arange(len(agents))[:, None]
+        count = self.category_count[agents] - forgotten.sum(axis=1)
+        kept = np.arange(forgotten.shape[1]) < count[:, None]
+        self.units[agents] = np.where(kept[:, :, None], self.units[agents][rows, order], 0)
+        self.weights[agents] = np.where(kept[:, :, None], self.weights[agents][rows, order], 0.0)
+        self.unit_count[agents] = np.where(kept, self.unit_count[agents][rows, order], 0)
+        self.category_ids[agents] = np.where(kept, self.category_ids[agents][rows, order], 0)
+        self.lxc[agents] = np.where(kept[:, None, :], np.take_along_axis(self.lxc[agents], order[:, None, :], axis=2), 0.0)
+        self.category_count[agents] = count
+
+    def learn_stimulus(self, agents, topics, best):
+        """Agent.learn_stimulus: extends the best matching category by a unit on the topic or adds a new category."""
+        update = (self.ds.mean(agents) >= self.discriminative_threshold) & (self.category_count[agents] > 0)
+        if update.any():
+            X, category = agents[update], best[update]
+            unit = self.unit_count[X, category]
+            self.ensure_units(unit.max() + 1)
+            self.units[X, category, unit] = topics[update]
+            self.weights[X, category, unit] = 0.5
+            self.unit_count[X, category] += 1
+        if not update.all():
+            X = agents[~update]
+            category = self.category_count[X]
+            self.ensure_categories(category.max() + 1)
+            self.units[X, category, 0] = topics[~update]
+            self.weights[X, category, 0] = 0.5
+            self.unit_count[X, category] = 1
+            self.category_ids[X, category] = self.next_category_id[X]
+            self.next_category_id[X] += 1
+            self.category_count[X] += 1
+            self.max_shape[X, 1] = np.maximum(self.max_shape[X, 1], self.category_count[X])
+
+    def add_words(self, agents, word_ids):
+        rows = self.word_count[agents]
+        self.ensure_words(rows.max() + 1)
+        self.lexicon[agents, rows] = word_ids
+        self.word_count[agents] += 1
+        self.max_shape[agents, 0] = np.maximum(self.max_shape[agents, 0], self.word_count[agents])
+        return rows
+
+    def forget_words(self, agents):
+        categories = np.arange(self.lxc.shape[2]) < self.category_count[agents][:, None]
+        strength = np.where(categories[:, None, :], self.lxc[agents], -np.inf).max(axis=2)
+        forgotten = (strength < WORD_FORGETTING) & (np.arange(self.lxc.shape[1]) < self.word_count[agents][:, None])
+        if not forgotten.any():
+            return
+        agents, forgotten = agents[forgotten.any(axis=1)], forgotten[forgotten.any(axis=1)]
+        order = np.argsort(forgotten, axis=1, kind='stable')
+        rows = np.arange(len(agents))[:, None]
+        count = self.word_count[agents] - forgotten.sum(axis=1)
+        kept = np.arange(forgotten.shape[1]) < count[:, None]
+        self.lexicon[agents] = np.where(kept, self.lexicon[agents][rows, order], -1)
+        self.lxc[agents] = np.where(kept[:, :, None], self.lxc[agents][rows, order], 0.0)
+        self.word_count[agents] = count
+
+
+class RunAgents:
+    """Agents of a run of a StackedPopulation as arrays (see StackedPopulation.run_agents). They pickle as the arrays
+    and unpickle as the list of agents, so snapshots of the vectorized engine build no agents while the run goes on."""
+
+    def __init__(self, params, arrays, words):
+        self.params = params
+        self.arrays = arrays
+        self.words = words
+
+    def __reduce__(self):
+        return new_agents, (self.params, self.arrays, self.words)
+
+    def to_agents(self):
+        return new_agents(self.params, self.arrays, self.words)
+
+
+def new_agents(params, arrays, words):
+    """List of agents of the arrays of RunAgents."""
+    agents = Population(params).agents
+    size = params['success_window']
+    units, weights, unit_count, category_ids = [arrays[name].tolist() for name in
+                                                ['units', 'weights', 'unit_count', 'category_ids']]
+    lexicon, word_count, category_count = arrays['lexicon'].tolist(), arrays['word_count'], arrays['category_count']
+    windows = dict((scores, [results[:length] for results, length in
+                             zip(arrays[scores].tolist(), arrays[scores + '_length'].tolist())])
+                   for scores in ['ds', 'cs1', 'cs2', 'cs12'])
+    for i, agent in enumerate(agents):
+        language = agent.language
+        language.categories = [Category.of_reactive_units(category_ids[i][c], units[i][c][:unit_count[i][c]],
+                                                          weights[i][c][:unit_count[i][c]])
+                               for c in range(category_count[i])]
+        language._id_ = int(arrays['next_category_id'][i])
+        language.ds_scores = SuccessWindow(size, windows['ds'][i])
+        language.lexicon = [words[w] for w in lexicon[i][:word_count[i]]]
+        language.lxc.__matrix__ = arrays['lxc'][i, :word_count[i], :category_count[i]].copy()
+        language.lxc.__max_shape__ = tuple(arrays['max_shape'][i].tolist())
+        agent.cs1_scores = SuccessWindow(size, windows['cs1'][i])
+        agent.cs2_scores = SuccessWindow(size, windows['cs2'][i])
+        agent.cs12_scores = SuccessWindow(size, windows['cs12'][i])
+    return agents
+
+
+class VectorizedRoundExecutor:
+    """Plays rounds of a run on its population in stacked form (see StackedPopulation), a drop-in replacement of
+    the classic round loop of Simulation. Every round draws from a generator seeded with (run seed, step), so a
+    resumed run continues the same way."""
+
+    def __init__(self, population, params, context_constructor, run_seed, event_log=None):
+        self.population = population
+        self.run_seed = run_seed
+        self.event_log = event_log
+        self.stacked = StackedPopulation.from_populations([population], params,
+                                                          ContextSampler(context_constructor.new_stimulus))
+        self.stacked.record_events = event_log is not None
+
+    def play_round(self, step):
+        self.stacked.play_round([np.random.default_rng([self.run_seed, step])])
+        self.stacked.update_metrics(0, self.population)
+        if self.event_log is not None:
+            self.event_log.record_games(step, *self.stacked.game_events(0))
+
+    def gather(self):
+        self.population.agents = self.stacked.run_agents(0)
+
+    def close(self):
+        pass